@@ -409,10 +409,11 @@ class NuvlaBox(Connector):
         exit_code = 0
         result = ''
         try:
-            with timeout(timeout_after):
+            with timeout(timeout_after) as deadline:
                 tries = 0
                 logging.info(f'Waiting {timeout_after} sec for NuvlaEdge operation to finish...')
                 while True:
+                    deadline.check()
                     if tries > 3:
                         raise Exception(f'Lost connection with the NuvlaEdge Docker API at {self.docker_api_endpoint}')
                     try:
@@ -7,6 +7,7 @@ import os
 import re
 import signal
 import threading
+import time
 
 from typing import List
 
@@ -150,25 +151,18 @@ def interpolate_and_store_files(env: dict, files: List[dict], dir_path='.') -> L
 def run_in_tmp_dir(func):
     """Decorator to run a function with the temporary directory provided as a
     keyword argument 'work_dir'. The temporary directory is deleted after the
-    function is executed. The current working directory is changed to the
-    temporary directory before the function is executed and changed back after.
+    function is executed. The working directory of the process is left
+    unchanged, as jobs run concurrently in threads: the function has to use
+    paths in 'work_dir' explicitly.
     """
     def wrapper(*args, **kwargs):
-        try:
-            curr_dir = os.getcwd()
-        except FileNotFoundError:
-            curr_dir = None
         with TemporaryDirectory() as dir_name:
-            os.chdir(dir_name)
             kwargs.update({'work_dir': dir_name})
             try:
-                res = func(*args, **kwargs)
+                return func(*args, **kwargs)
             except Exception as ex:
                 log.exception('Error running in temp dir')
-                os.chdir(curr_dir or '/')
                 raise ex
-            os.chdir(curr_dir or '/')
-            return res
     return wrapper
 
 
@@ -189,11 +183,30 @@ def generate_registry_config(registries_auth: list) -> str:
     return json.dumps({'auths': auths})
 
 
+class Deadline(object):
+    """Time limit checked by the code it bounds, which works in any thread."""
+
+    def __init__(self, seconds):
+        self.at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.at - time.monotonic())
+
+    def check(self):
+        if time.monotonic() >= self.at:
+            raise TimeoutError
+
+
 @contextmanager
 def timeout(deadline):
+    """
+    Yields a Deadline of `deadline` seconds, to be checked by the code in the
+    context. In the main thread, a SIGALRM also interrupts the code in the
+    context when the deadline is reached. Signals can't be used in the other
+    threads, where jobs are run by the executor.
+    """
     if threading.current_thread() is not threading.main_thread():
-        log.warning("timeout context manager doesn't work in a thread. It will be ignored", stack_info=True)
-        yield
+        yield Deadline(deadline)
         return
 
     # Register a function to raise a TimeoutError on the signal.
@@ -201,12 +214,13 @@ def timeout(deadline):
     # Schedule the signal to be sent after ``time``.
     signal.alarm(deadline)
     try:
-        yield
+        yield Deadline(deadline)
     except TimeoutError:
         raise
     finally:
         # Unregister the signal so it won't be triggered
         # if the timeout is not reached.
+        signal.alarm(0)
         signal.signal(signal.SIGALRM, signal.SIG_IGN)
 
 
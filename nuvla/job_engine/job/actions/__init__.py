@@ -6,6 +6,8 @@ import os
 
 from os.path import dirname, basename, isfile
 
+from ..job import PRIORITY_NORMAL
+
 """
 This package contains code to be executed to process jobs.
 
@@ -20,23 +22,55 @@ Examples:
 
 modules = glob.glob(dirname(__file__) + "/*.py")
 
+# Lanes let executors subscribe to a subset of actions (e.g. --lanes fast),
+# so that short monitoring jobs are not queued behind long running ones.
+LANE_FAST = 'fast'
+LANE_SLOW = 'slow'
+DEFAULT_LANE = LANE_SLOW
+
 
 class Actions(object):
 
     actions = {}
+    lanes = {}
+    priorities = {}
+    context_actions = set()
 
     @classmethod
     def get_action(cls, action_name):
         return cls.actions.get(action_name)
 
     @classmethod
-    def register_action(cls, action_name, action):
+    def get_action_lane(cls, action_name):
+        return cls.lanes.get(action_name, DEFAULT_LANE)
+
+    @classmethod
+    def get_action_priority(cls, action_name):
+        """
+        Priority of the jobs of the action that have none: used when they are
+        dispatched to lanes, and given by the job_queue_aging distribution to
+        the entries queued by the server.
+        """
+        return cls.priorities.get(action_name, PRIORITY_NORMAL)
+
+    @classmethod
+    def action_uses_context(cls, action_name):
+        return action_name in cls.context_actions
+
+    @classmethod
+    def register_action(cls, action_name, action, lane=DEFAULT_LANE, uses_context=False,
+                        priority=PRIORITY_NORMAL):
         # logging.getLogger().setLevel(logging.INFO)
-        logging.info('Action "{}" registered'.format(action_name))
+        logging.info('Action "{}" registered in lane "{}"'.format(action_name, lane))
         cls.actions[action_name] = action
+        cls.lanes[action_name] = lane
+        cls.priorities[action_name] = priority
+        if uses_context:
+            cls.context_actions.add(action_name)
 
     @classmethod
-    def action(cls, action_name=None, pull_mode_support=False):
+    def action(cls, action_name=None, pull_mode_support=False, lane=DEFAULT_LANE,
+               uses_context=False, priority=PRIORITY_NORMAL):
 
         def decorator(f):
             _action_name = action_name
@@ -48,9 +82,9 @@ class Actions(object):
             else:
                 if os.getenv('IMAGE_NAME', '') == 'job-lite':
                     if pull_mode_support:
-                        cls.register_action(_action_name, f)
+                        cls.register_action(_action_name, f, lane, uses_context, priority)
                 else:
-                    cls.register_action(_action_name, f)
+                    cls.register_action(_action_name, f, lane, uses_context, priority)
 
             return f
 
@@ -63,6 +97,9 @@ class ActionNotImplemented(Exception):
 
 action = Actions.action
 get_action = Actions.get_action
+get_action_lane = Actions.get_action_lane
+get_action_priority = Actions.get_action_priority
+action_uses_context = Actions.action_uses_context
 register_action = Actions.register_action
 
 for f in modules:
@@ -4,6 +4,7 @@ import logging
 from nuvla.api.util.filter import filter_and
 from ..actions import action
 from .utils.bulk_action import BulkAction
+from ..pagination import search_all
 from .utils.bulk_deployment_set_apply import EdgeResolver, get_dg_api, get_dg_owner_api
 
 action_name = 'bulk_deployment_set_stop'
@@ -19,12 +20,17 @@ class BulkDeploymentSetStopJob(BulkAction):
         self.dep_set = self.dg_api.get(self.dep_set_id)
         self.edge_resolver = EdgeResolver(self.dg_owner_api, self.dep_set.data.get('subtype'))
 
-    def get_todo(self):
+    def _filter_todo(self):
         filter_deployment_set = f'deployment-set="{self.dep_set_id}"'
         filter_state = f'state={["PENDING", "STARTING", "UPDATING", "STARTED", "ERROR"]}'
-        filter_str = filter_and([filter_deployment_set, filter_state])
-        deployments = self.dg_api.search('deployment', filter=filter_str, select='id').resources
-        return [deployment.id for deployment in deployments]
+        return filter_and([filter_deployment_set, filter_state])
+
+    def get_todo(self):
+        return (deployment.id for deployment in
+                search_all(self.dg_api, 'deployment', filter=self._filter_todo(), select='id'))
+
+    def count_todo(self):
+        return self.dg_api.search('deployment', filter=self._filter_todo(), last=0).count
 
     def _stop_deployment(self, deployment_id):
         deployment = self.dg_api.get(deployment_id)
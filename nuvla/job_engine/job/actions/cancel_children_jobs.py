@@ -1,14 +1,14 @@
 # -*- coding: utf-8 -*-
 
 from ..job import JOB_RUNNING, JOB_QUEUED
-from ..actions import action
+from ..actions import action, LANE_FAST
 from nuvla.api.api import Api as Nuvla
 from nuvla.api.util.filter import filter_and
 
 import logging
 
 
-@action('cancel_children_jobs')
+@action('cancel_children_jobs', lane=LANE_FAST)
 class CancelChildrenJobsJob(object):
 
     def __init__(self, job):
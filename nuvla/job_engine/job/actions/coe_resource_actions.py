@@ -10,7 +10,7 @@ action_name = "coe_resource_actions"
 log = logging.getLogger(action_name)
 
 
-@action(action_name, True)
+@action(action_name, True, uses_context=True)
 class COEResourceActionsJob:
     def __init__(self, job):
         self.job: Job = job
@@ -4,6 +4,7 @@ import logging
 from datetime import datetime
 from nuvla.api.resources import Deployment
 from ..actions import action
+from ..job import PRIORITY_HIGH
 from .utils.deployment_utils import (get_connector_module,
                                      get_connector_name,
                                      initialize_connector,
@@ -14,7 +15,7 @@ from .utils.resource_log_fetch import ResourceLogFetchJob
 action_name = 'fetch_deployment_log'
 
 
-@action(action_name, True)
+@action(action_name, True, uses_context=True, priority=PRIORITY_HIGH)
 class DeploymentLogFetchJob(ResourceLogFetchJob):
 
     def __init__(self, job):
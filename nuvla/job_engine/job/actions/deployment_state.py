@@ -9,14 +9,15 @@ from .utils.deployment_utils import (initialize_connector,
                                      get_connector_module,
                                      CONNECTOR_KIND_HELM,
                                      get_env)
-from ..actions import action
+from ..actions import action, LANE_FAST
+from ..job import PRIORITY_LOW
 
 action_name = 'deployment_state'
 
 log = logging.getLogger(action_name)
 
 
-@action(action_name, True)
+@action(action_name, True, lane=LANE_FAST, uses_context=True)
 class DeploymentStateJob(DeploymentBase):
 
     def __init__(self, job):
@@ -65,11 +66,12 @@ class DeploymentStateJob(DeploymentBase):
         return 0
 
 
-@action(action_name + '_10', True)
+@action(action_name + '_10', True, lane=LANE_FAST, uses_context=True)
 class DeploymentStateJob10(DeploymentStateJob):
     pass
 
 
-@action(action_name + '_60', True)
+@action(action_name + '_60', True, lane=LANE_FAST, uses_context=True,
+        priority=PRIORITY_LOW)
 class DeploymentStateJob60(DeploymentStateJob):
     pass
@@ -9,11 +9,12 @@ from .utils.deployment_utils import (DeploymentBase,
                                      get_env)
 from ..util import override
 from ..actions import action
+from ..job import PRIORITY_HIGH
 
 action_name = 'stop_deployment'
 
 
-@action(action_name, True)
+@action(action_name, True, uses_context=True, priority=PRIORITY_HIGH)
 class DeploymentStopJob(DeploymentBase):
 
     def __init__(self, job):
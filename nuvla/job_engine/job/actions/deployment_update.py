@@ -2,12 +2,13 @@
 import logging
 
 from ..actions import action
+from ..job import PRIORITY_HIGH
 from .utils.deployment_utils import DeploymentBaseStartUpdate
 
 action_name = 'update_deployment'
 
 
-@action(action_name, True)
+@action(action_name, True, uses_context=True, priority=PRIORITY_HIGH)
 class DeploymentUpdateJob(DeploymentBaseStartUpdate):
 
     def __init__(self, job):
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from ..actions import action
+from ..actions import action, LANE_FAST
 from ..job import JOB_QUEUED, JOB_RUNNING, JOB_SUCCESS, JOB_FAILED, JOB_CANCELED
-from ..actions.utils.bulk_action import BulkActionResult
+from ..actions.utils.bulk_action import (BulkActionResult, JOB_FAILED_REASON,
+                                         JOB_CANCELED_REASON)
+from ..pagination import search_all
 from nuvla.api.util.filter import filter_and
 
 action_name = 'monitor_bulk_job'
@@ -11,10 +13,10 @@ action_name = 'monitor_bulk_job'
 log = logging.getLogger(action_name)
 
 
-@action(action_name)
+@action(action_name, lane=LANE_FAST)
 class MonitorBulkJob(object):
-    job_failed_reason = 'Job failed'
-    job_canceled_reason = 'Job canceled'
+    job_failed_reason = JOB_FAILED_REASON
+    job_canceled_reason = JOB_CANCELED_REASON
 
     def __init__(self, job):
         self.job = job
@@ -40,8 +42,8 @@ class MonitorBulkJob(object):
 
     def _query_jobs(self):
         filter_parent = f'parent-job="{self.bulk_job_id}"'
-        return self.api.search('job', filter=filter_parent, last=10000,
-                               select='id, target-resource, state').resources
+        return list(search_all(self.api, 'job', filter=filter_parent,
+                               select='id, target-resource, state'))
 
     @staticmethod
     def _group_child_job_by_state(child_jobs):
@@ -66,17 +68,18 @@ class MonitorBulkJob(object):
     def update_result(self):
         self.result.set_queued_actions([j.id for j in self.jobs_by_state.get(JOB_QUEUED, [])])
         self.result.set_running_actions([j.id for j in self.jobs_by_state.get(JOB_RUNNING, [])])
+        failure_reasons = {JOB_FAILED: self.job_failed_reason,
+                           JOB_CANCELED: self.job_canceled_reason}
+        success = []
+        failures = {}
         for job in self.jobs_done:
             resource_id = job.data['target-resource']['href']
             state = job.data['state']
-            if state == JOB_SUCCESS and not self.result.exist_in_success(resource_id):
-                self.result.add_success_action(resource_id)
-            if state == JOB_FAILED and not self.result.exist_in_fail_reason_ids(
-                    self.job_failed_reason, resource_id):
-                self.result.fail_action(self.job_failed_reason, resource_id)
-            if state == JOB_CANCELED and not self.result.exist_in_fail_reason_ids(
-                    self.job_canceled_reason, resource_id):
-                self.result.fail_action(self.job_canceled_reason, resource_id)
+            if state == JOB_SUCCESS:
+                success.append(resource_id)
+            else:
+                failures.setdefault(failure_reasons[state], []).append(resource_id)
+        self.result.set_jobs_outcome(success, failures)
 
     def build_update_job_body(self):
         update_job_body = {'progress': self.progress,
@@ -5,11 +5,12 @@ import json
 import re
 
 from ..actions import action
+from ..job import PRIORITY_HIGH
 from ...connector import nuvlaedge_docker as NB
 from ...connector.nuvlaedge_k8s import NuvlaEdgeMgmtK8sSSHKey
 
 
-@action('nuvlabox_add_ssh_key', True)
+@action('nuvlabox_add_ssh_key', True, uses_context=True, priority=PRIORITY_HIGH)
 class NBAddSSHKey(object):
     """
     Class to add SSH key to nuvlabox
@@ -6,12 +6,13 @@ import logging
 from ...connector import nuvlaedge_docker as nb
 from ...connector import nuvlaedge_k8s as k8s
 from ..actions import action
+from ..job import PRIORITY_HIGH
 from .utils.resource_log_fetch import ResourceLogFetchJob
 
 action_name = 'fetch_nuvlabox_log'
 
 
-@action(action_name, True)
+@action(action_name, True, priority=PRIORITY_HIGH)
 class NuvlaBoxLogFetchJob(ResourceLogFetchJob):
 
     def __init__(self, job):
@@ -3,12 +3,13 @@ import os
 import logging
 
 from ..actions import action
+from ..job import PRIORITY_HIGH
 from ...connector.nuvlaedge_docker import NuvlaBox
 from ...connector.nuvlaedge_k8s import NuvlaEdgeMgmtK8s
 from ...job.job import Job
 
 
-@action('reboot_nuvlabox', True)
+@action('reboot_nuvlabox', True, priority=PRIORITY_HIGH)
 class NBRebootJob(object):
 
     def __init__(self, job: Job):
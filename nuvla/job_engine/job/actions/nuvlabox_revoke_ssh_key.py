@@ -5,11 +5,12 @@ import logging
 import json
 
 from ..actions import action
+from ..job import PRIORITY_HIGH
 from ...connector import nuvlaedge_docker as NB
 from ...connector.nuvlaedge_k8s import NuvlaEdgeMgmtK8sSSHKey
 
 
-@action('nuvlabox_revoke_ssh_key', True)
+@action('nuvlabox_revoke_ssh_key', True, uses_context=True, priority=PRIORITY_HIGH)
 class NBRevokeSSHKey(object):
     """
     Function to handle the revoking an ssh key from a  nuvlabox
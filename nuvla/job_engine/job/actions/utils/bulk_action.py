@@ -2,6 +2,9 @@
 import abc
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 
 class ActionException(Exception):
@@ -24,55 +27,155 @@ class ActionCallException(ActionException):
         self.context = kwargs.get('context')
 
 
+# Result of a bulk action, written in the status message of the bulk job.
+# Counts are exact, but resource ids are only kept as samples of at most
+# SAMPLE_SIZE ids (per error reason) and at most MAX_REASONS error reasons
+# are detailed, so that the size of the status message stays bounded
+# whatever the number of actions. The outcome of the jobs of queued actions
+# is kept apart ('jobs'), replaced as a whole by the monitor of the bulk job.
+# Version 1 results, listing all the ids, are still read.
+RESULT_VERSION = 2
+SAMPLE_SIZE = 50
+MAX_REASONS = 20
+OTHER_REASON = 'Other errors'
+JOB_FAILED_REASON = 'Job failed'
+JOB_CANCELED_REASON = 'Job canceled'
+
+
+def _sample(ids):
+    return list(ids[:SAMPLE_SIZE])
+
+
 class BulkActionResult:
     def __init__(self, actions_count: int):
         self._total_actions = actions_count
         self._failed_count = 0
         self._skipped_count = 0
+        self._success_count = 0
         self._success = []
+        self._queued_count = 0
         self._queued = []
+        self._running_count = 0
         self._running = []
         self._error_reasons = {}
         self._jobs_count = 0
+        self._jobs_success_count = 0
+        self._jobs_success = []
+        self._jobs_error_reasons = {}
+        # success ids of a version 1 result, which may include jobs outcome
+        self._legacy_success = None
+        # actions of a bulk job are accumulated concurrently
+        self._lock = threading.RLock()
+
+    @property
+    def total_actions(self):
+        return self._total_actions
+
+    def set_total_actions(self, actions_count: int):
+        with self._lock:
+            self._total_actions = actions_count
 
     def add_success_action(self, resource_id):
-        self._success.append(resource_id)
+        with self._lock:
+            self._success_count += 1
+            if len(self._success) < SAMPLE_SIZE:
+                self._success.append(resource_id)
 
     def add_queued_action(self, resource_id):
-        self._queued.append(resource_id)
-        self._jobs_count += 1
+        with self._lock:
+            self._queued_count += 1
+            if len(self._queued) < SAMPLE_SIZE:
+                self._queued.append(resource_id)
+            self._jobs_count += 1
 
     def set_queued_actions(self, queued: list):
-        self._queued = queued
+        with self._lock:
+            self._queued_count = len(queued)
+            self._queued = _sample(queued)
 
     def set_running_actions(self, running: list):
-        self._running = running
+        with self._lock:
+            self._running_count = len(running)
+            self._running = _sample(running)
 
     def exist_in_success(self, resource_id):
-        return resource_id in self._success
+        """Only the sampled ids are known."""
+        with self._lock:
+            return resource_id in self._success or resource_id in self._jobs_success
 
     def exist_in_fail_reason_ids(self, reason, resource_id):
-        return self._error_reasons.get(reason, {}).get('data', {}).get(resource_id) is not None
-
-    def _unsuccessful_action(self, reason, category, resource_id, resource_name, message=None):
-        if reason not in self._error_reasons:
-            self._error_reasons[reason] = {'count': 0, 'data': {}, 'category': category}
-        self._error_reasons[reason]['count'] += 1
-        if resource_id not in self._error_reasons[reason]['data']:
-            self._error_reasons[reason]['data'][resource_id] = {'id': resource_id, 'count': 0}
-        self._error_reasons[reason]['data'][resource_id]['count'] += 1
+        """Only the sampled ids are known."""
+        with self._lock:
+            return any(reasons.get(reason, {}).get('data', {}).get(resource_id) is not None
+                       for reasons in (self._error_reasons, self._jobs_error_reasons))
+
+    @staticmethod
+    def _unsuccessful_action(reasons, reason, category, resource_id, resource_name, message=None):
+        # a slot is left for the other reasons
+        if reason not in reasons and len(reasons) >= MAX_REASONS - 1:
+            reason = OTHER_REASON
+        if reason not in reasons:
+            reasons[reason] = {'count': 0, 'data': {}, 'category': category}
+        reasons[reason]['count'] += 1
+        data = reasons[reason]['data']
+        if resource_id not in data:
+            if len(data) >= SAMPLE_SIZE:
+                return
+            data[resource_id] = {'id': resource_id, 'count': 0}
+        data[resource_id]['count'] += 1
         if resource_name:
-            self._error_reasons[reason]['data'][resource_id]['name'] = resource_name
+            data[resource_id]['name'] = resource_name
         if message:
-            self._error_reasons[reason]['data'][resource_id]['message'] = message
+            data[resource_id]['message'] = message
 
     def skip_action(self, reason: str, resource_id='unknown', resource_name=None, message=None):
-        self._skipped_count += 1
-        self._unsuccessful_action(reason, 'skipped',  resource_id, resource_name, message)
+        with self._lock:
+            self._skipped_count += 1
+            self._unsuccessful_action(self._error_reasons, reason, 'skipped',
+                                      resource_id, resource_name, message)
 
     def fail_action(self, reason: str, resource_id='unknown', resource_name=None, message=None):
-        self._failed_count += 1
-        self._unsuccessful_action(reason, 'failed', resource_id, resource_name, message)
+        with self._lock:
+            self._failed_count += 1
+            self._unsuccessful_action(self._error_reasons, reason, 'failed',
+                                      resource_id, resource_name, message)
+
+    def set_jobs_outcome(self, success: list, failures: dict):
+        """
+        Replaces the outcome of the jobs of the queued actions: ids of the
+        target resources of the successful jobs, and of the other finished
+        jobs by failure reason.
+        """
+        with self._lock:
+            if self._legacy_success is not None:
+                counted = self._legacy_success.intersection(success)
+                self._success_count -= len(counted)
+                self._success = [i for i in self._success if i not in counted]
+                self._legacy_success = None
+            self._jobs_success_count = len(success)
+            self._jobs_success = _sample(success)
+            self._jobs_error_reasons = {}
+            for reason, resource_ids in failures.items():
+                for resource_id in resource_ids:
+                    self._unsuccessful_action(self._jobs_error_reasons, reason, 'failed',
+                                              resource_id, None)
+
+    @staticmethod
+    def _merge_reasons(*reasons_list):
+        merged = {}
+        for reasons in reasons_list:
+            for reason, cat_data in reasons.items():
+                entry = merged.setdefault(reason, {'count': 0, 'data': {},
+                                                   'category': cat_data['category']})
+                entry['count'] += cat_data['count']
+                for resource_id, id_data in cat_data['data'].items():
+                    if resource_id in entry['data']:
+                        entry['data'][resource_id] = dict(entry['data'][resource_id],
+                                                          count=entry['data'][resource_id]['count']
+                                                          + id_data['count'])
+                    elif len(entry['data']) < SAMPLE_SIZE:
+                        entry['data'][resource_id] = id_data
+        return merged
 
     @staticmethod
     def _error_reasons_to_output_format(reasons):
@@ -88,47 +191,129 @@ class BulkActionResult:
     def _error_reasons_to_internal_format(reasons):
         reasons_internal_format = {}
         for reason in reasons:
-            ids = {id_data['id']: id_data for id_data in reason.get('data', [])}
-            reason['data'] = ids
+            reason = dict(reason)
+            reason['data'] = {id_data['id']: dict(id_data) for id_data in reason.get('data', [])}
             reasons_internal_format[reason['reason']] = reason
         return reasons_internal_format
 
     def to_dict(self):
-        return {
-            'total_actions': self._total_actions,
-            'failed_count': self._failed_count,
-            'skipped_count': self._skipped_count,
-            'success': self._success,
-            'success_count': len(self._success),
-            'queued_count': len(self._queued),
-            'running_count': len(self._running),
-            'running': self._running,
-            'queued': self._queued,
-            'error_reasons': self._error_reasons_to_output_format(self._error_reasons),
-            'jobs_count': self._jobs_count}
+        with self._lock:
+            jobs_failed_count = sum(r['count'] for r in self._jobs_error_reasons.values())
+            return {
+                'version': RESULT_VERSION,
+                'total_actions': self._total_actions,
+                'failed_count': self._failed_count + jobs_failed_count,
+                'skipped_count': self._skipped_count,
+                'success': _sample(self._success + self._jobs_success),
+                'success_count': self._success_count + self._jobs_success_count,
+                'queued_count': self._queued_count,
+                'running_count': self._running_count,
+                'running': list(self._running),
+                'queued': list(self._queued),
+                'error_reasons': self._error_reasons_to_output_format(
+                    self._merge_reasons(self._error_reasons, self._jobs_error_reasons)),
+                'jobs_count': self._jobs_count,
+                'jobs': {
+                    'success_count': self._jobs_success_count,
+                    'success': list(self._jobs_success),
+                    'error_reasons': self._error_reasons_to_output_format(
+                        self._jobs_error_reasons)}}
 
     def to_json(self):
         return json.dumps(self.to_dict())
 
+    def _load_v1(self, data):
+        """Version 1 listed all the ids, the outcome of the jobs included."""
+        self._success = data.get('success', [])
+        self._success_count = len(self._success)
+        self._legacy_success = set(self._success)
+        self._success = _sample(self._success)
+        self.set_queued_actions(data.get('queued', []))
+        self.set_running_actions(data.get('running', []))
+        reasons = self._error_reasons_to_internal_format(data.get('error_reasons', []))
+        for reason in (JOB_FAILED_REASON, JOB_CANCELED_REASON):
+            job_reason = reasons.pop(reason, None)
+            if job_reason:
+                self._failed_count -= job_reason['count']
+                self._jobs_error_reasons[reason] = job_reason
+        self._error_reasons = reasons
+
+    def _load_v2(self, data):
+        jobs = data.get('jobs', {})
+        self._jobs_success_count = jobs.get('success_count', 0)
+        self._jobs_success = jobs.get('success', [])
+        self._success_count = data.get('success_count', 0) - self._jobs_success_count
+        jobs_success = set(self._jobs_success)
+        self._success = [i for i in data.get('success', []) if i not in jobs_success]
+        self._queued_count = data.get('queued_count', 0)
+        self._queued = data.get('queued', [])
+        self._running_count = data.get('running_count', 0)
+        self._running = data.get('running', [])
+        self._jobs_error_reasons = self._error_reasons_to_internal_format(
+            jobs.get('error_reasons', []))
+        reasons = self._error_reasons_to_internal_format(data.get('error_reasons', []))
+        for reason, job_reason in self._jobs_error_reasons.items():
+            self._failed_count -= job_reason['count']
+            entry = reasons.get(reason)
+            if entry:
+                entry['count'] -= job_reason['count']
+                for resource_id in job_reason['data']:
+                    entry['data'].pop(resource_id, None)
+                if entry['count'] <= 0:
+                    reasons.pop(reason)
+        self._error_reasons = reasons
+
     @classmethod
     def from_json(cls, json_string: str):
         data = json.loads(json_string)
         obj = cls(data.get('total_actions', 0))
         obj._failed_count = data.get('failed_count', 0)
         obj._skipped_count = data.get('skipped_count', 0)
-        obj._success = data.get('success', [])
-        obj._queued = data.get('queued', [])
-        obj._running = data.get('running', [])
         obj._jobs_count = data.get('jobs_count', 0)
-        obj._error_reasons = cls._error_reasons_to_internal_format(data.get('error_reasons', []))
+        if data.get('version', 1) >= 2:
+            obj._load_v2(data)
+        else:
+            obj._load_v1(data)
         return obj
 
 
 class UnfinishedBulkActionToMonitor(Exception):
     pass
 
+
+_user_slots = {}  # user -> [semaphore, number of bulk jobs using it]
+_user_slots_lock = threading.Lock()
+
+
+@contextmanager
+def user_slots(user, limit):
+    """
+    Semaphore limiting the actions in flight of all the bulk jobs of a user
+    processed by this executor, dropped once its last bulk job is done. A
+    bulk job without user gets a semaphore of its own.
+    """
+    if user is None:
+        yield threading.BoundedSemaphore(limit)
+        return
+    with _user_slots_lock:
+        entry = _user_slots.setdefault(user, [threading.BoundedSemaphore(limit), 0])
+        entry[1] += 1
+    try:
+        yield entry[0]
+    finally:
+        with _user_slots_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _user_slots[user]
+
+
 class BulkAction(object):
     monitor_tag = 'monitor'
+    # Actions in flight of one bulk job, and of all the bulk jobs of a user.
+    # Progress and result are pushed every `push_interval` seconds.
+    concurrency = 4
+    user_concurrency = 8
+    push_interval = 5
 
     def __init__(self, job, action_name):
         self.job = job
@@ -139,20 +324,46 @@ class BulkAction(object):
         self.progress_increment = None
         self.action_name = action_name
         self._log = None
+        self._progress_lock = threading.Lock()
+        self._initial_progress = self.progress
+        self._finished = 0  # actions done, not queued
+        self._pushed = None
 
     def _push_result(self):
         self.job.set_status_message(self.result.to_json())
 
-    def _set_progress_increment(self):
-        if len(self.todo) > 0:
-            self.progress_increment = 100 / len(self.todo)
+    def _push_progress(self):
+        """Writes the result and progress of the bulk job, if they changed."""
+        # the todo count is an estimate, progress may overshoot until corrected
+        status = (self.result.to_json(), min(int(self.progress), 100))
+        if status != self._pushed:
+            self.job.update_job(status_message=status[0], progress=status[1])
+            self._pushed = status
+
+    def _push_progress_periodically(self, done):
+        while not done.wait(self.push_interval):
+            try:
+                self._push_progress()
+            except Exception as ex:
+                self.log.error(f'Failed to push progress of {self.job.id}: {repr(ex)}')
+
+    def _set_progress_increment(self, todo_count):
+        if todo_count > 0:
+            self.progress_increment = 100 / todo_count
         else:
             self.progress_increment = 0
 
     @abc.abstractmethod
     def get_todo(self):
+        """Elements to act on, as a list or as an iterable consumed while
+        acting (e.g. pages of a search)."""
         pass
 
+    def count_todo(self):
+        """Number of elements of the todo, known before it is consumed. It
+        can be an estimate when the todo is streamed."""
+        return len(self.todo)
+
     @abc.abstractmethod
     def action(self, todo_el):
         pass
@@ -192,20 +403,65 @@ class BulkAction(object):
             self.result.fail_action(str(ex), resource_id)
             self.log.error(repr(ex))
         if not queued:
-            self.progress += self.progress_increment
+            with self._progress_lock:
+                self._finished += 1
+                self.progress += self.progress_increment
+
+    def tenant(self):
+        """User sharing the in-flight limit of its bulk jobs."""
+        payload = self.job.payload or {}
+        authn_info = payload.get('authn-info') or payload.get('dg-authn-info') or {}
+        return authn_info.get('active-claim') or authn_info.get('user-id')
+
+    def _try_action_in_user_slot(self, todo_el, slots):
+        with slots:
+            self.try_action(todo_el)
 
     def bulk_operation(self):
-        for todo_el in self.todo[:]:
-            self.try_action(todo_el)
-            self.job.update_job(status_message=self.result.to_json(),
-                                progress=int(self.progress))
+        """
+        Runs the actions concurrently, at most `concurrency` of them for this
+        job and `user_concurrency` for all the bulk jobs of the user. The todo
+        is consumed as the actions are run.
+        """
+        in_flight = threading.BoundedSemaphore(self.concurrency)
+        done = threading.Event()
+        pusher = threading.Thread(target=self._push_progress_periodically, args=(done,),
+                                  name=f'{self.action_name}-push', daemon=True)
+        pusher.start()
+        todo_count = 0
+        try:
+            with user_slots(self.tenant(), self.user_concurrency) as slots, \
+                    ThreadPoolExecutor(max_workers=self.concurrency,
+                                       thread_name_prefix=self.action_name) as pool:
+                for todo_el in self.todo:
+                    todo_count += 1
+                    in_flight.acquire()
+                    future = pool.submit(self._try_action_in_user_slot, todo_el, slots)
+                    future.add_done_callback(lambda _: in_flight.release())
+        finally:
+            done.set()
+            pusher.join()
+        self._correct_todo_count(todo_count)
+        self._push_progress()
+
+    def _correct_todo_count(self, todo_count):
+        """Total and progress from the actual number of elements of the todo,
+        when it differs from the count it was estimated with."""
+        if self.result.total_actions == todo_count:
+            return
+        self.log.info(f'{self.job.id}: {todo_count} elements done instead of the '
+                      f'{self.result.total_actions} estimated')
+        self.result.set_total_actions(todo_count)
+        self.progress = self._initial_progress + \
+            (100 * self._finished / todo_count if todo_count else 0)
 
     def do_work(self):
         logging.info(f'Start {self.action_name} {self.job.id}')
         self.todo = self.get_todo()
-        self.result = BulkActionResult(actions_count=len(self.todo))
+        todo_count = self.count_todo()
+        self.result = BulkActionResult(actions_count=todo_count)
         self._push_result()
-        self._set_progress_increment()
+        self._set_progress_increment(todo_count)
         self.bulk_operation()
         if self.progress < 100:
             self.job.update_job(tags=[self.monitor_tag])
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import abc
 from .bulk_action import BulkAction
+from ...pagination import search_all
 
 
 class DeploymentBulkJob(BulkAction, abc.ABC):
@@ -9,11 +10,15 @@ class DeploymentBulkJob(BulkAction, abc.ABC):
         super().__init__(job, action_name)
 
     def get_todo(self):
-        return [deployment.id
+        return (deployment.id
                 for deployment in
-                self.user_api.search('deployment',
-                                     filter=self.job.payload['filter'],
-                                     select='id').resources]
+                search_all(self.user_api, 'deployment',
+                           filter=self.job.payload['filter'],
+                           select='id'))
+
+    def count_todo(self):
+        return self.user_api.search('deployment', filter=self.job.payload['filter'],
+                                    last=0).count
 
     @abc.abstractmethod
     def deployment_action(self, deployment):
@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
+import copy
+import threading
 from pyexpat.errors import messages
+from nuvla.api.util.filter import filter_and
 
 from .bulk_action import ActionCallException, ActionException, BulkAction, SkippedActionException
+from ...pagination import search_all
+
+# ids or parents listed in the filter of one prefetch search
+PREFETCH_CHUNK = 200
+CREDENTIAL_SUBTYPES = ["infrastructure-service-swarm", "infrastructure-service-kubernetes"]
 
 
 def get_dg_owner_api(job):
@@ -34,28 +42,28 @@ class EdgeResolver:
 
     def _edge_credential(self, edge):
         cred = edge.get('credential')
-        if cred == '':
-            return None
-        else:
+        if cred is None:
             infra_id = self._get_infra(edge)
             creds = []
             if infra_id:
-                filter_cred_subtype = f'subtype={["infrastructure-service-swarm", "infrastructure-service-kubernetes"]}'
+                filter_cred_subtype = f'subtype={CREDENTIAL_SUBTYPES}'
                 filter_cred = f'parent="{infra_id}" and {filter_cred_subtype}'
                 creds = self.dg_owner_api.search('credential', filter=filter_cred, select='id').resources
             cred = creds[0].id if len(creds) > 0 else ''
             self.edges[edge.get('id')]['credential'] = cred
-        return cred
+        return cred or None
 
-    def _get_infra(self, edge):
+    def _infra_subtypes(self):
         if self.dg_subtype in ["docker-swarm", "docker-compose"]:
-            infra_subtypes = ["swarm"]
+            return ["swarm"]
         elif self.dg_subtype == "kubernetes":
-            infra_subtypes = ["kubernetes"]
+            return ["kubernetes"]
         else:
             # TODO: once subtype of deployment-set has been back-filled for existing DGs throw an error instead
-            infra_subtypes = ["swarm", "kubernetes"]
-        filter_subtype_infra = f'subtype={infra_subtypes}'
+            return ["swarm", "kubernetes"]
+
+    def _get_infra(self, edge):
+        filter_subtype_infra = f'subtype={self._infra_subtypes()}'
         filter_infra = f'parent="{edge["infrastructure-service-group"]}" ' \
                        f'and {filter_subtype_infra}'
         infras = self.dg_owner_api.search('infrastructure-service',
@@ -65,10 +73,48 @@ class EdgeResolver:
         if len(infras) > 0:
             return infras[0].id
 
+    def _search_in(self, resource_type, attribute, values, filter_str, select):
+        values = sorted(values)
+        for i in range(0, len(values), PREFETCH_CHUNK):
+            filter_values = f'{attribute}={values[i:i + PREFETCH_CHUNK]}'
+            yield from search_all(self.dg_owner_api, resource_type,
+                                  filter=filter_and([filter_values, filter_str]),
+                                  select=select)
+
+    def prefetch(self, targets):
+        """
+        Resolves the edges of targets with their infrastructure service and
+        credential in a few searches, instead of up to three searches by
+        edge. Edges not found are left to be resolved, and skipped, one by one.
+        """
+        edge_ids = {target for target in targets
+                    if EdgeResolver._is_edge_target(target) and target not in self.edges}
+        if not edge_ids:
+            return
+        edges = [edge.data for edge in
+                 self._search_in('nuvlabox', 'id', edge_ids, None,
+                                 'id, name, online, infrastructure-service-group')]
+        groups = {edge.get('infrastructure-service-group') for edge in edges} - {None}
+        infras = self._search_in('infrastructure-service', 'parent', groups,
+                                 f'subtype={self._infra_subtypes()}', 'id, parent, subtype')
+        infra_by_group = {}
+        # same choice as the search of _get_infra ordered by subtype:desc
+        for infra in sorted(infras, key=lambda r: r.data.get('subtype', ''), reverse=True):
+            infra_by_group.setdefault(infra.data.get('parent'), infra.id)
+        creds = self._search_in('credential', 'parent', set(infra_by_group.values()),
+                                f'subtype={CREDENTIAL_SUBTYPES}', 'id, parent')
+        cred_by_infra = {}
+        for cred in creds:
+            cred_by_infra.setdefault(cred.data.get('parent'), cred.id)
+        for edge in edges:
+            infra_id = infra_by_group.get(edge.get('infrastructure-service-group'))
+            edge['credential'] = cred_by_infra.get(infra_id, '')
+            self.edges[edge['id']] = edge
+
     def _get_cred(self, target):
         infra_id = self._get_infra(target)
         if infra_id:
-            filter_cred_subtype = f'subtype={["infrastructure-service-swarm", "infrastructure-service-kubernetes"]}'
+            filter_cred_subtype = f'subtype={CREDENTIAL_SUBTYPES}'
             filter_cred = f'parent="{infra_id}" and {filter_cred_subtype}'
             creds = self.dg_owner_api.search('credential', filter=filter_cred, select='id').resources
             if len(creds) > 0:
@@ -111,6 +157,10 @@ class BulkDeploymentSetApply(BulkAction):
         self.api_endpoint = None
         self.edge_resolver = EdgeResolver(self.dg_owner_api,
                                           self.dep_set.data.get('subtype'))
+        # modules by application version, shared by the concurrent actions
+        self._modules = {}
+        self._modules_locks = {}
+        self._modules_lock = threading.Lock()
 
     @staticmethod
     def _action_name_todo_el(operational_status, key):
@@ -120,11 +170,28 @@ class BulkDeploymentSetApply(BulkAction):
         operational_status = self.dg_api.operation(self.dep_set, 'operational-status').data
         self.log.info(f'{self.dep_set_id} - Operational status: {operational_status}')
         self.api_endpoint = self.dep_set.data.get('api-endpoint')
+        targets = ([el['target'] for el in operational_status.get(self.KEY_DEPLOYMENTS_TO_ADD, [])] +
+                   [el[1]['target'] for el in operational_status.get(self.KEY_DEPLOYMENTS_TO_UPDATE, [])])
+        try:
+            self.edge_resolver.prefetch(targets)
+        except Exception as ex:
+            self.log.warning(f'{self.dep_set_id} - Edges prefetch failed, resolved one by one: {repr(ex)}')
         todo = (self._action_name_todo_el(operational_status, self.KEY_DEPLOYMENTS_TO_ADD) +
                 self._action_name_todo_el(operational_status, self.KEY_DEPLOYMENTS_TO_UPDATE) +
                 self._action_name_todo_el(operational_status, self.KEY_DEPLOYMENTS_TO_REMOVE))
         return todo
 
+    def _get_module(self, application_href):
+        """Module of an application version, only fetched once per bulk job."""
+        with self._modules_lock:
+            lock = self._modules_locks.setdefault(application_href, threading.Lock())
+        with lock:
+            module = self._modules.get(application_href)
+            if module is None:
+                module = self.dg_owner_api.get(application_href).data
+                self._modules[application_href] = module
+        return module
+
     def _create_deployment(self, credential, application, app_set):
         return self.dg_owner_api.add('deployment',
                                      {'module': {'href': application},
@@ -164,12 +231,12 @@ class BulkDeploymentSetApply(BulkAction):
 
     def _load_reset_deployment(self, deployment_id, application):
         application_href = f'{application["id"]}_{application["version"]}'
-        module = self.dg_owner_api.get(application_href)
+        module = self._get_module(application_href)
         deployment = self.dg_api.get(deployment_id)
         deployment_data = deployment.data
         deployment_data['module']['href'] = application_href
-        deployment_data['module']['content']['environmental-variables'] = module.data['content'].get(
-            'environmental-variables', [])
+        deployment_data['module']['content']['environmental-variables'] = copy.deepcopy(
+            module['content'].get('environmental-variables', []))
         return deployment_data
 
     def _add_deployment(self, deployment_to_add):
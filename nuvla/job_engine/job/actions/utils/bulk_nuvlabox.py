@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import abc
 from .bulk_action import BulkAction
+from ...pagination import search_all
 
 
 class NuvlaboxBulkJob(BulkAction, abc.ABC):
@@ -9,11 +10,15 @@ class NuvlaboxBulkJob(BulkAction, abc.ABC):
         super().__init__(job, action_name)
 
     def get_todo(self):
-        return [ne.id
+        return (ne.id
                 for ne in
-                self.user_api.search('nuvlabox',
-                                     filter=self.job.payload['filter'],
-                                     select='id').resources]
+                search_all(self.user_api, 'nuvlabox',
+                           filter=self.job.payload['filter'],
+                           select='id'))
+
+    def count_todo(self):
+        return self.user_api.search('nuvlabox', filter=self.job.payload['filter'],
+                                    last=0).count
 
     @abc.abstractmethod
     def nuvlabox_action(self, nuvlabox):
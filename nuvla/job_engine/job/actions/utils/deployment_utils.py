@@ -9,12 +9,12 @@ from typing import Union, List
 
 from abc import abstractmethod, ABC
 
-from nuvla.api import Api
 from nuvla.api.models import CimiResource
 from nuvla.api.resources import Deployment, DeploymentParameter
 from nuvla.api.resources.base import ResourceNotFound
 
 from ... import Job
+from ...api_pool import pooled_api
 from ...util import override
 from ....connector import (docker_stack,
                            docker_compose,
@@ -180,10 +180,7 @@ class DeploymentBase(object):
     def get_deployment_api(self, deployment_id) -> Deployment:
         creds = Deployment._get_attr(Deployment(self.api).get(deployment_id),
                                      'api-credentials')
-        insecure = not self.api.session.verify
-        api = Api(endpoint=self.api.endpoint, insecure=insecure,
-                  persist_cookie=False, reauthenticate=True)
-        api.login_apikey(creds['api-key'], creds['api-secret'])
+        api = pooled_api(self.api, login_apikey=(creds['api-key'], creds['api-secret']))
         return Deployment(api)
 
     def private_registries_auth(self):
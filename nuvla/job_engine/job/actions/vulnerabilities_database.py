@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from ..actions import action
+from ..pagination import search_all
 
 import logging
 import requests
@@ -78,24 +79,8 @@ class VulnerabilitiesDatabaseJob(object):
         return nuvla_db_last_update, None, None
 
     def get_nuvla_vulnerabilities_list(self):
-        # we need to paginate, so let's initialize the list
-        # 10k records at the time
-        vulns = []
-        aux = self.api.search('vulnerability', orderby='updated:desc', select="id,name,modified,updated").resources
-
-        vulns += aux
-
-        while len(aux) == 10000:
-            page_filter = aux[-1].data.get('updated')
-            # when we get a page with less than 10k resources, then it's the last one
-            aux = self.api.search('vulnerability',
-                                  orderby='updated:desc',
-                                  select="id,name,modified,updated",
-                                  filter=f'updated<"{page_filter}"').resources
-
-            vulns += aux
-
-        return vulns
+        # there are more vulnerabilities than what a single search can return
+        return search_all(self.api, 'vulnerability', select="id,name,modified,updated")
 
     def update_vulnerabilities_database(self):
         logging.info(f'Updating DB of vulnerabilities in Nuvla, from {self.external_vulnerabilities_db}')
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import threading
+
+from nuvla.api.util.filter import filter_and
+
+from .job import JOB_QUEUED, JOB_RUNNING
+
+log = logging.getLogger('active_jobs')
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+SELECT = 'id,action,target-resource,state,updated'
+
+
+def job_key(action, target_href):
+    return action, target_href
+
+
+class ActiveJobsIndex(object):
+    """
+    In memory index of the QUEUED and RUNNING jobs, keyed by
+    (action, target-resource href), shared by the distributions of a
+    distributor to check if a job already exists without a request.
+
+    The index is loaded with a paged search of the active jobs, then kept up
+    to date with the jobs updated since the last refresh, at most every
+    `refresh_interval` seconds. Deleted jobs don't show up in the deltas, so
+    the index is fully reloaded every `reload_interval` seconds. Jobs added by
+    the distributor itself are indexed right away with add().
+    """
+
+    def __init__(self, api, refresh_interval=10, reload_interval=600, page_size=10000):
+        self.api = api
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self.page_size = page_size
+        self._keys = {}  # key -> job ids
+        self._job_keys = {}  # job id -> key
+        self._updated = None  # most recent `updated` seen
+        self._refreshed_at = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _search(self, filter_str, since):
+        """
+        Jobs matching filter_str updated at or after since, by pages ordered
+        by (updated, id), each page starting after the last job of the
+        previous one, so that no job is missed whatever the number of jobs
+        sharing the same `updated`.
+        """
+        after = None
+        while True:
+            if after:
+                updated, job_id = after
+                page_filter = filter_and([filter_str,
+                                          f"(updated>'{updated}' or "
+                                          f"(updated='{updated}' and id>'{job_id}'))"])
+            elif since:
+                page_filter = filter_and([filter_str, f"updated>='{since}'"])
+            else:
+                page_filter = filter_str
+            jobs = self.api.search('job', filter=page_filter, select=SELECT,
+                                   orderby='updated:asc,id:asc', last=self.page_size).resources
+            yield from jobs
+            if len(jobs) < self.page_size:
+                break
+            after = (jobs[-1].data['updated'], jobs[-1].id)
+
+    def _index(self, job_id, key):
+        self._keys.setdefault(key, set()).add(job_id)
+        self._job_keys[job_id] = key
+
+    def _unindex(self, job_id):
+        key = self._job_keys.pop(job_id, None)
+        if key:
+            job_ids = self._keys.get(key, set())
+            job_ids.discard(job_id)
+            if not job_ids:
+                self._keys.pop(key, None)
+
+    def _apply(self, job):
+        self._unindex(job.id)
+        if job.data.get('state') in ACTIVE_STATES:
+            self._index(job.id, job_key(job.data.get('action'),
+                                        job.data.get('target-resource', {}).get('href')))
+        updated = job.data.get('updated')
+        if updated and (self._updated is None or updated > self._updated):
+            self._updated = updated
+
+    def _reload(self):
+        self._keys, self._job_keys, self._updated = {}, {}, None
+        for job in self._search(f'state={list(ACTIVE_STATES)}', None):
+            self._apply(job)
+        self._loaded_at = time.monotonic()
+        log.info(f'Loaded {len(self._job_keys)} active jobs.')
+
+    def _refresh_delta(self):
+        count = 0
+        for job in self._search('id!=null', self._updated):
+            self._apply(job)
+            count += 1
+        log.debug(f'Applied {count} job updates, {len(self._job_keys)} active jobs.')
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._refreshed_at is not None \
+                    and now - self._refreshed_at < self.refresh_interval:
+                return
+            if self._loaded_at is None or self._updated is None \
+                    or now - self._loaded_at >= self.reload_interval:
+                self._reload()
+            else:
+                self._refresh_delta()
+            self._refreshed_at = now
+
+    def add(self, action, target_href, job_id):
+        with self._lock:
+            self._index(job_id, job_key(action, target_href))
+
+    def _search_exists(self, action, target_href):
+        jobs = self.api.search(
+            'job',
+            filter=filter_and([f'state={list(ACTIVE_STATES)}',
+                               f"action='{action}'",
+                               f"target-resource/href='{target_href}'"]),
+            last=0)
+        return jobs.count > 0
+
+    def exists(self, action, target_href):
+        """
+        True if a QUEUED or RUNNING job of the action on the target resource
+        exists. Falls back to a search when the index can't be refreshed.
+        """
+        try:
+            self.refresh()
+        except Exception as ex:
+            log.warning(f'Failed to refresh active jobs index: {repr(ex)}')
+            with self._lock:
+                # a failed reload leaves the index partially loaded
+                self._loaded_at = None
+            return self._search_exists(action, target_href)
+        with self._lock:
+            return job_key(action, target_href) in self._keys
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from nuvla.api import Api
+
+log = logging.getLogger('api_pool')
+
+
+class ApiPool(object):
+    """
+    Process wide LRU pool of Api clients acting on behalf of users.
+
+    Clients are kept for at most `idle_timeout` seconds after their last use
+    and at most `max_size` of them are kept. Clients created from a parent
+    Api share its HTTP adapter, so keep-alive connections to the Nuvla server
+    are reused across clients and jobs. Evicted clients are not closed, since
+    closing a session would close the shared adapter.
+    """
+
+    def __init__(self, max_size=128, idle_timeout=600):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._clients:
+            key, (last_used, _) = next(iter(self._clients.items()))
+            if len(self._clients) > self.max_size or now - last_used > self.idle_timeout:
+                del self._clients[key]
+            else:
+                break
+
+    def get(self, key, create):
+        """
+        Returns the client pooled under key, created with create() if needed.
+        """
+        with self._lock:
+            entry = self._clients.pop(key, None)
+        api = entry[1] if entry else create()
+        with self._lock:
+            self._clients[key] = (time.monotonic(), api)
+            self._evict()
+        return api
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+api_pool = ApiPool()
+
+
+def share_http_adapter(api: Api, parent_api: Api):
+    adapter = parent_api.session.get_adapter(parent_api.endpoint)
+    api.session.mount('http://', adapter)
+    api.session.mount('https://', adapter)
+    return api
+
+
+def pooled_api(parent_api: Api, authn_header=None, login_apikey=None) -> Api:
+    """
+    Returns a pooled Api client on the endpoint of parent_api, authenticated
+    with the given authn header or logged in with the given (key, secret).
+    """
+    insecure = not parent_api.session.verify
+    key = (parent_api.endpoint, insecure, authn_header, login_apikey)
+
+    def create():
+        api = Api(endpoint=parent_api.endpoint, insecure=insecure,
+                  persist_cookie=False, reauthenticate=True,
+                  authn_header=authn_header)
+        share_http_adapter(api, parent_api)
+        if login_apikey:
+            api.login_apikey(*login_apikey)
+        return api
+
+    return api_pool.get(key, create)
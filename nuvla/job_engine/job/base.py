@@ -12,19 +12,56 @@ from http.cookiejar import LWPCookieJar
 from io import StringIO
 
 from nuvla.api import Api
+from nuvla.api.api import DEFAULT_TIMEOUT
 from requests.exceptions import ConnectionError
 from statsd import StatsClient
 from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import PrometheusMetrics, start_prometheus_server, statsd_name
 
 STATSD_PORT = 8125
 TMP_COOKIE_FILE = '/tmp/nuvla-cookies/cookies.txt'
 CONNECTION_POOL_SIZE = 4
+API_POOL_METRICS_INTERVAL = 10
 
 names = ['Cartman', 'Kenny', 'Stan', 'Kyle', 'Butters', 'Token', 'Timmy',
          'Wendy', 'M. Garrison', 'Chef', 'Randy', 'Ike', 'Mr. Mackey',
          'Mr. Worker', 'Tweek', 'Craig']
 
 
+class NuvlaHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter applying a default timeout to the requests sent without one.
+    nuvla-api sends every request with its DEFAULT_TIMEOUT unless given one,
+    so that timeout is replaced too.
+    """
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super(NuvlaHTTPAdapter, self).__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if self.timeout is not None and (timeout is None or timeout == DEFAULT_TIMEOUT):
+            timeout = self.timeout
+        return super(NuvlaHTTPAdapter, self).send(request, timeout=timeout, **kwargs)
+
+    def pool_stats(self):
+        """Connections usage summed over the pools of all hosts."""
+        stats = {'pools': 0, 'maxsize': 0, 'in_use': 0, 'connections': 0, 'requests': 0}
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['pools'] += 1
+            stats['maxsize'] += pool.pool.maxsize
+            stats['in_use'] += pool.pool.maxsize - pool.pool.qsize()
+            stats['connections'] += pool.num_connections
+            stats['requests'] += pool.num_requests
+        return stats
+
+
 class Base(object):
     stop_event = threading.Event()
 
@@ -35,6 +72,7 @@ class Base(object):
         self.api: Api = None
         self.name = None
         self.statsd: StatsClient = None
+        self.prometheus: PrometheusMetrics = None
 
         arg_log_level = self.args.log_level
         env_log_level = os.getenv('JOB_LOG_LEVEL')
@@ -78,12 +116,41 @@ class Base(object):
         parser.add_argument('--api-authn-header', dest='api_authn_header', default=None,
                             help='Set header for internal authentication')
 
+        parser.add_argument('--api-pool-size', dest='api_pool_size', type=int, default=None,
+                            metavar='N',
+                            help='Maximum number of connections kept open to the Nuvla '
+                                 'endpoint (default: sized on the number of threads)')
+
+        parser.add_argument('--api-pool-block', dest='api_pool_block', default=False,
+                            action='store_true',
+                            help='Wait for a free connection instead of opening a '
+                                 'new one when all the pooled connections are in use')
+
+        parser.add_argument('--api-retries', dest='api_retries', type=int, default=0,
+                            metavar='N',
+                            help='Number of retries of failed connections and of idempotent '
+                                 'requests answered with 502, 503 or 504 (default: 0)')
+
+        parser.add_argument('--api-backoff', dest='api_backoff', type=float, default=0.5,
+                            metavar='SECONDS',
+                            help='Backoff factor between retries (default: 0.5)')
+
+        parser.add_argument('--api-timeout', dest='api_timeout', type=float, default=None,
+                            metavar='SECONDS',
+                            help='Timeout of requests to the Nuvla endpoint sent without an '
+                                 'explicit one (default: nuvla-api default)')
+
         parser.add_argument('--name', dest='name', metavar='NAME', default=None,
                             help='Base name for this process')
 
         parser.add_argument('--statsd', dest='statsd', metavar='STATSD',
                             default=None, help=f'StatsD server as host[:{STATSD_PORT}].')
 
+        parser.add_argument('--prometheus-port', dest='prometheus_port', type=int,
+                            default=None, metavar='PORT',
+                            help='Expose metrics in the Prometheus text format on '
+                                 'http://0.0.0.0:PORT/metrics')
+
         parser.add_argument('-l', '--log-level', dest='log_level',
                             choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                             default='INFO', help='Log level')
@@ -122,6 +189,48 @@ class Base(object):
         if self.statsd:
             self.statsd.gauge(name, value)
             logging.debug(f'published: {name} {value}')
+        if self.prometheus:
+            self.prometheus.set(name, value)
+
+    def publish_timer(self, name, seconds, **labels):
+        """Labels values are appended to the StatsD metric name."""
+        if self.statsd:
+            self.statsd.timing(statsd_name(name, labels), seconds * 1000)
+        if self.prometheus:
+            self.prometheus.observe(name, seconds, labels)
+
+    def publish_counter(self, name, value=1, **labels):
+        """Labels values are appended to the StatsD metric name."""
+        if self.statsd:
+            self.statsd.incr(statsd_name(name, labels), value)
+        if self.prometheus:
+            self.prometheus.inc(name, value, labels)
+
+    def _api_pool_size(self):
+        """Can be overridden by subclasses to size the pool on their number of threads"""
+        return CONNECTION_POOL_SIZE
+
+    def publish_api_pool_metrics(self):
+        adapter = self.api.session.get_adapter(self.api.endpoint)
+        if not isinstance(adapter, NuvlaHTTPAdapter):
+            return
+        stats = adapter.pool_stats()
+        prefix = f'{self.__class__.__name__.lower()}.api_pool'
+        self.publish_metric(f'{prefix}.in_use', stats['in_use'])
+        self.publish_metric(f'{prefix}.connections', stats['connections'])
+        self.publish_metric(f'{prefix}.requests', stats['requests'])
+        if stats['maxsize']:
+            self.publish_metric(f'{prefix}.saturation', stats['in_use'] / stats['maxsize'])
+        if stats['requests']:
+            self.publish_metric(f'{prefix}.reuse',
+                                1 - stats['connections'] / stats['requests'])
+
+    def _publish_api_pool_metrics_periodically(self):
+        while not Base.stop_event.wait(API_POOL_METRICS_INTERVAL):
+            try:
+                self.publish_api_pool_metrics()
+            except Exception as ex:
+                logging.error(f'Failed to publish api pool metrics: {ex}')
 
     @staticmethod
     def on_exit(signum, frame):
@@ -155,6 +264,16 @@ class Base(object):
             except Exception as ex:
                 logging.error(f'Failed to initialise StatsD client for {self.args.statsd}: {ex}')
 
+    def _init_prometheus(self):
+        if self.args.prometheus_port is not None:
+            self.prometheus = PrometheusMetrics()
+            try:
+                start_prometheus_server(self.prometheus, self.args.prometheus_port)
+            except OSError as ex:
+                logging.error(f'Failed to expose Prometheus metrics on port '
+                              f'{self.args.prometheus_port}: {ex}')
+                self.prometheus = None
+
     @staticmethod
     def _set_cookies(api: Api, cookies: str):
         """
@@ -202,10 +321,19 @@ class Base(object):
             logging.error('Unable to connect to Nuvla endpoint {}! {}'.format(self.api.endpoint, e))
             exit(1)
 
-        api_http_adapter = HTTPAdapter(pool_maxsize=CONNECTION_POOL_SIZE,
-                                        pool_connections=CONNECTION_POOL_SIZE)
+        pool_size = self.args.api_pool_size or max(self._api_pool_size(), CONNECTION_POOL_SIZE)
+        retries = Retry(total=self.args.api_retries,
+                        backoff_factor=self.args.api_backoff,
+                        status_forcelist=(502, 503, 504),
+                        raise_on_status=False) if self.args.api_retries > 0 else 0
+        api_http_adapter = NuvlaHTTPAdapter(timeout=self.args.api_timeout,
+                                            pool_maxsize=pool_size,
+                                            pool_connections=CONNECTION_POOL_SIZE,
+                                            pool_block=self.args.api_pool_block,
+                                            max_retries=retries)
         self.api.session.mount('http://', api_http_adapter)
         self.api.session.mount('https://', api_http_adapter)
+        logging.info(f'Nuvla api connection pool size: {pool_size}')
 
     def execute(self):
         self.name = self.args.name if self.args.name is not None else names[
@@ -213,6 +341,10 @@ class Base(object):
         self._init_nuvla_api()
         self._init_kazoo()
         self._init_statsd()
+        self._init_prometheus()
+        if self.statsd or self.prometheus:
+            threading.Thread(target=self._publish_api_pool_metrics_periodically,
+                             name='api-pool-metrics', daemon=True).start()
         self.do_work()
 
         while True:
@@ -1,43 +1,262 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import time
+import os
+import socket
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from nuvla.api import NuvlaError
+
+from .job import PRIORITY_LOW
+from .dry_run import measure
+from .scheduler import Schedule, DEFAULT_JITTER, MODE_FIXED_RATE, OVERRUN_SKIP
+
+# Nuvla has no bulk creation of jobs: generated jobs are added by chunks of
+# ADD_CHUNK_SIZE, with at most ADD_CONCURRENCY requests in flight.
+ADD_CONCURRENCY = 8
+ADD_CHUNK_SIZE = 200
+ADD_ATTEMPTS = 3
+ADD_RETRY_DELAY = 1
+
+# Partitioned distributions: seconds the party of distributor replicas must
+# be stable before partitions are (re)assigned.
+PARTITION_TIME_BOUNDARY = 10
+
+# Maximum delay to apply a change of the distribution configuration.
+CONFIG_POLL_INTERVAL = 5
+# ownership of the partitions is checked more often, so that they are
+# released quickly on rebalance
+PARTITION_POLL_INTERVAL = 1
+
+
+def partition_of(resource_id, partitions):
+    return zlib.crc32(str(resource_id).encode()) % partitions
 
 
 class DistributionBase():
     def __init__(self, distribution_name, distributor):
         self.distribution_name = distribution_name
         self.collect_interval = 60  # one per minute
+        self.priority = PRIORITY_LOW  # queue priority of generated jobs
+        self.add_concurrency = ADD_CONCURRENCY
+        # When > 0, target resources are hashed in that many partitions shared
+        # between the distributor replicas, instead of electing one replica.
+        self.partitions = 0
+        self.owned_partitions = None
+        # defaults of the distribution configuration, see scheduler module
+        self.schedule_mode = MODE_FIXED_RATE
+        self.overrun_policy = OVERRUN_SKIP
+        self.jitter = DEFAULT_JITTER
+        self.duplicates = 0  # jobs not generated as they already exist
         self.distributor = distributor
 
+    def setting(self, key, default=None):
+        """Current value of a setting of the distribution configuration."""
+        return self.distributor.config.get(self.distribution_name, key, default)
+
     def _get_sleep_time(self):
-        dist_interval = self.distributor.args.distribution_interval
-        for i in range(len(dist_interval)):
-            if dist_interval[i].startswith(f'{self.distribution_name}:'):
-                try:
-                    return int(dist_interval[i].split(':')[1])
-                except ValueError:
-                    logging.error(f'Bad argument: distribution_interval should be an integer')
-                    exit(1)
-        return self.collect_interval
-
-    def _job_distribution(self):
-        sleep_time = self._get_sleep_time()
-        logging.info(f'I am {self.distributor.name} and I have been elected '
-                     f'to distribute "{self.distribution_name}" jobs every {sleep_time}s')
-        while not self.distributor.stop_event.is_set():
-            now = time.time()
-            for cimi_job in self.job_generator():
-                try:
-                    logging.info(f'Distribute job: {cimi_job}')
-                    self.distributor.api.add('job', cimi_job)
-                except Exception as ex:
+        return self.setting('interval', self.collect_interval)
+
+    def _schedule_settings(self):
+        return (self._get_sleep_time(),
+                self.setting('schedule', self.schedule_mode),
+                self.setting('overrun', self.overrun_policy),
+                self.setting('jitter', self.jitter))
+
+    def _get_schedule(self):
+        return Schedule(*self._schedule_settings())
+
+    @staticmethod
+    def _is_retryable(ex):
+        if isinstance(ex, NuvlaError):
+            return ex.response is None or ex.response.status_code >= 500
+        return True
+
+    def _add_job(self, cimi_job):
+        cimi_job.setdefault('priority', self.priority)
+        for attempt in range(1, ADD_ATTEMPTS + 1):
+            try:
+                logging.info(f'Distribute job: {cimi_job}')
+                response = self.distributor.api.add('job', cimi_job)
+                self._index_added_job(cimi_job, response)
+                return True
+            except Exception as ex:
+                if attempt == ADD_ATTEMPTS or not self._is_retryable(ex):
                     logging.error(f'Failed to distribute job {self.distribution_name} - {cimi_job}: {ex}')
-                    time.sleep(5)
-            te = time.time() - now
-            time.sleep(max(sleep_time - te, 0))
+                    return False
+                logging.warning(f'Failed to distribute job {self.distribution_name} - {cimi_job} '
+                                f'(attempt {attempt}/{ADD_ATTEMPTS}): {ex}')
+                if self.distributor.stop_event.wait(ADD_RETRY_DELAY * attempt):
+                    return False
+
+    def job_exists(self, job):
+        """True if a QUEUED or RUNNING job with the same action and target
+        resource exists, looked up in the distributor index of active jobs."""
+        return self.distributor.active_jobs.exists(job['action'],
+                                                   job['target-resource']['href'])
+
+    def count_duplicates(self, count=1):
+        """Counts jobs not generated because they already exist, for the
+        generators not checking them with job_exists."""
+        self.duplicates += count
+
+    def _index_added_job(self, cimi_job, response):
+        try:
+            self.distributor.active_jobs.add(cimi_job['action'],
+                                             cimi_job['target-resource']['href'],
+                                             response.data['resource-id'])
+        except (AttributeError, KeyError, TypeError):
+            pass
+
+    def _distribute_jobs(self, pool, cimi_jobs):
+        """
+        Adds the jobs of the cimi_jobs iterable through the pool, one chunk at
+        a time, so that the generator is consumed lazily. A failing job is
+        retried on its own, without delaying the others.
+        """
+        distributed = failed = 0
+        cimi_jobs = iter(cimi_jobs)
+        batch_size = self.setting('batch_size', ADD_CHUNK_SIZE)
+        while chunk := list(islice(cimi_jobs, batch_size)):
+            for success in pool.map(self._add_job, chunk):
+                if success:
+                    distributed += 1
+                else:
+                    failed += 1
+        return distributed, failed
+
+    def owns(self, resource_id):
+        """True if this replica distributes the jobs of the resource."""
+        return self.owned_partitions is None \
+            or partition_of(resource_id, self.partitions) in self.owned_partitions
+
+    def _wait_next_cycle(self, schedule, keep_running=None):
+        """
+        Waits for the next cycle, applying the changes of the distribution
+        configuration meanwhile. Returns False if the distributor stops, or
+        as soon as keep_running returns False.
+        """
+        poll_interval = CONFIG_POLL_INTERVAL if keep_running is None else PARTITION_POLL_INTERVAL
+        config_version = self.distributor.config.version
+        while True:
+            if keep_running is not None and not keep_running():
+                return False
+            if self.distributor.config.version != config_version:
+                config_version = self.distributor.config.version
+                schedule.update(*self._schedule_settings())
+            wait_time = schedule.wait_time()
+            if wait_time <= 0:
+                return not self.distributor.stop_event.is_set()
+            if self.distributor.stop_event.wait(min(wait_time, poll_interval)):
+                return False
+
+    def _job_distribution(self, keep_running=None):
+        schedule = self._get_schedule()
+        logging.info(f'I am {self.distributor.name} and I have been elected '
+                     f'to distribute "{self.distribution_name}" jobs every {schedule.interval}s '
+                     f'({schedule.mode}, {schedule.overrun_policy} on overrun)')
+        metric_prefix = f'job_distribution.{self.distribution_name}'
+        pool = pool_size = None
+        try:
+            schedule.start()
+            while self._wait_next_cycle(schedule, keep_running):
+                started = schedule.clock()
+                if self.setting('exclude', False):
+                    logging.debug(f'Distribution {self.distribution_name} is excluded')
+                    schedule.cycle_done(started)
+                    continue
+                concurrency = self.setting('concurrency', self.add_concurrency)
+                if concurrency != pool_size:
+                    if pool:
+                        pool.shutdown()
+                    pool = ThreadPoolExecutor(max_workers=concurrency,
+                                              thread_name_prefix=f'{self.distribution_name}-add')
+                    pool_size = concurrency
+                distributed, failed = self._distribute_jobs(pool, self.job_generator())
+                if distributed or failed:
+                    self.distributor.publish_metric(f'{metric_prefix}.distributed', distributed)
+                    self.distributor.publish_metric(f'{metric_prefix}.failed', failed)
+                overrun, skipped = schedule.cycle_done(started)
+                if overrun:
+                    logging.warning(f'Distribution {self.distribution_name} overran its '
+                                    f'{schedule.interval}s interval by {overrun:.1f}s, '
+                                    f'{skipped} cycles skipped')
+                    self.distributor.publish_counter(f'{metric_prefix}.overruns')
+                    self.distributor.publish_timer(f'{metric_prefix}.overrun', overrun)
+                if skipped:
+                    self.distributor.publish_counter(f'{metric_prefix}.skipped', skipped)
+        finally:
+            if pool:
+                pool.shutdown()
+
+    def _partitioner_identifier(self):
+        """
+        Partitions are divided by identifier, members sharing one would own the
+        same partitions. Distributor names aren't unique (random or --name).
+        """
+        return f'{self.distributor.name}-{socket.gethostname()}-{os.getpid()}-' \
+               f'{uuid.uuid4().hex[:8]}'
+
+    def _start_partitioned_distribution(self):
+        identifier = self._partitioner_identifier()
+        partitioner = self.distributor.kz.SetPartitioner(
+            f'/partition/{self.distribution_name}', set=range(self.partitions),
+            identifier=identifier, time_boundary=PARTITION_TIME_BOUNDARY)
+        try:
+            while not self.distributor.stop_event.is_set():
+                if partitioner.failed:
+                    raise Exception(f'Lost partitions of {self.distribution_name}')
+                elif partitioner.release:
+                    self.owned_partitions = set()
+                    partitioner.release_set()
+                elif partitioner.acquired:
+                    self.owned_partitions = set(partitioner)
+                    logging.info(f'I am {identifier} and I own partitions '
+                                 f'{sorted(self.owned_partitions)} of {self.partitions} '
+                                 f'of "{self.distribution_name}"')
+                    self.distributor.publish_metric(
+                        f'job_distribution.{self.distribution_name}.partitions',
+                        len(self.owned_partitions))
+                    self._job_distribution(keep_running=lambda: partitioner.acquired)
+                elif partitioner.allocating:
+                    partitioner.wait_for_acquire(timeout=PARTITION_TIME_BOUNDARY)
+        finally:
+            self.owned_partitions = set()
+            partitioner.finish()
+
+    def _dry_run(self):
+        """
+        Runs job_generator once without adding the jobs, and publishes the
+        jobs it would distribute and the load it puts on the Nuvla server.
+        """
+        job_exists = self.job_exists
+
+        def counting_job_exists(job):
+            exists = job_exists(job)
+            if exists:
+                self.count_duplicates()
+            return exists
+
+        self.duplicates = 0
+        self.job_exists = counting_job_exists
+        jobs, metrics = measure(self.distributor.api_traffic,
+                                lambda: sum(1 for _ in self.job_generator()),
+                                profile=self.distributor.args.profile)
+        metrics.update(jobs=jobs, duplicates=self.duplicates)
+        for name, value in metrics.items():
+            self.distributor.publish_metric(
+                f'job_distribution.{self.distribution_name}.dry_run.{name}', value)
 
     def _start_distribution(self):
+        if self.distributor.args.dry_run:
+            self._dry_run()
+            return
+        if self.partitions > 0:
+            self._start_partitioned_distribution()
+            return
         election = self.distributor.kz.Election(f'/election/{self.distribution_name}', self.distributor.name)
         while True:
             logging.info(f'STARTING ELECTION {self.distribution_name}')
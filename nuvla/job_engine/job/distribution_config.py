@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+"""
+Configuration of the distributions, changeable while the distributor runs.
+
+Settings are first read from the command line arguments of the distributor.
+They can then be overridden live by a JSON document, stored in a ZooKeeper
+node or in a file (only one of both), watched for changes:
+
+    {"distributions": {"usage_report": {"interval": 120,
+                                         "exclude": false,
+                                         "batch_size": 50,
+                                         "concurrency": 2,
+                                         "schedule": "fixed-delay",
+                                         "overrun": "skip",
+                                         "jitter": 0.2}}}
+
+A setting missing from the document falls back to the command line, then to
+the default of the distribution. An invalid document is ignored, the
+previous one staying in effect.
+"""
+
+import os
+import json
+import logging
+import argparse
+import threading
+
+from .scheduler import MODES, OVERRUN_POLICIES
+
+FILE_POLL_INTERVAL = 5
+
+
+def _non_negative_int(value):
+    if isinstance(value, bool) or int(value) != float(value) or int(value) < 0:
+        raise ValueError(f'{value} is not a non negative integer')
+    return int(value)
+
+
+def _positive_int(value):
+    value = _non_negative_int(value)
+    if value == 0:
+        raise ValueError('0 is not a positive integer')
+    return value
+
+
+def _boolean(value):
+    if not isinstance(value, bool):
+        raise ValueError(f'{value} is not a boolean')
+    return value
+
+
+def _one_of(choices):
+    def check(value):
+        if value not in choices:
+            raise ValueError(f'{value} should be one of {choices}')
+        return value
+    return check
+
+
+def _fraction(value):
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise ValueError(f'{value} is not between 0 and 1')
+    return value
+
+
+SETTINGS = {'interval': _non_negative_int,
+            'exclude': _boolean,
+            'batch_size': _positive_int,
+            'concurrency': _positive_int,
+            'schedule': _one_of(MODES),
+            'overrun': _one_of(OVERRUN_POLICIES),
+            'jitter': _fraction}
+
+
+def validate(settings):
+    """Checked and converted copy of {distribution name: {setting: value}}."""
+    if not isinstance(settings, dict):
+        raise ValueError('distributions should be an object')
+    validated = {}
+    for name, distribution_settings in settings.items():
+        if not isinstance(distribution_settings, dict):
+            raise ValueError(f'settings of {name} should be an object')
+        for key, value in distribution_settings.items():
+            if key not in SETTINGS:
+                raise ValueError(f'unknown setting {key} of {name}')
+            try:
+                validated.setdefault(name, {})[key] = SETTINGS[key](value)
+            except (TypeError, ValueError) as ex:
+                raise ValueError(f'bad {key} of {name}: {ex}')
+    return validated
+
+
+def _name_values(arg_values):
+    for arg_value in arg_values or []:
+        name, _, value = arg_value.partition(':')
+        yield name, value.split(':')
+
+
+def distribution_arg(*keys):
+    """
+    Argparse type of DISTRIBUTION:VALUE[:VALUE...] arguments, whose values
+    are the given settings, the first one being required.
+    """
+    def check(value):
+        name, _, values = value.partition(':')
+        values = values.split(':') if values else []
+        if not name or not 0 < len(values) <= len(keys):
+            raise argparse.ArgumentTypeError(
+                f'"{value}" should be DISTRIBUTION:{":".join(k.upper() for k in keys)}')
+        try:
+            validate({name: dict(zip(keys, values))})
+        except ValueError as ex:
+            raise argparse.ArgumentTypeError(str(ex))
+        return value
+    return check
+
+
+def settings_from_args(args):
+    settings = {}
+    for name in args.distribution_exclude or []:
+        settings.setdefault(name, {})['exclude'] = True
+    for name, values in _name_values(args.distribution_interval):
+        settings.setdefault(name, {})['interval'] = values[0]
+    for name, values in _name_values(args.distribution_schedule):
+        settings.setdefault(name, {})['schedule'] = values[0]
+        if len(values) > 1:
+            settings[name]['overrun'] = values[1]
+    for name, values in _name_values(args.distribution_jitter):
+        settings.setdefault(name, {})['jitter'] = values[0]
+    return settings
+
+
+class DistributionConfig(object):
+
+    def __init__(self, args=None):
+        self._args_settings = {}
+        self._live_settings = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self.version = 0
+        if args is not None:
+            self._args_settings = validate(settings_from_args(args))
+
+    def get(self, name, key, default=None):
+        with self._lock:
+            for settings in (self._live_settings, self._args_settings):
+                value = settings.get(name, {}).get(key)
+                if value is not None:
+                    return value
+        return default
+
+    def excluded(self, name):
+        return self.get(name, 'exclude', False)
+
+    def add_listener(self, listener):
+        """listener() is called after each change of the configuration."""
+        self._listeners.append(listener)
+
+    def update(self, document):
+        """
+        Replaces the live settings by the ones of the JSON document (str,
+        bytes or dict). An empty document removes them.
+        """
+        try:
+            if isinstance(document, (str, bytes)):
+                document = json.loads(document) if document.strip() else {}
+            if not isinstance(document, dict):
+                raise ValueError('configuration should be an object')
+            settings = validate(document.get('distributions', {}))
+        except ValueError as ex:
+            logging.error(f'Ignored invalid distribution configuration: {ex}')
+            return False
+        with self._lock:
+            if settings == self._live_settings:
+                return False
+            self._live_settings = settings
+            self.version += 1
+        logging.info(f'Distribution configuration changed: {settings}')
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as ex:
+                logging.error(f'Failed to apply distribution configuration: {repr(ex)}')
+        return True
+
+    def watch_zk(self, kz, path):
+        def on_change(data, _stat):
+            self.update(data or {})
+        kz.DataWatch(path, on_change)
+        logging.info(f'Watching distribution configuration in ZooKeeper node {path}')
+
+    def _poll_file(self, path, stop_event):
+        mtime = None
+        while True:
+            try:
+                current_mtime = os.stat(path).st_mtime
+                if current_mtime != mtime:
+                    mtime = current_mtime
+                    with open(path) as f:
+                        self.update(f.read())
+            except FileNotFoundError:
+                if mtime is not None:
+                    mtime = None
+                    self.update({})
+            except Exception as ex:
+                logging.error(f'Failed to read distribution configuration {path}: {repr(ex)}')
+            if stop_event.wait(FILE_POLL_INTERVAL):
+                break
+
+    def watch_file(self, path, stop_event):
+        threading.Thread(target=self._poll_file, args=(path, stop_event),
+                         name='distribution-config', daemon=True).start()
+        logging.info(f'Watching distribution configuration in file {path}')
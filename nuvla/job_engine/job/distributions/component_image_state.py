@@ -22,14 +22,6 @@ class ServiceImageStateJobsDistribution(DistributionBase):
                 components.append(r.id)
         return components
 
-    def job_exists(self, job):
-        filters = "(state='QUEUED' or state='RUNNING')" \
-                  " and action='{0}'" \
-                  " and target-resource/href='{1}'" \
-            .format(job['action'], job['target-resource']['href'])
-        jobs = self.distributor.api.search('job', filter=filters, last=0)
-        return jobs.count > 0
-
     @override
     def job_generator(self):
         while True:
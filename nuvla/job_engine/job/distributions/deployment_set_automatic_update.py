@@ -3,10 +3,10 @@
 import logging
 
 from nuvla.api.util.filter import filter_and
-from ..job import JOB_QUEUED, JOB_RUNNING
 from ..util import override
 from ..distributions import distribution
 from ..distribution import DistributionBase
+from ..pagination import search_all
 
 
 @distribution('deployment_set_automatic_update')
@@ -21,27 +21,16 @@ class DeploymentSetAutomaticUpdateJobsDistribution(DistributionBase):
 
     def auto_update_dgs(self):
         try:
-            return self.distributor.api.search(
-                'deployment-set',
+            return list(search_all(
+                self.distributor.api, 'deployment-set',
                 filter=filter_and(['state=["STARTED","UPDATED","PARTIALLY-STARTED","PARTIALLY-UPDATED"]',
                                    'auto-update=true',
                                    'next-refresh<="now"']),
-                select='id,owner',
-                last=10000).resources
+                select='id,owner'))
         except Exception as ex:
             logging.error(f'Failed to search for auto-update dgs: {ex}')
             return []
 
-    def job_exists(self, job):
-        jobs = self.distributor.api.search(
-            'job',
-            filter=filter_and(
-                [f'state={[JOB_RUNNING, JOB_QUEUED]}',
-                 f"action='{job['action']}'",
-                 f"target-resource/href='{job['target-resource']['href']}'"]),
-            last=0)
-        return jobs.count > 0
-
     @override
     def job_generator(self):
         auto_update_dgs = self.auto_update_dgs()
@@ -7,6 +7,7 @@ from nuvla.api.util.filter import filter_and
 from ..job import JOB_QUEUED, JOB_RUNNING
 from ..util import override
 from ..distribution import DistributionBase
+from ..pagination import search_all
 
 
 class DeploymentStateJobsDistribution(DistributionBase):
@@ -28,10 +29,10 @@ class DeploymentStateJobsDistribution(DistributionBase):
         deployment_ids = [deployment.id for deployment in deployments]
         filter_targets = f'target-resource/href={deployment_ids}'
         filter_jobs = filter_and([filter_states, filter_action, filter_targets])
-        jobs = self.distributor.api.search(
-            'job', filter=filter_jobs, select='target-resource', last=10000)
+        jobs = search_all(self.distributor.api, 'job',
+                          filter=filter_jobs, select='target-resource')
         return {job.data.get('target-resource', {}).get('href')
-                for job in jobs.resources}
+                for job in jobs}
 
     def _build_job(self, deployment):
         job = {'action': self.ACTION_NAME,
@@ -53,7 +54,8 @@ class DeploymentStateJobsDistribution(DistributionBase):
     @override
     def job_generator(self):
         skipped = 0
-        deployments = self.get_deployments()
+        deployments = [deployment for deployment in self.get_deployments()
+                       if self.owns(deployment.id)]
         if len(deployments) > 0:
             existing_jobs = self._get_exiting_jobs(deployments)
             for deployment in deployments:
@@ -61,5 +63,6 @@ class DeploymentStateJobsDistribution(DistributionBase):
                     skipped += 1
                 else:
                     yield self._build_job(deployment)
+            self.count_duplicates(skipped)
             self._publish_metric('skipped_exist', skipped)
             logging.info(f'Deployments skipped (jobs already exist): {skipped}')
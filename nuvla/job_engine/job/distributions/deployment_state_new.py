@@ -7,6 +7,10 @@ from ..distributions import distribution
 from .deployment_state import DeploymentStateJobsDistribution
 
 
+# deployments are shared between the distributor replicas
+PARTITIONS = 32
+
+
 @distribution('deployment_state_new')
 class DeploymentStateNewJobsDistribution(DeploymentStateJobsDistribution):
     DISTRIBUTION_NAME = 'deployment_state_new'
@@ -15,6 +19,7 @@ class DeploymentStateNewJobsDistribution(DeploymentStateJobsDistribution):
     def __init__(self, distributor):
         super(DeploymentStateJobsDistribution, self).__init__(self.DISTRIBUTION_NAME, distributor)
         self.collect_interval = 10
+        self.partitions = PARTITIONS
         self._start_distribution()
 
     @override
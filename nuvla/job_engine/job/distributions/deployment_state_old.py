@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import math
 import logging
 
+from nuvla.api.util.filter import filter_and
+
 from ..util import override
 from ..distributions import distribution
 from .deployment_state import DeploymentStateJobsDistribution
@@ -10,6 +13,13 @@ from .deployment_state import DeploymentStateJobsDistribution
 # direct retry on error for long interval jobs
 # config sleep time deployment state issue
 
+# Deployments are swept over SWEEP_SLOTS slots per interval, in id order,
+# continuing from the last deployment of the previous slot. The last slot of
+# a sweep takes the remaining deployments, so that a sweep never spans more
+# than SWEEP_SLOTS slots when deployments are added during the sweep.
+SWEEP_SLOTS = 6
+MAX_PAGE_SIZE = 10000
+
 @distribution('deployment_state_old')
 class DeploymentStateOldJobsDistribution(DeploymentStateJobsDistribution):
     DISTRIBUTION_NAME = 'deployment_state_old'
@@ -18,16 +28,26 @@ class DeploymentStateOldJobsDistribution(DeploymentStateJobsDistribution):
     def __init__(self, distributor):
         super(DeploymentStateJobsDistribution, self).__init__(self.DISTRIBUTION_NAME, distributor)
         self.collect_interval = 60
+        self.sweep_slots = SWEEP_SLOTS
+        self._cursor = None  # id of the last deployment of the previous slot
+        self._slot = 0  # slot of the current sweep
+        self._page_size = MAX_PAGE_SIZE
         self._start_distribution()
 
+    @override
+    def _get_sleep_time(self):
+        """A slot of the sweep of the deployments is run at every cycle."""
+        return super()._get_sleep_time() / self.sweep_slots
+
     def _get_existing_parents(self, deployments):
-        if len(deployments) > 0:
-            deployment_parents = [deployment.data.get('parent')
-                                  for deployment in deployments
-                                  if deployment.data.get('parent')]
+        deployment_parents = list({deployment.data.get('parent')
+                                   for deployment in deployments
+                                   if deployment.data.get('parent')})
+        if len(deployment_parents) > 0:
             filter_parents = f'id={deployment_parents}'
             parents_resp = self.distributor.api.search(
-                'credential', filter=filter_parents, select='id', last=10000)
+                'credential', filter=filter_parents, select='id',
+                last=len(deployment_parents))
             return {parent.id for parent in parents_resp.resources}
         else:
             return set()
@@ -48,14 +68,35 @@ class DeploymentStateOldJobsDistribution(DeploymentStateJobsDistribution):
         mname = f'job_distribution.deployment_state_old.{name}'
         self.distributor.publish_metric(mname, value)
 
+    def _start_sweep(self, filters):
+        count = self.distributor.api.search('deployment', filter=filters, last=0).count
+        self._publish_metric('in_started', count)
+        logging.info(f'Deployments in STARTED: {count}')
+        self._page_size = min(max(math.ceil(count / self.sweep_slots), 1), MAX_PAGE_SIZE)
+
     @override
     def get_deployments(self):
         filters = f"state='STARTED' and updated<'now-{self.COLLECT_PAST_SEC}s' and nuvlabox=null"
         select = 'id,execution-mode,nuvlabox,parent'
-        deployments_resp = self.distributor.api.search('deployment', filter=filters, select=select)
-        self._publish_metric('in_started', deployments_resp.count)
-        logging.info(f'Deployments in STARTED: {deployments_resp.count}')
-        deployments_with_parents = self.filter_deployments_without_parents(deployments_resp.resources)
+        if self._cursor is None:
+            self._start_sweep(filters)
+            self._slot = 0
+            page_filters = filters
+        else:
+            page_filters = filter_and([filters, f"id>'{self._cursor}'"])
+        last_slot = self._slot >= self.sweep_slots - 1
+        page_size = MAX_PAGE_SIZE if last_slot else self._page_size
+        deployments = self.distributor.api.search(
+            'deployment', filter=page_filters, select=select, orderby='id:asc',
+            last=page_size).resources
+        # the last slot or a short page ends the sweep, the next slot starts a new one
+        if last_slot or len(deployments) < page_size:
+            self._cursor = None
+        else:
+            self._cursor = deployments[-1].id
+            self._slot += 1
+        deployments_with_parents = self.filter_deployments_without_parents(deployments)
         self._publish_metric('in_started_with_parent', len(deployments_with_parents))
-        logging.info(f'Deployments in STARTED with parent: {len(deployments_with_parents)}')
+        logging.info(f'Deployments in STARTED with parent in sweep slot: '
+                     f'{len(deployments_with_parents)}/{len(deployments)}')
         return deployments_with_parents
@@ -9,6 +9,7 @@ from ..job import JOB_QUEUED, JOB_RUNNING, JOB_SUCCESS
 from ..util import override
 from ..distributions import distribution
 from ..distribution import DistributionBase
+from ..pagination import search_all
 
 
 def build_filter_customers(customer_ids: List[str]) -> str:
@@ -35,11 +36,9 @@ class HandleTrialEndJobsDistribution(DistributionBase):
                          f' and created<="{nuvla_date(today_end_time())}"'
         filter_job_str = filter_and(
             [created_filter, action_filter, state_filter])
-        jobs = self.distributor.api.search(
-            'job',
-            last=10000,
-            select=['id', 'target-resource'],
-            filter=filter_job_str).resources
+        jobs = search_all(self.distributor.api, 'job',
+                          select=['id', 'target-resource'],
+                          filter=filter_job_str)
         return [job.data['target-resource']['href'] for job in jobs]
 
     def list_trials(self):
@@ -52,11 +51,9 @@ class HandleTrialEndJobsDistribution(DistributionBase):
                 if trial.get('customer')]
 
     def search_customers(self, filter_customers):
-        return self.distributor.api.search(
-            'customer',
-            last=10000,
-            select=['id'],
-            filter=filter_customers).resources
+        return list(search_all(self.distributor.api, 'customer',
+                               select=['id'],
+                               filter=filter_customers))
 
     def get_customers(self):
         customer_filter = build_filter_customers(self.list_customer_ids())
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from ..util import override
+from ..job import PRIORITY_HIGH
+from ..job_queue import JOB_QUEUE_PATH, queue_paths, age_queue_entries
+from ..actions import get_action_priority
+from ..pagination import search_all
+from ..distributions import distribution
+from ..distribution import DistributionBase
+
+
+@distribution('job_queue_aging')
+class JobQueueAgingDistribution(DistributionBase):
+    DISTRIBUTION_NAME = 'job_queue_aging'
+    AGING_INTERVAL = 300  # promote entries waiting for more than 5min
+    AGING_STEP = 100
+    AGING_FLOOR = PRIORITY_HIGH
+    JOB_IDS_CHUNK = 200  # job ids listed in the filter of one search
+
+    def __init__(self, distributor):
+        super(JobQueueAgingDistribution, self).__init__(
+            self.DISTRIBUTION_NAME, distributor)
+        self.collect_interval = 60
+        self._start_distribution()
+
+    def declared_priorities(self, job_ids):
+        """Priority of the jobs, or else the one declared by their action."""
+        priorities = {}
+        for i in range(0, len(job_ids), self.JOB_IDS_CHUNK):
+            jobs = search_all(self.distributor.api, 'job',
+                              filter=f'id={job_ids[i:i + self.JOB_IDS_CHUNK]}',
+                              select='id, action, priority')
+            for job in jobs:
+                priorities[job.id] = job.data.get(
+                    'priority', get_action_priority(job.data.get('action')))
+        return priorities
+
+    def age_queue(self, queue_path):
+        try:
+            # lane queues entries are put with the declared priority already
+            declared_priorities = self.declared_priorities \
+                if queue_path == JOB_QUEUE_PATH else None
+            promoted = age_queue_entries(self.distributor.kz, queue_path,
+                                         self.AGING_INTERVAL, self.AGING_STEP,
+                                         self.AGING_FLOOR, declared_priorities)
+            logging.info(f'Queue {queue_path} entries promoted: {promoted}')
+            queue_name = queue_path.strip('/').replace('/', '.')
+            self.distributor.publish_metric(
+                f'job_distribution.job_queue_aging.{queue_name}.promoted', promoted)
+        except Exception as ex:
+            logging.error(f'Failed to age entries of queue {queue_path}: {ex}')
+
+    @override
+    def job_generator(self):
+        # we don't generate a job because it's a simple reordering of the queue
+        for queue_path in queue_paths(self.distributor.kz):
+            self.age_queue(queue_path)
+        return []
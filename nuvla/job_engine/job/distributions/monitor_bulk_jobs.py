@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from nuvla.api.util.filter import filter_and
 from ..distributions import distribution
 from ..distribution import DistributionBase
+from ..pagination import search_all
 from ..util import override
-from ..job import JOB_RUNNING, JOB_QUEUED
+from ..job import JOB_RUNNING, PRIORITY_NORMAL
 from ..actions.utils.bulk_action import BulkAction
 
 
@@ -16,27 +16,16 @@ class MonitorBulkJobsDistributor(DistributionBase):
     def __init__(self, distributor):
         super(MonitorBulkJobsDistributor, self).__init__(self.DISTRIBUTION_NAME, distributor)
         self.collect_interval = 30
+        self.priority = PRIORITY_NORMAL
         self._start_distribution()
 
-    def job_exists(self, job):
-        jobs = self.distributor.api.search(
-            'job',
-            filter=filter_and(
-                [f'state={[JOB_RUNNING, JOB_QUEUED]}',
-                 f"action='{job['action']}'",
-                 f"target-resource/href='{job['target-resource']['href']}'"]),
-            last=0)
-        return jobs.count > 0
-
     def get_bulk_jobs_running(self):
         filter_bulk_jobs = ('action^="bulk" '
                             f'and state="{JOB_RUNNING}"'
                             f'and tags="{BulkAction.monitor_tag}"')
-        return self.distributor.api.search(
-            'job',
-            last=10000,
-            select=['id'],
-            filter=filter_bulk_jobs).resources
+        return search_all(self.distributor.api, 'job',
+                          select=['id'],
+                          filter=filter_bulk_jobs)
 
     def bulk_jobs_running(self):
         try:
@@ -1,9 +1,25 @@
 # -*- coding: utf-8 -*-
 
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from nuvla.api import NuvlaError
+from nuvla.api.models import CimiResource
+
 from ..util import override
 from ..distributions import distribution
 from ..distribution import DistributionBase
+from ..pagination import search_all
+
+
+# nuvlaboxes are shared between the distributor replicas
+PARTITIONS = 32
+SET_OFFLINE_CONCURRENCY = 8
+BULK_CHUNK_SIZE = 100
+# nuvlaboxes set offline are not set offline again before PENDING_TTL
+# seconds, even if they still appear online in the next cycles
+PENDING_TTL = 300
 
 
 @distribution('nuvlabox_offline')
@@ -14,17 +30,20 @@ class NuvlaBoxOfflineDistribution(DistributionBase):
         super(NuvlaBoxOfflineDistribution, self).__init__(
             self.DISTRIBUTION_NAME, distributor)
         self.collect_interval = 30
+        self.partitions = PARTITIONS
+        self.pending = {}  # nuvlabox id -> time it was set offline
+        self.bulk_supported = True  # until the server says otherwise
         self._start_distribution()
 
     def collect_offline(self):
         try:
             filters = "online = true and next-heartbeat < 'now'"
             select = 'id, parent'
-            last = 10000
-            offline = self.distributor.api.search('nuvlabox-status', filter=filters,
-                                                  select=select, last=last)
-            logging.info(f'Nuvlabox offline: {offline.count}')
-            return [status.data.get('parent') for status in offline.resources]
+            offline = [status.data.get('parent') for status in
+                       search_all(self.distributor.api, 'nuvlabox-status',
+                                  filter=filters, select=select)]
+            logging.info(f'Nuvlabox offline: {len(offline)}')
+            return offline
         except Exception as ex:
             logging.error(f'Failed to collect offline Nuvlabox: {ex}')
             return []
@@ -32,14 +51,73 @@ class NuvlaBoxOfflineDistribution(DistributionBase):
     def set_offline(self, nb_id):
         try:
             logging.info(f'Setting {nb_id} to offline')
-            nuvlabox =self.distributor.api.get(nb_id)
-            self.distributor.api.operation(nuvlabox, 'set-offline')
+            # the operation is called by href, no need to get the nuvlabox
+            self.distributor.api.operation(CimiResource({'id': nb_id}), 'set-offline')
+            return True
         except Exception as ex:
             logging.error(f'Failed edit {nb_id} to set offline : {ex}')
+            return False
+
+    def set_offline_bulk(self, nb_ids):
+        """
+        Sets the nuvlaboxes offline with one bulk operation. Returns False,
+        and disables the bulk operation, if the server doesn't support it.
+        """
+        if not self.bulk_supported:
+            return False
+        try:
+            self.distributor.api.operation_bulk('nuvlabox', f'id={nb_ids}', 'set-offline', {})
+            logging.info(f'Set {len(nb_ids)} nuvlaboxes offline in bulk')
+            return True
+        except NuvlaError as ex:
+            if ex.response is not None and 400 <= ex.response.status_code < 500:
+                logging.info(f'Bulk set-offline not supported, falling back to one '
+                             f'operation per nuvlabox: {ex}')
+                self.bulk_supported = False
+            else:
+                logging.error(f'Failed bulk set offline of {len(nb_ids)} nuvlaboxes: {ex}')
+            return False
+        except Exception as ex:
+            logging.error(f'Failed bulk set offline of {len(nb_ids)} nuvlaboxes: {ex}')
+            return False
+
+    def _to_set_offline(self, offline):
+        """Owned offline nuvlaboxes not already set offline recently."""
+        now = time.monotonic()
+        offline = set(offline)
+        # nuvlaboxes no longer collected have been set offline (or are back)
+        self.pending = {nb_id: since for nb_id, since in self.pending.items()
+                        if nb_id in offline and now - since < PENDING_TTL}
+        return [nb_id for nb_id in sorted(offline)
+                if nb_id not in self.pending and self.owns(nb_id)]
+
+    def set_all_offline(self, nb_ids):
+        now = time.monotonic()
+        for nb_id in nb_ids:
+            self.pending[nb_id] = now
+        remaining = []
+        for i in range(0, len(nb_ids), BULK_CHUNK_SIZE):
+            chunk = nb_ids[i:i + BULK_CHUNK_SIZE]
+            if not self.set_offline_bulk(chunk):
+                remaining.extend(chunk)
+        failed = 0
+        if remaining:
+            with ThreadPoolExecutor(max_workers=SET_OFFLINE_CONCURRENCY,
+                                    thread_name_prefix='set-offline') as pool:
+                for nb_id, success in zip(remaining, pool.map(self.set_offline, remaining)):
+                    if not success:
+                        # retried on next cycle
+                        self.pending.pop(nb_id, None)
+                        failed += 1
+        return len(nb_ids) - failed, failed
 
     @override
     def job_generator(self):
         # we don't generate a job because it's a simple edit of nuvlabox status
-        for nuvlabox in self.collect_offline():
-            self.set_offline(nuvlabox)
+        nb_ids = self._to_set_offline(self.collect_offline())
+        if nb_ids:
+            set_offline, failed = self.set_all_offline(nb_ids)
+            metric_prefix = f'job_distribution.{self.DISTRIBUTION_NAME}'
+            self.distributor.publish_metric(f'{metric_prefix}.set_offline', set_offline)
+            self.distributor.publish_metric(f'{metric_prefix}.set_offline_failed', failed)
         return []
@@ -5,6 +5,7 @@ import logging
 from ..util import override
 from ..distributions import distribution
 from ..distribution import DistributionBase
+from ..pagination import search_all
 
 
 @distribution('refresh_customer_subscription_cache')
@@ -19,11 +20,9 @@ class RefreshCustomerSubscriptionCache(DistributionBase):
 
     def customers(self):
         try:
-            return self.distributor.api.search(
-                'customer',
-                filter='subscription-id!=null',
-                select='id,operations',
-                last=10000).resources
+            return list(search_all(self.distributor.api, 'customer',
+                                   filter='subscription-id!=null',
+                                   select='id,operations'))
         except Exception as ex:
             logging.error(f'Failed to search for customers: {ex}')
             return []
@@ -3,10 +3,10 @@
 import logging
 
 from nuvla.api.util.filter import filter_and
-from ..job import JOB_QUEUED, JOB_RUNNING
 from ..util import override
 from ..distributions import distribution
 from ..distribution import DistributionBase
+from ..pagination import search_all
 
 
 @distribution('register_usage_record')
@@ -21,12 +21,11 @@ class RegisterUsageRecordJobsDistribution(DistributionBase):
 
     def customers(self):
         try:
-            return self.distributor.api.search(
-                'customer',
+            return list(search_all(
+                self.distributor.api, 'customer',
                 filter=filter_and(['subscription-id!=null',
                                    'subscription-cache/status!="canceled"']),
-                select='id, parent',
-                last=10000).resources
+                select='id, parent'))
         except Exception as ex:
             logging.error(f'Failed to search for customers: {ex}')
             return []
@@ -36,27 +35,16 @@ class RegisterUsageRecordJobsDistribution(DistributionBase):
             ids = [c.data['parent'] for c in customers
                    if c.data['parent'].startswith('group/')]
             if ids:
-                return self.distributor.api.search(
-                    'group',
+                return list(search_all(
+                    self.distributor.api, 'group',
                     filter=f'parents={ids}',
-                    select='id',
-                    last=10000).resources
+                    select='id'))
             else:
                 return []
         except Exception as ex:
             logging.error(f'Failed to search for subgroups: {ex}')
             return []
 
-    def job_exists(self, job):
-        jobs = self.distributor.api.search(
-            'job',
-            filter=filter_and(
-                [f'state={[JOB_RUNNING, JOB_QUEUED]}',
-                 f"action='{job['action']}'",
-                 f"target-resource/href='{job['target-resource']['href']}'"]),
-            last=0)
-        return jobs.count > 0
-
     @override
     def job_generator(self):
         customers = self.customers()
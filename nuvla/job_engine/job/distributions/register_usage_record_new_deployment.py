@@ -3,10 +3,10 @@
 import logging
 
 from nuvla.api.util.filter import filter_and
-from ..job import JOB_RUNNING, JOB_QUEUED
 from ..util import override
 from ..distributions import distribution
 from ..distribution import DistributionBase
+from ..pagination import search_all
 from .register_usage_record import RegisterUsageRecordJobsDistribution
 
 
@@ -20,25 +20,14 @@ class RegisterUsageRecordNewDeploymentJobsDistribution(DistributionBase):
         self.collect_interval = 60
         self._start_distribution()
 
-    def job_exists(self, job):
-        jobs = self.distributor.api.search(
-            'job',
-            filter=filter_and(
-                [f'state={[JOB_QUEUED, JOB_RUNNING]}'
-                 f"action='{job['action']}'",
-                 f"target-resource/href='{job['target-resource']['href']}'"]),
-            last=0)
-        return jobs.count > 0
-
     def new_deployments(self):
         try:
-            return self.distributor.api.search(
-                'deployment',
+            return list(search_all(
+                self.distributor.api, 'deployment',
                 filter=filter_and(["module/price!=null",
                                    "state='STARTED'",
                                    "created>'now-5m'"]),
-                select='id, owner, module',
-                last=10000).resources
+                select='id, owner, module'))
         except Exception as ex:
             logging.error(f'Failed to search for deployment: {ex}')
             return []
@@ -1,17 +1,57 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import time
 import logging
+import threading
 
 from concurrent.futures.thread import ThreadPoolExecutor
+from nuvla.api import Api
+from ..active_jobs import ActiveJobsIndex
+from ..distribution_config import DistributionConfig, distribution_arg
+from ..dry_run import ApiTraffic, DryRunReport, FixtureAdapter, ReadOnlyApi, ReadOnlyKazoo, \
+    measure
 from ..base import Base
+from ..distribution import ADD_CONCURRENCY
+from ..scheduler import DEFAULT_JITTER, MODES, MODE_FIXED_RATE, OVERRUN_POLICIES
+from ..util import override
 from ..distributions import get_distribution, distributions
 
+# Delay before restarting a failed distribution, doubled on each consecutive
+# failure. A distribution running for longer than the maximum delay before
+# failing is restarted with the minimum delay again.
+RESTART_BACKOFF_MIN = 1
+RESTART_BACKOFF_MAX = 300
+HEALTH_INTERVAL = 60
+
+STATE_RUNNING = 'running'
+STATE_RESTARTING = 'restarting'
+STATE_FINISHED = 'finished'
+
+
+class DistributionStatus(object):
+
+    def __init__(self):
+        self.state = STATE_RUNNING
+        self.started = time.monotonic()
+        self.restarts = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+
 
 class Distributor(Base):
     def __init__(self):
         super(Distributor, self).__init__()
         self.futures = {}
+        self.status = {}
+        self._pool = None
+        self._restart_timers = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._active_jobs = None
+        self._config = None
+        self.api_traffic = None
+        self.dry_run_report = None
 
     def _set_command_specific_options(self, parser):
         parser.add_argument(
@@ -20,32 +60,233 @@ class Distributor(Base):
                  '(e.g. --distribution-exclude cleanup_jobs usage_report)')
         parser.add_argument(
             '--distribution-interval', dest='distribution_interval', default=[], nargs='+',
-            metavar='DISTRIBUTION:INTERVAL',
+            type=distribution_arg('interval'), metavar='DISTRIBUTION:INTERVAL',
             help='Configure distributions interval in seconds '
                  '(e.g. --distribution-interval usage_report:20 deployment_state_new:5)')
+        parser.add_argument(
+            '--distribution-schedule', dest='distribution_schedule', default=[], nargs='+',
+            type=distribution_arg('schedule', 'overrun'), metavar='DISTRIBUTION:MODE[:OVERRUN]',
+            help=f'Configure distributions schedule mode ({", ".join(MODES)}) and, in '
+                 f'{MODE_FIXED_RATE} mode, what to do with missed cycles on overrun '
+                 f'({", ".join(OVERRUN_POLICIES)}) '
+                 f'(e.g. --distribution-schedule jobs_cleanup:fixed-delay usage_report:fixed-rate:catch-up)')
+        parser.add_argument(
+            '--distribution-jitter', dest='distribution_jitter', default=[], nargs='+',
+            type=distribution_arg('jitter'), metavar='DISTRIBUTION:FRACTION',
+            help=f'Configure distributions random delay of cycles, as a fraction of their '
+                 f'interval (default {DEFAULT_JITTER}) (e.g. --distribution-jitter usage_report:0.5)')
+        live_config = parser.add_mutually_exclusive_group()
+        live_config.add_argument(
+            '--distribution-config-zk', dest='distribution_config_zk', default=None,
+            metavar='PATH',
+            help='ZooKeeper node of a JSON distribution configuration overriding the '
+                 'above arguments, applied live (see distribution_config module)')
+        live_config.add_argument(
+            '--distribution-config-file', dest='distribution_config_file', default=None,
+            metavar='FILE',
+            help='File of a JSON distribution configuration overriding the above '
+                 'arguments, applied live (see distribution_config module)')
+        parser.add_argument(
+            '--dry-run', dest='dry_run', default=False, action='store_true',
+            help='Run every distribution once without adding jobs nor changing resources, '
+                 'and report the jobs they would distribute and the load they put on the '
+                 'Nuvla server (see dry_run module)')
+        parser.add_argument(
+            '--profile', dest='profile', default=False, action='store_true',
+            help='With --dry-run, log the functions taking most of the time of each distribution')
+        parser.add_argument(
+            '--dry-run-record', dest='dry_run_record', default=None, metavar='FILE',
+            help='With --dry-run, record the responses of the Nuvla server in a fixture file')
+        parser.add_argument(
+            '--dry-run-fixture', dest='dry_run_fixture', default=None, metavar='FILE',
+            help='With --dry-run, answer the requests with the responses recorded in a '
+                 'fixture file instead of connecting to the Nuvla server')
+
+    @override
+    def _api_pool_size(self):
+        # distributions add their jobs concurrently, but rarely at the same time
+        return ADD_CONCURRENCY + len([name for name in distributions
+                                      if name not in self.args.distribution_exclude])
+
+    @override
+    def _init_nuvla_api(self):
+        if not self.args.dry_run:
+            super(Distributor, self)._init_nuvla_api()
+            return
+        if self.args.dry_run_fixture:
+            self.api = Api(endpoint=self.args.api_url, persist_cookie=False,
+                           reauthenticate=False)
+            fixture_adapter = FixtureAdapter(self.args.dry_run_fixture)
+            self.api.session.mount('http://', fixture_adapter)
+            self.api.session.mount('https://', fixture_adapter)
+        else:
+            super(Distributor, self)._init_nuvla_api()
+        self.api_traffic = ApiTraffic(record=bool(self.args.dry_run_record))
+        self.api_traffic.watch(self.api.session)
+        self.api = ReadOnlyApi(self.api)
+
+    @override
+    def _init_kazoo(self):
+        super(Distributor, self)._init_kazoo()
+        if self.args.dry_run and self.kz:
+            self.kz = ReadOnlyKazoo(self.kz)
 
-    def check_and_recreate_thread_on_exception(self, thread):
-        for name, future in self.futures.items():
+    @override
+    def publish_metric(self, name, value):
+        if self.dry_run_report is not None:
+            self.dry_run_report.record(name, value)
+        super(Distributor, self).publish_metric(name, value)
+
+    @property
+    def active_jobs(self) -> ActiveJobsIndex:
+        """Index of the QUEUED and RUNNING jobs shared by the distributions."""
+        with self._lock:
+            if self._active_jobs is None:
+                self._active_jobs = ActiveJobsIndex(self.api)
+            return self._active_jobs
+
+    @property
+    def config(self) -> DistributionConfig:
+        """Configuration of the distributions, updated live."""
+        with self._lock:
+            if self._config is None:
+                self._config = DistributionConfig(self.args)
+            return self._config
+
+    def watch_config(self):
+        if self.args.distribution_config_zk:
+            self.config.watch_zk(self.kz, self.args.distribution_config_zk)
+        if self.args.distribution_config_file:
+            self.config.watch_file(self.args.distribution_config_file, self.stop_event)
+
+    def start_included_distributions(self):
+        """Starts the distributions not excluded and not started yet."""
+        with self._start_lock:
+            for distribution_name in distributions:
+                if distribution_name not in self.futures \
+                        and not self.config.excluded(distribution_name):
+                    self.start_distribution(distribution_name)
+
+    @staticmethod
+    def restart_delay(consecutive_failures):
+        return min(RESTART_BACKOFF_MIN * 2 ** max(consecutive_failures - 1, 0),
+                   RESTART_BACKOFF_MAX)
+
+    def start_distribution(self, name):
+        with self._lock:
+            if self.stop_event.is_set():
+                return
+            self._restart_timers.pop(name, None)
+            status = self.status.setdefault(name, DistributionStatus())
+            status.state = STATE_RUNNING
+            status.started = time.monotonic()
+            future = self._pool.submit(get_distribution(name), self)
+            self.futures[name] = future
+        future.add_done_callback(lambda f: self._on_distribution_done(name, f))
+
+    def _on_distribution_done(self, name, future):
+        """Called from the thread of the distribution when it ends."""
+        ex = future.exception()
+        with self._lock:
+            status = self.status[name]
+            if self.stop_event.is_set():
+                status.state = STATE_FINISHED
+                return
+            if ex is None:
+                logging.warning(f'Distribution {name} finished.')
+                status.state = STATE_FINISHED
+                return
+            if time.monotonic() - status.started > RESTART_BACKOFF_MAX:
+                status.consecutive_failures = 0
+            status.consecutive_failures += 1
+            status.restarts += 1
+            status.last_error = repr(ex)
+            status.state = STATE_RESTARTING
+            delay = self.restart_delay(status.consecutive_failures)
+            logging.error(f'Distribution {name} failed with: {repr(ex)}')
+            logging.warning(f'Restarting distribution {name} in {delay}s '
+                            f'(restart {status.restarts})')
+            timer = threading.Timer(delay, self.start_distribution, args=(name,))
+            timer.daemon = True
+            self._restart_timers[name] = timer
+            timer.start()
+        self.publish_counter('distributor.restarts', distribution=name)
+
+    def health(self):
+        """Summary of the state of the distributions, by distribution name."""
+        with self._lock:
+            return {name: {'state': status.state,
+                           'restarts': status.restarts,
+                           'last_error': status.last_error}
+                    for name, status in self.status.items()}
+
+    def publish_health(self):
+        health = self.health()
+        for state in (STATE_RUNNING, STATE_RESTARTING, STATE_FINISHED):
+            self.publish_metric(f'distributor.distributions.{state}',
+                                len([h for h in health.values() if h['state'] == state]))
+        unhealthy = {name: h for name, h in health.items() if h['state'] != STATE_RUNNING}
+        logging.info(f'Distributor {self.name}: {len(health) - len(unhealthy)}/{len(health)} '
+                     f'distributions running.')
+        for name, h in unhealthy.items():
+            logging.warning(f'Distribution {name} is {h["state"]} after {h["restarts"]} '
+                            f'restarts, last error: {h["last_error"]}')
+
+    def _stop_restart_timers(self):
+        with self._lock:
+            for timer in self._restart_timers.values():
+                timer.cancel()
+            self._restart_timers.clear()
+
+    def dry_run(self):
+        """Runs the included distributions once, one after the other, and
+        logs the report of the metrics they published."""
+        self.dry_run_report = DryRunReport()
+        # the index of active jobs is loaded once for all the distributions
+        try:
+            _, metrics = measure(self.api_traffic,
+                                 lambda: self.active_jobs.refresh(force=True))
+            for name, value in metrics.items():
+                self.publish_metric(f'job_distribution.active_jobs.dry_run.{name}', value)
+        except Exception as ex:
+            logging.error(f'Dry run failed to load active jobs: {repr(ex)}')
+            self.dry_run_report.error('active_jobs', ex)
+        for distribution_name in distributions:
+            if self.config.excluded(distribution_name):
+                continue
+            logging.info(f'Dry run of distribution {distribution_name}')
             try:
-                ex = future.exception(timeout=1)
-                if ex:
-                    logging.error(f'Distributor {name} failed with: {repr(ex)}')
-                    logging.warning(f'Restarting distributor {name}')
-                    self.futures[name] = thread.submit(get_distribution(name), self)
-            except TimeoutError:
-                pass
+                get_distribution(distribution_name)(self)
             except Exception as ex:
-                logging.error(f'Exception in distributor thread: {repr(ex)}')
+                logging.error(f'Dry run of distribution {distribution_name} '
+                              f'failed with: {repr(ex)}')
+                self.dry_run_report.error(distribution_name, ex)
+        if self.args.dry_run_record:
+            self.api_traffic.save(self.args.dry_run_record)
+        logging.info(f'Dry run report:\n{self.dry_run_report.render()}')
 
+    def run_distributions(self):
+        with ThreadPoolExecutor(max_workers=1000) as self._pool:
+            # excluded distributions are paused, and included ones started,
+            # when the configuration changes
+            self.config.add_listener(self.start_included_distributions)
+            self.watch_config()
+            self.start_included_distributions()
+            # distributions are restarted from their done callbacks, the main
+            # thread only reports their health until the distributor stops
+            while not self.stop_event.wait(HEALTH_INTERVAL):
+                try:
+                    self.publish_health()
+                except Exception as ex:
+                    logging.error(f'Failed to publish distributor health: {repr(ex)}')
+            self._stop_restart_timers()
+            self._pool.shutdown(wait=True)
+        logging.info('Distributor properly stopped.')
 
     def do_work(self):
         logging.info('I am distributor {}.'.format(self.name))
-        with ThreadPoolExecutor(max_workers=1000) as thread:
-            for distribution_name in distributions:
-                if distribution_name not in self.args.distribution_exclude:
-                    self.futures[distribution_name] = thread.submit(get_distribution(distribution_name), self)
-            while not self.stop_event.is_set():
-                self.check_and_recreate_thread_on_exception(thread)
-            thread.shutdown(wait=True)
-        logging.info('Distributor properly stopped.')
+        if self.args.dry_run:
+            self.dry_run()
+        else:
+            self.run_distributions()
         sys.exit(0)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+"""
+Dry run of the distributions, to size the load they put on the Nuvla server.
+
+Every distribution runs its job_generator once, one distribution after the
+other, against the Nuvla server or a fixture of recorded responses. Jobs are
+counted instead of being added, and the other requests changing resources
+(e.g. set-offline operations) are skipped, as are the ZooKeeper writes (e.g.
+job queue aging transactions). The number of requests, bytes
+transferred, wall time, jobs and duplicate jobs of each distribution are
+published as job_distribution.<distribution>.dry_run.* metrics, and the
+report is built from the metrics published during the dry run.
+
+Usage:
+
+    job_distributor.py --api-url https://nuvla.io --api-key ... --api-secret ... \\
+        --dry-run --profile --dry-run-record fixture.json
+    job_distributor.py --dry-run --dry-run-fixture fixture.json
+"""
+
+import io
+import json
+import time
+import pstats
+import logging
+import cProfile
+import threading
+
+from requests import Response
+from requests.adapters import BaseAdapter
+
+log = logging.getLogger('dry_run')
+
+WRITE_METHODS = ('add', 'edit', 'delete', 'operation',
+                 'add_bulk', 'edit_bulk', 'delete_bulk', 'operation_bulk')
+KZ_WRITE_METHODS = ('create', 'ensure_path', 'delete', 'set', 'set_acls')
+COLUMNS = ('api_calls', 'api_bytes', 'wall_time', 'jobs', 'duplicates')
+PROFILE_LINES = 20
+
+
+def _body(request):
+    body = request.body or b''
+    return body if isinstance(body, bytes) else body.encode()
+
+
+def request_key(request):
+    """Identifies a request in a fixture of recorded responses."""
+    return f'{request.method} {request.path_url} {_body(request).decode(errors="replace")}'.strip()
+
+
+class ReadOnlyApi(object):
+    """Api skipping the requests changing resources, only logged."""
+
+    def __init__(self, api):
+        self._api = api
+
+    def __getattr__(self, name):
+        if name in WRITE_METHODS:
+            def skipped(*args, **kwargs):
+                log.info(f'Dry run: skipped {name} {args}')
+            return skipped
+        return getattr(self._api, name)
+
+
+class ReadOnlyTransaction(object):
+    """ZooKeeper transaction skipping its operations on commit, only logged."""
+
+    def __init__(self):
+        self.operations = []
+
+    def __getattr__(self, name):
+        def operation(*args, **kwargs):
+            self.operations.append((name, args))
+        return operation
+
+    def commit(self):
+        log.info(f'Dry run: skipped transaction {self.operations}')
+        return [True] * len(self.operations)
+
+
+class ReadOnlyKazoo(object):
+    """Kazoo client skipping the writes, only logged."""
+
+    def __init__(self, kz):
+        self._kz = kz
+
+    def transaction(self):
+        return ReadOnlyTransaction()
+
+    def __getattr__(self, name):
+        if name in KZ_WRITE_METHODS:
+            def skipped(*args, **kwargs):
+                log.info(f'Dry run: skipped {name} {args}')
+            return skipped
+        return getattr(self._kz, name)
+
+
+class ApiTraffic(object):
+    """Counts the requests of an Api session and the bytes transferred, and
+    records their responses if asked to."""
+
+    def __init__(self, record=False):
+        self.calls = 0
+        self.bytes = 0
+        self.recorded = {} if record else None
+        self._lock = threading.Lock()
+
+    def watch(self, session):
+        session.hooks['response'].append(self._on_response)
+
+    def _on_response(self, response, *_args, **_kwargs):
+        size = len(response.content or b'') + len(_body(response.request))
+        with self._lock:
+            self.calls += 1
+            self.bytes += size
+            if self.recorded is not None:
+                self.recorded[request_key(response.request)] = {
+                    'status': response.status_code, 'content': response.text}
+        return response
+
+    def snapshot(self):
+        with self._lock:
+            return self.calls, self.bytes
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'responses': self.recorded or {}}, f, indent=2, sort_keys=True)
+        log.info(f'Recorded {len(self.recorded or {})} responses in {path}')
+
+
+class FixtureAdapter(BaseAdapter):
+    """Answers the requests with the responses recorded by ApiTraffic, and
+    with a 404 the requests not recorded."""
+
+    def __init__(self, path):
+        super(FixtureAdapter, self).__init__()
+        with open(path) as f:
+            self.responses = json.load(f)['responses']
+
+    def send(self, request, **_kwargs):
+        key = request_key(request)
+        recorded = self.responses.get(key)
+        if recorded is None:
+            log.warning(f'Dry run: no recorded response for {key}')
+            recorded = {'status': 404,
+                        'content': json.dumps({'status': 404, 'message': 'not recorded'})}
+        response = Response()
+        response.request = request
+        response.url = request.url
+        response.status_code = recorded['status']
+        response.headers['Content-Type'] = 'application/json'
+        response.encoding = 'utf-8'
+        response._content = recorded['content'].encode()
+        return response
+
+    def close(self):
+        pass
+
+
+def measure(traffic, f, profile=False):
+    """
+    Calls f and returns its result with the requests made and the bytes
+    transferred meanwhile and its wall time. With profile, the functions
+    taking most of the time are logged.
+    """
+    calls, size = traffic.snapshot()
+    profiler = cProfile.Profile() if profile else None
+    started = time.perf_counter()
+    result = profiler.runcall(f) if profiler else f()
+    wall_time = time.perf_counter() - started
+    end_calls, end_size = traffic.snapshot()
+    if profiler:
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        log.info(f'Profile of {getattr(f, "__qualname__", f)}:\n{stream.getvalue()}')
+    return result, {'api_calls': end_calls - calls,
+                    'api_bytes': end_size - size,
+                    'wall_time': round(wall_time, 3)}
+
+
+class DryRunReport(object):
+    """Metrics published during the dry run, by distribution."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, value):
+        parts = name.split('.')
+        if len(parts) < 3 or parts[0] != 'job_distribution':
+            return
+        metric = parts[-1] if parts[2] == 'dry_run' else '.'.join(parts[2:])
+        with self._lock:
+            self.metrics.setdefault(parts[1], {})[metric] = value
+
+    def error(self, distribution_name, ex):
+        with self._lock:
+            self.errors[distribution_name] = repr(ex)
+
+    def render(self):
+        with self._lock:
+            names = sorted(set(self.metrics) | set(self.errors))
+            rows = [('distribution',) + COLUMNS + ('other',)]
+            for name in names:
+                metrics = dict(self.metrics.get(name, {}))
+                row = tuple(str(metrics.pop(column, '-')) for column in COLUMNS)
+                other = ' '.join(f'{k}={v}' for k, v in sorted(metrics.items()))
+                if name in self.errors:
+                    other = f'{other} error={self.errors[name]}'.strip()
+                rows.append((name,) + row + (other,))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]) - 1)]
+        return '\n'.join(('  '.join(value.ljust(width) for value, width in zip(row, widths))
+                          + '  ' + row[-1]).rstrip() for row in rows)
@@ -1,19 +1,44 @@
 # -*- coding: utf-8 -*-
 
+import os
 import sys
+import time
 import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 from nuvla.api import Api
 
 from .. import JobRetrievedInFinalState, UnexpectedJobRetrieveError
-from ..actions import get_action, ActionNotImplemented
-from ..actions.utils.bulk_action import UnfinishedBulkActionToMonitor
+from ..actions import get_action, get_action_lane, get_action_priority, \
+    ActionNotImplemented, DEFAULT_LANE
+from ..actions.utils.bulk_action import BulkAction, UnfinishedBulkActionToMonitor
 from ..base import Base
+from ..job_queue import JOB_QUEUE_PATH, lane_queue_path, register_lane_consumer, \
+    lane_consumers, queue_depth
+from ..metrics import PhaseTimer, seconds_since
+from .prefetch import JobPrefetcher
 from ..job import Job, JobUpdateError, \
     JOB_FAILED, JOB_SUCCESS, JOB_QUEUED, JOB_RUNNING, JobNotFoundError, JobVersionNotYetSupported, \
-    JobVersionIsNoMoreSupported
+    JobVersionIsNoMoreSupported, PRIORITY_NORMAL
 from ..util import override, kazoo_execute_action_if_needed, status_message_from_exception
 
 
+# Seconds between two checks that a lane jobs are dispatched to is served
+LANE_CHECK_INTERVAL = 60
+
+
+def lane_arg(value):
+    """LANE[:CONCURRENCY] argument, as a (lane, concurrency or None) tuple."""
+    lane, _, concurrency = value.partition(':')
+    if not lane:
+        raise argparse.ArgumentTypeError(f'missing lane name in "{value}"')
+    try:
+        return lane, int(concurrency) if concurrency else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'lane concurrency should be an integer in "{value}"')
+
+
 class LocalOneJobQueue(object):
 
     def __init__(self, job_id):
@@ -33,14 +58,79 @@ class LocalOneJobQueue(object):
 class ActionRunException(Exception):
     pass
 
+
+# Exit paths of a job processing, used to label the job metrics
+EXIT_SUCCESS = 'success'
+EXIT_FAILED = 'failed'
+EXIT_RELEASED = 'released'
+EXIT_ERROR = 'error'
+
+CONSUMED_EXIT_PATHS = {ActionNotImplemented: 'not-implemented',
+                       JobRetrievedInFinalState: 'final-state',
+                       JobNotFoundError: 'not-found',
+                       JobVersionIsNoMoreSupported: 'unsupported-version',
+                       ActionRunException: EXIT_FAILED,
+                       UnfinishedBulkActionToMonitor: 'monitored'}
+
 class Executor(Base):
     def __init__(self):
         super(Executor, self).__init__()
         self.queue = None
+        self.queues = []
+        self.dispatch_queue = None
+        self.lane_queues = {}
+        self._lanes_checked_at = {}
+        self.prefetcher = None
+        # job id -> [queue, job] of the jobs being processed
+        self.in_flight = {}
+        self._in_flight_changed = threading.Condition()
 
     def _set_command_specific_options(self, parser):
         parser.add_argument('--job-id', dest='job_id', metavar='ID',
                             help='Pull mode single job id to execute')
+        parser.add_argument('--max-concurrent-jobs', dest='max_concurrent_jobs',
+                            type=int, default=1, metavar='N',
+                            help='Maximum number of jobs processed concurrently '
+                                 'by this executor (default: 1)')
+        parser.add_argument('--lanes', dest='lanes', default=[], nargs='+',
+                            type=lane_arg, metavar='LANE[:CONCURRENCY]',
+                            help='Only process jobs of actions declared in the given lanes. '
+                                 'Jobs received from the main queue are dispatched to their '
+                                 'lane queue. Every lane must be served by at least one '
+                                 'executor. Concurrency defaults to --max-concurrent-jobs '
+                                 '(e.g. --lanes fast:8 slow:2)')
+        parser.add_argument('--prefetch-jobs', dest='prefetch_jobs', type=int, default=10,
+                            metavar='N',
+                            help='Maximum number of queued job documents retrieved in one '
+                                 'request and kept in memory. 0 disables the prefetch '
+                                 '(default: 10)')
+        parser.add_argument('--prefetch-max-age', dest='prefetch_max_age', type=float,
+                            default=5.0, metavar='SECONDS',
+                            help='Prefetched job documents older than this are retrieved '
+                                 'again (default: 5)')
+        parser.add_argument('--job-update-interval', dest='job_update_interval', type=float,
+                            default=2.0, metavar='SECONDS',
+                            help='Progress and status message edits of a job are merged and '
+                                 'written at most every SECONDS. State changes are always '
+                                 'written immediately. 0 writes every edit (default: 2)')
+        parser.add_argument('--bulk-concurrency', dest='bulk_concurrency', type=int,
+                            default=BulkAction.concurrency, metavar='N',
+                            help='Maximum number of actions in flight of one bulk job '
+                                 f'(default: {BulkAction.concurrency})')
+        parser.add_argument('--bulk-user-concurrency', dest='bulk_user_concurrency', type=int,
+                            default=BulkAction.user_concurrency, metavar='N',
+                            help='Maximum number of actions in flight of all the bulk jobs '
+                                 'of a user processed by this executor '
+                                 f'(default: {BulkAction.user_concurrency})')
+        parser.add_argument('--bulk-push-interval', dest='bulk_push_interval', type=float,
+                            default=BulkAction.push_interval, metavar='SECONDS',
+                            help='Progress and result of bulk jobs are pushed every SECONDS '
+                                 f'(default: {BulkAction.push_interval})')
+        parser.add_argument('--drain-timeout', dest='drain_timeout', type=float,
+                            default=None, metavar='SECONDS',
+                            help='On stop, wait at most SECONDS for in-flight jobs to '
+                                 'finish, then put them back in QUEUED state, release them '
+                                 'to the queue and exit (default: wait until they finish)')
 
     @staticmethod
     def get_action_instance(job):
@@ -72,48 +162,270 @@ class Executor(Base):
             logging.error(f'Failed to process {job.id}, with error: {status_message}')
             raise ActionRunException()
 
-    @classmethod
-    def process_job(cls, api: Api, queue, nuvlaedge_shared_path, job_id: str):
+    def _build_job(self, api: Api, queue, nuvlaedge_shared_path, job_id: str):
+        prefetched = self.prefetcher.get(queue, job_id) if self.prefetcher else None
+        if prefetched:
+            return Job(job_id, api, nuvlaedge_shared_path,
+                       cimi_job=prefetched.cimi_job, context=prefetched.context)
+        return Job(job_id, api, nuvlaedge_shared_path)
+
+    def process_job(self, api: Api, queue, nuvlaedge_shared_path, job_id: str):
+        timer = PhaseTimer()
+        action_name = None
+        queue_action = 'consume'
+        self._track(job_id, queue)
         try:
             logging.info('Got new {}.'.format(job_id))
-            job = Job(job_id, api, nuvlaedge_shared_path)
-            logging.info(f'Process {job_id} with action {job.get("action")}.')
-            action_instance = cls.get_action_instance(job)
-            job.set_state(JOB_RUNNING)
-            return_code = cls.try_action_run(job, action_instance)
+            with timer.phase('fetch'):
+                job = self._build_job(api, queue, nuvlaedge_shared_path, job_id)
+            self._track(job_id, queue, job)
+            timer.add('queue_wait', seconds_since(job.get('created')))
+            action_name = job.get('action')
+            logging.info(f'Process {job_id} with action {action_name}.')
+            with timer.phase('construct'):
+                action_instance = self.get_action_instance(job)
+            with timer.phase('start'):
+                job.set_state(JOB_RUNNING)
+            with timer.phase('do_work'):
+                return_code = self.try_action_run(job, action_instance)
             state = JOB_SUCCESS if return_code == 0 else JOB_FAILED
-            job.update_job(state=state, return_code=return_code)
+            with timer.phase('final_update'):
+                job.update_job(state=state, return_code=return_code)
             logging.info(f'Finished {job_id} with return_code {return_code}.')
-            kazoo_execute_action_if_needed(queue, 'consume')
+            exit_path = EXIT_SUCCESS if return_code == 0 else EXIT_FAILED
         except (ActionNotImplemented,
                 JobRetrievedInFinalState,
                 JobNotFoundError,
                 JobVersionIsNoMoreSupported,
                 ActionRunException,
-                UnfinishedBulkActionToMonitor):
-            kazoo_execute_action_if_needed(queue, 'consume')
+                UnfinishedBulkActionToMonitor) as e:
+            exit_path = next(path for exception, path in CONSUMED_EXIT_PATHS.items()
+                             if isinstance(e, exception))
         except (JobUpdateError,
                 JobVersionNotYetSupported,
                 UnexpectedJobRetrieveError):
-            kazoo_execute_action_if_needed(queue, 'release')
+            queue_action = 'release'
+            exit_path = EXIT_RELEASED
         except Exception as e:
             logging.error(f'Unexpected exception occurred during process of {job_id}: {repr(e)}')
-            kazoo_execute_action_if_needed(queue, 'consume')
+            exit_path = EXIT_ERROR
+        self._untrack(job_id)
+        with timer.phase(queue_action):
+            kazoo_execute_action_if_needed(queue, queue_action)
+        self._publish_job_metrics(timer, action_name, exit_path)
 
+    def _track(self, job_id, queue, job=None):
+        with self._in_flight_changed:
+            self.in_flight[job_id] = [queue, job]
 
-    def process_jobs(self):
+    def _untrack(self, job_id):
+        with self._in_flight_changed:
+            self.in_flight.pop(job_id, None)
+            self._in_flight_changed.notify_all()
+
+    def hand_off_in_flight_jobs(self):
+        """
+        Puts the in-flight jobs back in QUEUED state and releases them to the
+        queue, so that another executor picks them up right away instead of
+        after the expiry of this executor ZooKeeper session. Jobs that reached
+        a final state in the meantime are consumed. Holds the in-flight lock
+        on return, so that workers can't consume or release these jobs anymore.
+        """
+        self._in_flight_changed.acquire()
+        for job_id, (queue, job) in self.in_flight.items():
+            if job is not None and job.is_in_final_state():
+                kazoo_execute_action_if_needed(queue, 'consume')
+                continue
+            if job is not None:
+                status_message = f'Executor {self.name} stopped before the end of the job ' \
+                                 f'(progress {job.get("progress", 0)}%), job queued again.'
+                try:
+                    job.update_job(state=JOB_QUEUED, status_message=status_message)
+                except Exception as e:
+                    logging.error(f'Failed to set {job_id} back to queued state: {repr(e)}')
+            logging.warning(f'Hand off in-flight {job_id}.')
+            kazoo_execute_action_if_needed(queue, 'release')
+
+    def drain_on_stop(self, drain_timeout):
+        """
+        Once the stop event is set, waits at most drain_timeout seconds for
+        the in-flight jobs to finish. If some are still running, they are
+        handed off and the process exits without waiting for them.
+        """
+        Executor.stop_event.wait()
+        with self._in_flight_changed:
+            logging.info(f'Executor {self.name} draining {len(self.in_flight)} in-flight '
+                         f'jobs for up to {drain_timeout}s.')
+            if self._in_flight_changed.wait_for(lambda: not self.in_flight, drain_timeout):
+                return
+        self.hand_off_in_flight_jobs()
+        try:
+            if self.kz:
+                self.kz.stop()
+        except Exception as e:
+            logging.error(f'Failed to stop ZooKeeper client: {repr(e)}')
+        logging.info(f'Executor {self.name} stopped after drain timeout.')
+        logging.shutdown()
+        # workers are still busy with the handed off jobs
+        os._exit(0)
+
+    def _publish_job_metrics(self, timer: PhaseTimer, action_name, exit_path):
+        try:
+            action_name = action_name or 'unknown'
+            for phase, seconds in timer.phases.items():
+                self.publish_timer(f'executor.job.{phase}', seconds,
+                                   action=action_name, exit=exit_path)
+            self.publish_counter('executor.job', action=action_name, exit=exit_path)
+        except Exception as e:
+            logging.warning(f'Failed to publish job metrics: {repr(e)}')
+
+    def _lane_queue(self, lane):
+        if lane not in self.lane_queues:
+            self.lane_queues[lane] = self.kz.LockingQueue(lane_queue_path(lane))
+        return self.lane_queues[lane]
+
+    def _dispatched_job(self, queue, job_id):
+        """Document of a job to dispatch, from the prefetched ones when available."""
+        prefetched = self.prefetcher.peek(queue, job_id) if self.prefetcher else None
+        if prefetched:
+            return prefetched.cimi_job
+        return self.api.get(job_id, select='action,priority')
+
+    def check_lane_consumer(self, lane):
+        """
+        Jobs of a lane no executor is subscribed to wait forever: it is
+        reported with a warning and the depth of the lane queue, at most every
+        LANE_CHECK_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if now - self._lanes_checked_at.get(lane, -LANE_CHECK_INTERVAL) < LANE_CHECK_INTERVAL:
+            return
+        self._lanes_checked_at[lane] = now
+        try:
+            served = bool(lane_consumers(self.kz, lane))
+            depth = 0 if served else queue_depth(self.kz, lane_queue_path(lane))
+        except Exception as e:
+            logging.warning(f'Unable to check consumers of lane {lane}: {repr(e)}')
+            return
+        if not served:
+            logging.warning(f'No executor subscribed to lane {lane}: '
+                            f'{depth} jobs waiting in {lane_queue_path(lane)}.')
+        self.publish_metric(f'executor.lanes.{lane}.unserved_depth', depth)
+
+    def dispatch_job(self, queue, job_id: str):
+        """
+        Move a job from the main queue to the queue of the lane of its action.
+        When the action can't be resolved, the job goes to the default lane
+        where the usual job retrieval error handling applies.
+        """
+        lane = DEFAULT_LANE
+        priority = PRIORITY_NORMAL
+        try:
+            cimi_job = self._dispatched_job(queue, job_id)
+            action_name = cimi_job.data.get('action')
+            lane = get_action_lane(action_name)
+            priority = cimi_job.data.get('priority', get_action_priority(action_name))
+        except Exception as e:
+            logging.warning(f'Unable to resolve lane of {job_id}, dispatched '
+                            f'to default lane: {repr(e)}')
+        try:
+            self._lane_queue(lane).put(job_id.encode(), priority)
+            logging.info(f'Dispatched {job_id} to lane {lane}.')
+            kazoo_execute_action_if_needed(queue, 'consume')
+        except Exception as e:
+            logging.error(f'Failed to dispatch {job_id} to lane {lane}: {repr(e)}')
+            kazoo_execute_action_if_needed(queue, 'release')
+            return
+        self.check_lane_consumer(lane)
+
+    @staticmethod
+    def _queue_loop(queue, handle):
         while not Executor.stop_event.is_set():
             # queue timeout 5s to give a chance to exit the job executor
             # if no job is being received
-            job_id =  self.queue.get(timeout=5)
+            job_id = queue.get(timeout=5)
             if job_id:
-                self.process_job(self.api, self.queue, self.args.nuvlaedge_fs, job_id.decode())
+                handle(queue, job_id.decode())
+
+    def process_queue(self, queue):
+        self._queue_loop(queue, lambda q, job_id: self.process_job(
+            self.api, q, self.args.nuvlaedge_fs, job_id))
+
+    def dispatch_queue_to_lanes(self, queue):
+        self._queue_loop(queue, self.dispatch_job)
+
+    def process_queues_concurrently(self):
+        """
+        Each worker owns its own LockingQueue instance because a kazoo
+        LockingQueue holds at most one locked element at a time. Workers stop
+        taking new jobs once the stop event is set and the pool is only left
+        when all in-flight jobs are consumed or released. A failing worker
+        stops the others, as a failure in the single queue loop would do.
+        """
+        logging.info(f'Executor {self.name} processing up to '
+                     f'{len(self.queues)} jobs concurrently.')
+        workers = [(self.process_queue, queue) for queue in self.queues]
+        if self.dispatch_queue:
+            workers.append((self.dispatch_queue_to_lanes, self.dispatch_queue))
+        with ThreadPoolExecutor(max_workers=len(workers),
+                                thread_name_prefix='job-worker') as pool:
+            futures = [pool.submit(worker, queue) for worker, queue in workers]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            Executor.stop_event.set()
+        for future in done:
+            if future.exception():
+                raise future.exception()
+
+    def process_jobs(self):
+        if len(self.queues) > 1 or self.dispatch_queue:
+            self.process_queues_concurrently()
+        else:
+            self.process_queue(self.queue)
         logging.info(f'Executor {self.name} properly stopped.')
         sys.exit(0)
 
+    @override
+    def _api_pool_size(self):
+        lanes = self._parse_lanes()
+        workers = sum(lanes.values()) + 1 if lanes else self.args.max_concurrent_jobs
+        # the prefetcher retrieves contexts in the background
+        return workers + 2
+
+    def _parse_lanes(self):
+        return {lane: self.args.max_concurrent_jobs if concurrency is None else concurrency
+                for lane, concurrency in self.args.lanes}
+
+    def _build_queues(self):
+        lanes = self._parse_lanes()
+        if lanes:
+            logging.info(f'Executor {self.name} subscribed to lanes {lanes}.')
+            self.dispatch_queue = self.kz.LockingQueue(JOB_QUEUE_PATH)
+            for lane in lanes:
+                register_lane_consumer(self.kz, lane, self.name)
+            return [self.kz.LockingQueue(lane_queue_path(lane))
+                    for lane, concurrency in lanes.items()
+                    for _ in range(max(concurrency, 1))]
+        max_concurrent_jobs = max(self.args.max_concurrent_jobs, 1)
+        return [self.kz.LockingQueue(JOB_QUEUE_PATH) for _ in range(max_concurrent_jobs)]
+
     @override
     def do_work(self):
         logging.info('I am executor {}.'.format(self.name))
+        Job.update_interval = self.args.job_update_interval
+        BulkAction.concurrency = max(self.args.bulk_concurrency, 1)
+        BulkAction.user_concurrency = max(self.args.bulk_user_concurrency, 1)
+        BulkAction.push_interval = self.args.bulk_push_interval
+        if self.args.drain_timeout is not None:
+            threading.Thread(target=self.drain_on_stop, args=(self.args.drain_timeout,),
+                             name='drain', daemon=True).start()
         job_id = self.args.job_id
-        self.queue = LocalOneJobQueue(job_id) if job_id else self.kz.LockingQueue('/job')
+        if job_id:
+            self.queue = LocalOneJobQueue(job_id)
+        else:
+            self.queues = self._build_queues()
+            self.queue = self.queues[0]
+            if self.args.prefetch_jobs > 1:
+                self.prefetcher = JobPrefetcher(self.api, self.kz,
+                                                max_size=self.args.prefetch_jobs,
+                                                max_age=self.args.prefetch_max_age)
         self.process_jobs()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ..actions import action_uses_context
+
+log = logging.getLogger('prefetch')
+
+
+class PrefetchedJob(object):
+
+    def __init__(self, cimi_job):
+        self.cimi_job = cimi_job
+        self.fetched_at = time.monotonic()
+        self.context = None
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class JobPrefetcher(object):
+    """
+    Cache of the job documents of the next entries of a LockingQueue.
+
+    On a cache miss, the ids of the next unlocked entries of the queue are
+    peeked in ZooKeeper and their job documents are retrieved, together with
+    the missed one, with a single search. Contexts of actions known to use
+    them are retrieved in the background. Documents are only served while
+    they are younger than `max_age` seconds, and at most `max_size` of them
+    are kept.
+
+    The peek is not atomic with the locking done by other executors, so
+    documents of jobs taken elsewhere may be fetched for nothing; they are
+    evicted once stale.
+    """
+
+    def __init__(self, api, kz, max_size=10, max_age=5.0, context_workers=2):
+        self.api = api
+        self.kz = kz
+        self.max_size = max_size
+        self.max_age = max_age
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._context_pool = ThreadPoolExecutor(max_workers=context_workers,
+                                                thread_name_prefix='job-prefetch') \
+            if context_workers > 0 else None
+
+    def _pop_fresh(self, job_id):
+        with self._lock:
+            prefetched = self._cache.pop(job_id, None)
+        if prefetched and prefetched.age() < self.max_age:
+            return prefetched
+        return None
+
+    def _evict(self):
+        with self._lock:
+            for job_id in [job_id for job_id, prefetched in self._cache.items()
+                           if prefetched.age() >= self.max_age]:
+                del self._cache[job_id]
+            while len(self._cache) > self.max_size:
+                del self._cache[next(iter(self._cache))]
+
+    def _next_job_ids(self, queue_path, exclude):
+        entries_path = f'{queue_path}/entries'
+        entries = sorted(self.kz.get_children(entries_path))
+        taken = set(self.kz.get_children(f'{queue_path}/taken'))
+        job_ids = []
+        for entry in entries:
+            if len(job_ids) >= self.max_size - 1:
+                break
+            if entry in taken:
+                continue
+            try:
+                job_id = self.kz.get(f'{entries_path}/{entry}')[0].decode()
+            except Exception:
+                # entry consumed in the meantime
+                continue
+            with self._lock:
+                cached = job_id in self._cache
+            if job_id != exclude and not cached:
+                job_ids.append(job_id)
+        return job_ids
+
+    def _fetch_context(self, prefetched):
+        try:
+            prefetched.context = self.api.operation(prefetched.cimi_job, 'get-context').data
+        except Exception as e:
+            log.debug(f'Speculative context retrieval of {prefetched.cimi_job.id} failed: {repr(e)}')
+
+    def _fetch(self, job_id, next_job_ids):
+        job_ids = [job_id] + next_job_ids
+        jobs = self.api.search('job', filter=f'id={job_ids}', last=len(job_ids)).resources
+        fetched = {}
+        for cimi_job in jobs:
+            prefetched = PrefetchedJob(cimi_job)
+            if self._context_pool and cimi_job.id != job_id \
+                    and action_uses_context(cimi_job.data.get('action')):
+                self._context_pool.submit(self._fetch_context, prefetched)
+            fetched[cimi_job.id] = prefetched
+        return fetched
+
+    def get(self, queue, job_id):
+        """
+        Returns the prefetched job document of job_id, or None when it isn't
+        available and has to be retrieved by the Job itself.
+        """
+        prefetched = self._pop_fresh(job_id)
+        if prefetched or not hasattr(queue, 'path'):
+            return prefetched
+        with self._fetch_lock:
+            prefetched = self._pop_fresh(job_id)
+            if prefetched:
+                return prefetched
+            try:
+                next_job_ids = self._next_job_ids(queue.path, job_id)
+                if not next_job_ids:
+                    # nothing to batch with, a plain get is cheaper than a search
+                    return None
+                fetched = self._fetch(job_id, next_job_ids)
+            except Exception as e:
+                log.warning(f'Failed to prefetch jobs from {queue.path}: {repr(e)}')
+                return None
+        prefetched = fetched.pop(job_id, None)
+        with self._lock:
+            self._cache.update(fetched)
+        self._evict()
+        log.debug(f'Prefetched {len(fetched)} jobs from {queue.path}.')
+        return prefetched
+
+    def peek(self, queue, job_id):
+        """
+        Same as get, but the job document stays cached for the executor that
+        will process job_id.
+        """
+        prefetched = self.get(queue, job_id)
+        if prefetched:
+            with self._lock:
+                self._cache[job_id] = prefetched
+        return prefetched
@@ -3,8 +3,10 @@
 import json
 import time
 import logging
-from nuvla.api import Api, NuvlaError, ConnectionError
+import threading
+from nuvla.api import NuvlaError, ConnectionError
 
+from .api_pool import pooled_api
 from .version import Version, JobVersionNotYetSupported, JobVersionIsNoMoreSupported
 
 log = logging.getLogger('job')
@@ -17,6 +19,16 @@ JOB_CANCELED = 'CANCELED'
 
 STATES = (JOB_QUEUED, JOB_RUNNING, JOB_FAILED, JOB_SUCCESS, JOB_CANCELED)
 
+# Priority of a job in the queue, lower values are served first (0-999).
+PRIORITY_HIGH = 50
+PRIORITY_NORMAL = 100
+PRIORITY_LOW = 500
+PRIORITY_LOWEST = 999
+
+# Attributes only reporting the progression of a job. When write-behind is
+# enabled, edits touching only these attributes are coalesced.
+DEFERRABLE_ATTRIBUTES = ('progress', 'status-message')
+
 class JobNotFoundError(Exception):
     pass
 
@@ -30,22 +42,38 @@ class UnexpectedJobRetrieveError(Exception):
     pass
 
 class Job(dict):
-
-    def __init__(self, id, api, nuvlaedge_shared_path=None):
+    # Write-behind of deferrable edits: pending edits are merged and written at
+    # most every `update_interval` seconds, or once `update_max_pending` edits
+    # are pending. Any other edit writes the pending ones with it.
+    # 0 disables the write-behind.
+    update_interval = 0
+    update_max_pending = 50
+
+    def __init__(self, id, api, nuvlaedge_shared_path=None, cimi_job=None, context=None):
+        """
+        cimi_job and context can be given when they were already retrieved
+        (e.g. prefetched by the executor) to save the corresponding requests.
+        """
         super(Job, self).__init__()
         self.id = id
-        self.cimi_job = None
+        self.cimi_job = cimi_job
         self.api = api
         self.nuvlaedge_shared_path = nuvlaedge_shared_path
 
-        self._context = None
+        self._context = context
         self._payload = None
 
+        self._edit_lock = threading.RLock()
+        self._pending = {}
+        self._pending_count = 0
+        self._flush_timer = None
+
         self._init()
 
     def _init(self):
         try:
-            self.cimi_job = self.get_cimi_job(self.id)
+            if self.cimi_job is None:
+                self.cimi_job = self.get_cimi_job(self.id)
             dict.__init__(self, self.cimi_job.data)
             self._job_version_check()
             if self.is_in_final_state():
@@ -169,15 +197,56 @@ class Job(dict):
         if attributes:
             self._edit_job_multi(attributes)
 
-    def __edit(self, attributes):
+    def __write(self, attributes):
         try:
             response = self.api.edit(self.id, attributes)
         except (NuvlaError, ConnectionError):
             logging.error(f'Failed to update following attributes "{attributes}" for {self.id}!')
             raise JobUpdateError()
         else:
+            self._pending = {}
+            self._pending_count = 0
             self.update(response.data)
 
+    def _cancel_flush_timer(self):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def _defer(self, attributes):
+        self._pending.update(attributes)
+        self._pending_count += 1
+        dict.update(self, attributes)
+        if self._pending_count >= self.update_max_pending:
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.update_interval, self._flush_on_timer)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except JobUpdateError:
+            # pending edits are kept and written with the next edit
+            pass
+
+    def flush(self):
+        """Writes the pending deferred edits, if any."""
+        with self._edit_lock:
+            self._cancel_flush_timer()
+            if self._pending:
+                self.__write(dict(self._pending))
+
+    def __edit(self, attributes):
+        with self._edit_lock:
+            if self.update_interval > 0 \
+                    and all(k in DEFERRABLE_ATTRIBUTES for k in attributes):
+                self._defer(attributes)
+            else:
+                self._cancel_flush_timer()
+                self.__write({**self._pending, **attributes})
+
     def _edit_job(self, attribute_name, attribute_value):
         self.__edit({attribute_name: attribute_value})
 
@@ -201,12 +270,10 @@ class Job(dict):
         return self._payload
 
     def get_api(self, authn_info):
-        insecure = not self.api.session.verify
-        return Api(endpoint=self.api.endpoint, insecure=insecure,
-                   persist_cookie=False, reauthenticate=True,
-                   authn_header=f'{authn_info["user-id"]} '
-                                f'{authn_info["active-claim"]} '
-                                f'{" ".join(authn_info["claims"])}')
+        return pooled_api(self.api,
+                          authn_header=f'{authn_info["user-id"]} '
+                                       f'{authn_info["active-claim"]} '
+                                       f'{" ".join(authn_info["claims"])}')
 
     def get_user_api(self):
         authn_info = self.payload['authn-info']
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers for the ZooKeeper LockingQueue(s) holding the ids of jobs to execute.
+
+Entries are named `entry-<priority>-<sequence>` by kazoo, with priority on
+3 digits. Lower priorities are served first.
+"""
+
+import logging
+import time
+
+JOB_QUEUE_PATH = '/job'
+LANE_QUEUE_PATH = '/job-lane'
+LANE_CONSUMERS_PATH = '/job-lane-consumers'
+
+log = logging.getLogger('job_queue')
+
+
+def lane_queue_path(lane):
+    return f'{LANE_QUEUE_PATH}/{lane}'
+
+
+def register_lane_consumer(kz, lane, name):
+    """Tells the dispatchers that lane is served, for the ZooKeeper session."""
+    kz.create(f'{LANE_CONSUMERS_PATH}/{lane}/{name}-', ephemeral=True, sequence=True,
+              makepath=True)
+
+
+def lane_consumers(kz, lane):
+    path = f'{LANE_CONSUMERS_PATH}/{lane}'
+    return kz.get_children(path) if kz.exists(path) else []
+
+
+def queue_depth(kz, queue_path):
+    entries_path = f'{queue_path}/entries'
+    return len(kz.get_children(entries_path)) if kz.exists(entries_path) else 0
+
+
+def queue_paths(kz):
+    """Main job queue path followed by the existing lane queue paths."""
+    paths = [JOB_QUEUE_PATH]
+    if kz.exists(LANE_QUEUE_PATH):
+        paths += [lane_queue_path(lane) for lane in sorted(kz.get_children(LANE_QUEUE_PATH))]
+    return paths
+
+
+def entry_priority(entry):
+    return int(entry.split('-')[1])
+
+
+def aged_priority(priority, waited, aging_interval, aging_step, floor):
+    """
+    Priority of an entry that waited `waited` seconds in the queue: it gains
+    `aging_step` every `aging_interval` seconds, but never goes below `floor`.
+    """
+    if priority <= floor:
+        return priority
+    return max(priority - int(waited // aging_interval) * aging_step, floor)
+
+
+def requeue_entry(kz, queue_path, entry, value, priority):
+    """
+    Atomically replaces an unlocked entry by a new one with the given priority.
+    Creating the entry lock in the transaction makes it fail if the entry was
+    taken by an executor in the meantime.
+    """
+    entries_path = f'{queue_path}/entries'
+    lock_path = f'{queue_path}/taken/{entry}'
+    transaction = kz.transaction()
+    transaction.create(lock_path, ephemeral=True)
+    transaction.create(f'{entries_path}/entry-{priority:03d}-', value, sequence=True)
+    transaction.delete(f'{entries_path}/{entry}')
+    transaction.delete(lock_path)
+    results = transaction.commit()
+    return not any(isinstance(result, Exception) for result in results)
+
+
+def age_queue_entries(kz, queue_path, aging_interval, aging_step, floor,
+                      declared_priorities=None):
+    """
+    Promotes the entries of a queue waiting for longer than aging_interval,
+    so that low priority jobs can't be starved by higher priority ones.
+    Entries are also promoted to the priority declared for their job, given
+    by declared_priorities (list of job ids -> {job id: priority}), as jobs
+    queued by the server don't get the priority declared by their action.
+    Returns the number of promoted entries.
+    """
+    entries_path = f'{queue_path}/entries'
+    if not kz.exists(entries_path):
+        return 0
+    taken = set(kz.get_children(f'{queue_path}/taken'))
+    now = time.time()
+    waiting = []
+    for entry in kz.get_children(entries_path):
+        if entry in taken:
+            continue
+        try:
+            priority = entry_priority(entry)
+            value, stat = kz.get(f'{entries_path}/{entry}')
+        except Exception:
+            # unexpected entry name or entry consumed in the meantime
+            continue
+        waiting.append((entry, priority, value, stat))
+    declared = {}
+    if declared_priorities and waiting:
+        declared = declared_priorities([value.decode() for _, _, value, _ in waiting])
+    promoted = 0
+    for entry, priority, value, stat in waiting:
+        new_priority = aged_priority(priority, now - stat.ctime / 1000,
+                                     aging_interval, aging_step, floor)
+        new_priority = min(new_priority, declared.get(value.decode(), new_priority))
+        if new_priority < priority and requeue_entry(kz, queue_path, entry, value, new_priority):
+            log.debug(f'Promoted {value} in {queue_path} from priority '
+                      f'{priority} to {new_priority}.')
+            promoted += 1
+    return promoted
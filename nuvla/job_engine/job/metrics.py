@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timers and counters published through StatsD and, optionally, exposed in
+the Prometheus text format on an http endpoint.
+
+StatsD has no labels, their values are appended to the metric name
+(e.g. executor.job.do_work.deployment_start.success). Prometheus metrics
+are named nuvla_<name> with dots replaced by underscores and get labels.
+"""
+
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger('metrics')
+
+STATSD_UNSAFE_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def statsd_name(name, labels):
+    return '.'.join([name] + [STATSD_UNSAFE_RE.sub('_', str(v)) for v in labels.values()])
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _prometheus_series(name, labels):
+    if not labels:
+        return name
+    labels_str = ','.join(f'{k}="{_escape_label_value(v)}"' for k, v in sorted(labels.items()))
+    return f'{name}{{{labels_str}}}'
+
+
+class PrometheusMetrics(object):
+    """In memory counters, gauges and summaries (sum and count) rendered in
+    the Prometheus text exposition format."""
+
+    def __init__(self, namespace='nuvla'):
+        self.namespace = namespace
+        self._types = {}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _name(self, name, suffix=''):
+        return f'{self.namespace}_{name.replace(".", "_").replace("-", "_")}{suffix}'
+
+    def _key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, labels=None):
+        name = self._name(name, '_total')
+        with self._lock:
+            self._types[name] = 'counter'
+            key = self._key(name, labels or {})
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        name = self._name(name)
+        with self._lock:
+            self._types[name] = 'gauge'
+            self._values[self._key(name, labels or {})] = value
+
+    def observe(self, name, seconds, labels=None):
+        name = self._name(name, '_seconds')
+        with self._lock:
+            self._types[name] = 'summary'
+            key = self._key(name, labels or {})
+            total, count = self._values.get(key, (0.0, 0))
+            self._values[key] = (total + seconds, count + 1)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+            types = dict(self._types)
+        lines = []
+        current = None
+        for (name, labels), value in values:
+            if name != current:
+                lines.append(f'# TYPE {name} {types[name]}')
+                current = name
+            labels = dict(labels)
+            if types[name] == 'summary':
+                lines.append(f'{_prometheus_series(name + "_sum", labels)} {value[0]}')
+                lines.append(f'{_prometheus_series(name + "_count", labels)} {value[1]}')
+            else:
+                lines.append(f'{_prometheus_series(name, labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def start_prometheus_server(metrics: PrometheusMetrics, port, host=''):
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='prometheus-metrics',
+                     daemon=True).start()
+    log.info(f'Prometheus metrics exposed on port {server.server_port}.')
+    return server
+
+
+def seconds_since(timestamp):
+    """Seconds elapsed since a Nuvla timestamp (e.g. 2024-01-31T12:00:00.000Z),
+    or None if it can't be parsed."""
+    try:
+        then = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        return max((datetime.now(timezone.utc) - then).total_seconds(), 0.0)
+    except (AttributeError, ValueError):
+        return None
+
+
+class PhaseTimer(object):
+    """Durations in seconds of the successive phases of a job processing."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        if seconds is not None:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""
+Keyset pagination of Nuvla searches.
+
+Nuvla searches return at most 10000 resources (first + last <= 10000).
+Resources are instead read by pages ordered by id, each page starting after
+the id of the last resource of the previous one. The next page is fetched
+in the background while the current one is processed, so that at most two
+pages are held in memory.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from nuvla.api.util.filter import filter_and
+
+PAGE_SIZE = 1000
+
+
+def _with_id(select):
+    if not select:
+        return select
+    fields = [f.strip() for f in select.split(',')] if isinstance(select, str) else list(select)
+    return fields if 'id' in fields else ['id'] + fields
+
+
+def _page_filter(filter_str, after):
+    if after is None:
+        return filter_str
+    after_filter = f"id>'{after}'"
+    return filter_and([filter_str, after_filter]) if filter_str else after_filter
+
+
+def search_pages(api, resource_type, filter=None, select=None, page_size=PAGE_SIZE,
+                 prefetch=True):
+    """Yields the resources matching filter, by lists of at most page_size."""
+    select = _with_id(select)
+
+    def fetch(after):
+        kwargs = {'filter': _page_filter(filter, after), 'orderby': 'id:asc', 'last': page_size}
+        if select:
+            kwargs['select'] = select
+        return api.search(resource_type, **kwargs).resources
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search-prefetch') \
+        if prefetch else None
+    try:
+        page = fetch(None)
+        while page:
+            is_last_page = len(page) < page_size
+            next_page = None
+            if not is_last_page and executor:
+                next_page = executor.submit(fetch, page[-1].id)
+            yield page
+            if is_last_page:
+                break
+            page = next_page.result() if next_page else fetch(page[-1].id)
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def search_all(api, resource_type, filter=None, select=None, page_size=PAGE_SIZE,
+               prefetch=True):
+    """Yields the resources matching filter, whatever their number."""
+    for page in search_pages(api, resource_type, filter, select, page_size, prefetch):
+        yield from page
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scheduling of the cycles of the distributions.
+
+In fixed-rate mode, cycles are scheduled on ticks every `interval` seconds
+from the start, whatever their duration, so the schedule doesn't drift.
+When a cycle overruns the next tick, the missed ticks are either skipped or
+caught up by running the next cycles right away (at most MAX_CATCH_UP of
+them). In fixed-delay mode, a cycle is scheduled `interval` seconds after the
+end of the previous one.
+
+Every cycle runs after its tick plus a random delay of up to `jitter` times
+the interval, so that distributions started together don't hit the Nuvla
+server at the same time.
+"""
+
+import time
+import random
+
+MODE_FIXED_RATE = 'fixed-rate'
+MODE_FIXED_DELAY = 'fixed-delay'
+MODES = (MODE_FIXED_RATE, MODE_FIXED_DELAY)
+
+OVERRUN_SKIP = 'skip'
+OVERRUN_CATCH_UP = 'catch-up'
+OVERRUN_POLICIES = (OVERRUN_SKIP, OVERRUN_CATCH_UP)
+
+DEFAULT_JITTER = 0.1
+MAX_CATCH_UP = 3
+
+
+class Schedule(object):
+
+    def __init__(self, interval, mode=MODE_FIXED_RATE, overrun_policy=OVERRUN_SKIP,
+                 jitter=DEFAULT_JITTER, clock=time.monotonic, rand=random.random):
+        if mode not in MODES:
+            raise ValueError(f'schedule mode should be one of {MODES}')
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError(f'overrun policy should be one of {OVERRUN_POLICIES}')
+        self.interval = interval
+        self.mode = mode
+        self.overrun_policy = overrun_policy
+        self.jitter = jitter
+        self.clock = clock
+        self.rand = rand
+        self.next_tick = None
+        self.run_at = None
+
+    def _jittered(self, tick):
+        return tick + self.rand() * self.jitter * self.interval
+
+    def start(self):
+        self.next_tick = self.clock()
+        self.run_at = self._jittered(self.next_tick)
+
+    def update(self, interval, mode, overrun_policy, jitter):
+        """Changes the schedule, the pending cycle being moved to the new
+        interval."""
+        if mode not in MODES or overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError(f'bad schedule {mode} {overrun_policy}')
+        if self.next_tick is not None and interval != self.interval:
+            self.next_tick += interval - self.interval
+            self.run_at += interval - self.interval
+        self.interval = interval
+        self.mode = mode
+        self.overrun_policy = overrun_policy
+        self.jitter = jitter
+
+    def wait_time(self):
+        """Seconds to wait before running the next cycle."""
+        return max(self.run_at - self.clock(), 0)
+
+    def cycle_done(self, started):
+        """
+        Schedules the cycle following the one started at `started` and just
+        done. Returns the overrun of the cycle in seconds and the number of
+        skipped ticks.
+        """
+        now = self.clock()
+        overrun = max(now - started - self.interval, 0) if self.interval > 0 else 0
+        skipped = 0
+        if self.mode == MODE_FIXED_DELAY or self.interval <= 0:
+            self.next_tick = now + self.interval
+        else:
+            self.next_tick += self.interval
+            if now > self.next_tick:
+                late_ticks = int((now - self.next_tick) // self.interval)
+                if self.overrun_policy == OVERRUN_SKIP:
+                    skipped = late_ticks + 1
+                elif late_ticks > MAX_CATCH_UP:
+                    skipped = late_ticks - MAX_CATCH_UP
+                self.next_tick += skipped * self.interval
+        self.run_at = self._jittered(self.next_tick)
+        return overrun, skipped
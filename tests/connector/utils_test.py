@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 
+import os
+import threading
 import unittest
 
 from nuvla.job_engine.connector.utils import (remove_protocol_from_url,
                                    extract_host_from_url,
+                                   run_in_tmp_dir,
+                                   timeout,
                                    LOCAL)
 
 
@@ -34,3 +38,32 @@ class TestConnectorUtils(unittest.TestCase):
                          extract_host_from_url('http://127.0.0.1'))
         self.assertEqual('localhost',
                          extract_host_from_url('localhost'))
+
+    def test_timeout_in_thread(self):
+        raised = []
+
+        def wait():
+            try:
+                with timeout(0) as deadline:
+                    while True:
+                        deadline.check()
+            except TimeoutError:
+                raised.append(True)
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([True], raised)
+
+    def test_run_in_tmp_dir_keeps_cwd(self):
+        cwd = os.getcwd()
+
+        @run_in_tmp_dir
+        def func(**kwargs):
+            self.assertEqual(cwd, os.getcwd())
+            return kwargs['work_dir']
+
+        work_dir = func()
+        self.assertNotEqual(cwd, work_dir)
+        self.assertFalse(os.path.exists(work_dir))
@@ -1,16 +1,22 @@
 #!/usr/bin/env python
 import json
+import threading
+import time
 import unittest
+from unittest.mock import MagicMock
 
+from nuvla.job_engine.job.actions.utils import bulk_action
 from nuvla.job_engine.job.actions.utils.bulk_action import \
-    BulkActionResult
+    BulkAction, BulkActionResult, SkippedActionException
+from nuvla.job_engine.job.actions.utils.bulk_nuvlabox import NuvlaboxBulkJob
 
 
 class TestBulkActionResult(unittest.TestCase):
 
     def setUp(self):
         self.obj = BulkActionResult(actions_count=10)
-        self.expected_obj = {'total_actions': 10,
+        self.expected_obj = {'version': 2,
+                             'total_actions': 10,
                              'failed_count': 0,
                              'error_reasons': [],
                              'queued': [],
@@ -20,7 +26,10 @@ class TestBulkActionResult(unittest.TestCase):
                              'skipped_count': 0,
                              'success': [],
                              'success_count': 0,
-                             'jobs_count': 0}
+                             'jobs_count': 0,
+                             'jobs': {'success_count': 0,
+                                      'success': [],
+                                      'error_reasons': []}}
 
     def test_add_success_action(self):
         self.obj.add_success_action('nuvlabox/id-success-1')
@@ -170,8 +179,230 @@ class TestBulkActionResult(unittest.TestCase):
                 }]
         }
         json_str = json.dumps(data)
-        self.assertEqual(data, BulkActionResult.from_json(json_str).to_dict(),
+        result = BulkActionResult.from_json(json_str).to_dict()
+        self.assertEqual(dict(data, version=2,
+                              jobs={'success_count': 0, 'success': [], 'error_reasons': []}),
+                         result, 'version 1 data should be read unchanged')
+        self.assertEqual(result, BulkActionResult.from_json(json.dumps(result)).to_dict(),
                          'from data to json and back, data should be equal')
 
+    def test_from_json_v1_jobs_outcome(self):
+        data = {'total_actions': 3,
+                'success_count': 2,
+                'failed_count': 1,
+                'success': ['deployment/a', 'deployment/b'],
+                'jobs_count': 2,
+                'error_reasons': [{'reason': 'Job failed', 'count': 1, 'category': 'failed',
+                                   'data': [{'id': 'deployment/c', 'count': 1}]}]}
+        result = BulkActionResult.from_json(json.dumps(data))
+        self.assertEqual(data['error_reasons'], result.to_dict()['error_reasons'])
+        result.set_jobs_outcome(['deployment/b'], {'Job failed': ['deployment/c']})
+        result.set_jobs_outcome(['deployment/b'], {'Job failed': ['deployment/c']})
+        result = result.to_dict()
+        self.assertEqual(2, result['success_count'])
+        self.assertEqual(['deployment/a', 'deployment/b'], result['success'])
+        self.assertEqual(1, result['failed_count'])
+        self.assertEqual(data['error_reasons'], result['error_reasons'])
+
+    def test_set_jobs_outcome_replaces_previous(self):
+        self.obj.add_success_action('nuvlabox/a')
+        self.obj.fail_action('Some error', resource_id='nuvlabox/b')
+        self.obj.set_jobs_outcome(['deployment/a'], {})
+        self.obj.set_jobs_outcome(['deployment/a', 'deployment/b'],
+                                  {'Job canceled': ['deployment/c']})
+        result = self.obj.to_dict()
+        self.assertEqual(3, result['success_count'])
+        self.assertEqual(['nuvlabox/a', 'deployment/a', 'deployment/b'], result['success'])
+        self.assertEqual(2, result['failed_count'])
+        self.assertEqual(['Some error', 'Job canceled'],
+                         [r['reason'] for r in result['error_reasons']])
+        self.assertTrue(self.obj.exist_in_fail_reason_ids('Job canceled', 'deployment/c'))
+        self.assertEqual(result, BulkActionResult.from_json(json.dumps(result)).to_dict())
+
+    def test_size_is_bounded(self):
+        for i in range(1000):
+            self.obj.add_success_action(f'nuvlabox/s-{i}')
+            self.obj.fail_action(f'Error {i % 100}', resource_id=f'nuvlabox/f-{i}')
+            self.obj.skip_action('Offline Edges', resource_id=f'nuvlabox/o-{i}')
+        result = self.obj.to_dict()
+        self.assertEqual(1000, result['success_count'])
+        self.assertEqual(bulk_action.SAMPLE_SIZE, len(result['success']))
+        self.assertEqual(1000, result['failed_count'])
+        self.assertEqual(1000, result['skipped_count'])
+        self.assertEqual(bulk_action.MAX_REASONS, len(result['error_reasons']))
+        other = next(r for r in result['error_reasons']
+                     if r['reason'] == bulk_action.OTHER_REASON)
+        self.assertEqual(1000 - 10 * (bulk_action.MAX_REASONS - 2), other['count'])
+        self.assertTrue(all(len(r['data']) <= bulk_action.SAMPLE_SIZE
+                            for r in result['error_reasons']))
+        self.assertLess(len(self.obj.to_json()), 100_000)
+
     def test_from_json_empty(self):
         BulkActionResult.from_json('{}')
+
+    def test_concurrent_accumulation(self):
+        def add(i):
+            for j in range(100):
+                self.obj.add_success_action(f'nuvlabox/{i}-{j}')
+                self.obj.fail_action('Some error', resource_id=f'deployment/{j}')
+        threads = [threading.Thread(target=add, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result = self.obj.to_dict()
+        self.assertEqual(800, result['success_count'])
+        self.assertEqual(800, result['failed_count'])
+        self.assertEqual(800, result['error_reasons'][0]['count'])
+        self.assertEqual(bulk_action.SAMPLE_SIZE, len(result['error_reasons'][0]['data']))
+
+
+class SleepingBulkAction(BulkAction):
+
+    def __init__(self, job, duration=0.02):
+        super().__init__(job, 'sleeping_bulk_action')
+        self.duration = duration
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_todo(self):
+        return [f'nuvlabox/{i}' for i in range(10)]
+
+    def action(self, todo_el):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.duration)
+        with self.lock:
+            self.in_flight -= 1
+        if todo_el == 'nuvlabox/0':
+            raise SkippedActionException('Offline Edge', resource_id=todo_el)
+        response = MagicMock()
+        response.data = {'status': 200}
+        return response
+
+
+class TestBulkAction(unittest.TestCase):
+
+    def setUp(self):
+        bulk_action._user_slots.clear()
+        self.job = MagicMock()
+        self.job.get.return_value = 0
+        self.job.payload = {'authn-info': {'user-id': 'user/a', 'active-claim': 'group/a'}}
+
+    def test_bulk_operation_concurrently(self):
+        action = SleepingBulkAction(self.job)
+        action.concurrency = 3
+        self.assertEqual(0, action.do_work())
+        self.assertEqual(3, action.max_in_flight)
+        result = json.loads(self.job.update_job.call_args.kwargs['status_message'])
+        self.assertEqual((9, 1), (result['success_count'], result['skipped_count']))
+        self.assertEqual(100, self.job.update_job.call_args.kwargs['progress'])
+
+    def test_bulk_operation_user_limit(self):
+        actions = [SleepingBulkAction(self.job) for _ in range(2)]
+        for action in actions:
+            action.concurrency = 4
+            action.user_concurrency = 3
+        in_flight = []
+
+        def count():
+            while any(t.is_alive() for t in threads):
+                in_flight.append(sum(a.in_flight for a in actions))
+                time.sleep(0.001)
+
+        threads = [threading.Thread(target=action.do_work) for action in actions]
+        for thread in threads:
+            thread.start()
+        count()
+        self.assertLessEqual(max(in_flight), 3)
+        self.assertEqual([100, 100], [int(action.progress) for action in actions])
+
+    def test_user_slots_dropped_after_last_job(self):
+        with bulk_action.user_slots('group/a', 3) as slots:
+            with bulk_action.user_slots('group/a', 3) as other_slots:
+                self.assertIs(slots, other_slots)
+            self.assertIn('group/a', bulk_action._user_slots)
+        self.assertEqual({}, bulk_action._user_slots)
+
+    def test_jobs_without_user_dont_share_slots(self):
+        with bulk_action.user_slots(None, 3) as slots, \
+                bulk_action.user_slots(None, 3) as other_slots:
+            self.assertIsNot(slots, other_slots)
+        self.assertEqual({}, bulk_action._user_slots)
+
+    def test_bulk_operation_pushes_progress_periodically(self):
+        action = SleepingBulkAction(self.job, duration=0.05)
+        action.concurrency = 1
+        action.push_interval = 0.1
+        action.do_work()
+        # pushed on the timer and once at the end, not once per element
+        self.assertLess(self.job.update_job.call_count, 10)
+        self.assertGreater(self.job.update_job.call_count, 1)
+
+
+class StreamingBulkAction(SleepingBulkAction):
+
+    def __init__(self, job, todo, count):
+        super().__init__(job, duration=0)
+        self.todo_list = todo
+        self.count = count
+        self.consumed = []
+
+    def get_todo(self):
+        for todo_el in self.todo_list:
+            self.consumed.append(todo_el)
+            yield todo_el
+
+    def count_todo(self):
+        return self.count
+
+
+class UpdateNuvlaboxBulkJob(NuvlaboxBulkJob):
+
+    def nuvlabox_action(self, nuvlabox):
+        response = MagicMock()
+        response.data = {'status': 200}
+        return response
+
+
+class TestStreamingTodo(unittest.TestCase):
+
+    def setUp(self):
+        bulk_action._user_slots.clear()
+        self.job = MagicMock()
+        self.job.get.return_value = 0
+        self.job.payload = {'filter': 'tags="a"',
+                            'authn-info': {'user-id': 'user/a', 'active-claim': 'group/a'}}
+
+    def test_todo_consumed_while_acting(self):
+        action = StreamingBulkAction(self.job, [f'nuvlabox/{i}' for i in range(1, 11)], 10)
+        action.concurrency = 1
+        self.assertEqual(0, action.do_work())
+        self.assertEqual(10, len(action.consumed))
+        result = json.loads(self.job.update_job.call_args.kwargs['status_message'])
+        self.assertEqual(10, result['total_actions'])
+
+    def test_total_corrected_when_estimate_is_wrong(self):
+        for count in (5, 20):
+            action = StreamingBulkAction(self.job, [f'nuvlabox/{i}' for i in range(1, 11)], count)
+            self.assertEqual(0, action.do_work())
+            result = json.loads(self.job.update_job.call_args.kwargs['status_message'])
+            self.assertEqual(10, result['total_actions'])
+            self.assertEqual(100, self.job.update_job.call_args.kwargs['progress'])
+
+    def test_nuvlabox_todo_is_paginated(self):
+        api = self.job.get_user_api.return_value
+        api.search.side_effect = [
+            MagicMock(count=3),
+            MagicMock(resources=[MagicMock(id='nuvlabox/1'), MagicMock(id='nuvlabox/2')]),
+            MagicMock(resources=[])]
+        action = UpdateNuvlaboxBulkJob(self.job, 'bulk_update_nuvlabox')
+        action.todo = action.get_todo()
+        self.assertEqual(3, action.count_todo())
+        self.assertEqual(['nuvlabox/1', 'nuvlabox/2'], list(action.todo))
+        page_search = api.search.call_args_list[1]
+        self.assertEqual(('nuvlabox',), page_search.args)
+        self.assertEqual({'filter': 'tags="a"', 'orderby': 'id:asc', 'last': 1000,
+                          'select': ['id']}, page_search.kwargs)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+import copy
+import unittest
+from unittest.mock import MagicMock
+
+from nuvla.api.models import CimiResource
+
+from nuvla.job_engine.job.actions.utils.bulk_deployment_set_apply import \
+    BulkDeploymentSetApply, EdgeResolver
+from nuvla.job_engine.job.actions.utils.bulk_action import SkippedActionException
+
+
+class TestEdgeResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.resources = {
+            'nuvlabox': [{'id': f'nuvlabox/{i}', 'name': f'ne-{i}', 'online': i != 1,
+                          'infrastructure-service-group': f'infrastructure-service-group/{i}'}
+                         for i in range(4)],
+            'infrastructure-service': [
+                {'id': 'infrastructure-service/k0', 'parent': 'infrastructure-service-group/0',
+                 'subtype': 'kubernetes'},
+                {'id': 'infrastructure-service/s0', 'parent': 'infrastructure-service-group/0',
+                 'subtype': 'swarm'},
+                {'id': 'infrastructure-service/s1', 'parent': 'infrastructure-service-group/1',
+                 'subtype': 'swarm'},
+                {'id': 'infrastructure-service/s2', 'parent': 'infrastructure-service-group/2',
+                 'subtype': 'swarm'}],
+            'credential': [
+                {'id': 'credential/k0', 'parent': 'infrastructure-service/k0'},
+                {'id': 'credential/s0', 'parent': 'infrastructure-service/s0'},
+                {'id': 'credential/s1', 'parent': 'infrastructure-service/s1'}]}
+        self.api = MagicMock()
+        self.api.search.side_effect = self._search
+        self.resolver = EdgeResolver(self.api, None)
+
+    def _search(self, resource_type, **_kwargs):
+        return MagicMock(resources=[CimiResource(r) for r in self.resources[resource_type]])
+
+    def test_prefetch(self):
+        targets = ['nuvlabox/0', 'nuvlabox/1', 'nuvlabox/2', 'nuvlabox/3', 'credential/c']
+        self.resolver.prefetch(targets)
+        self.assertEqual(['nuvlabox', 'infrastructure-service', 'credential'],
+                         [c.args[0] for c in self.api.search.call_args_list])
+        self.assertIn("id=['nuvlabox/0', 'nuvlabox/1', 'nuvlabox/2', 'nuvlabox/3']",
+                      self.api.search.call_args_list[0].kwargs['filter'])
+        self.api.reset_mock()
+        self.assertEqual('credential/s0', self.resolver.resolve_credential('nuvlabox/0'))
+        self.assertEqual('credential/s1', self.resolver.resolve_credential('nuvlabox/1'))
+        self.assertEqual('credential/c', self.resolver.resolve_credential('credential/c'))
+        for target in ['nuvlabox/2', 'nuvlabox/3']:
+            with self.assertRaises(SkippedActionException) as ctx:
+                self.resolver.resolve_credential(target)
+            self.assertEqual('Edge credential not found', ctx.exception.reason)
+        with self.assertRaises(SkippedActionException) as ctx:
+            self.resolver.throw_edge_offline('nuvlabox/1')
+        self.assertEqual('Offline Edge', ctx.exception.reason)
+        self.resolver.throw_edge_offline('nuvlabox/0')
+        self.api.search.assert_not_called()
+        self.api.get.assert_not_called()
+
+    def test_edge_not_prefetched_is_resolved_alone(self):
+        self.resolver.prefetch(['nuvlabox/9'])
+        self.api.get.side_effect = Exception('not found')
+        with self.assertRaises(SkippedActionException) as ctx:
+            self.resolver.resolve_credential('nuvlabox/9')
+        self.assertEqual('Edge not found', ctx.exception.reason)
+
+
+class TestBulkDeploymentSetApply(unittest.TestCase):
+
+    def setUp(self):
+        self.api = MagicMock()
+        self.resources = {
+            'deployment-set/1': {'id': 'deployment-set/1', 'subtype': 'docker-compose',
+                                 'api-endpoint': 'https://nuvla.io'},
+            'module/app_1': {'id': 'module/app', 'versions': [{}, {}],
+                             'content': {'environmental-variables': [{'name': 'A', 'value': '1'},
+                                                                     {'name': 'B', 'value': '2'}]}}}
+        self.api.get.side_effect = lambda resource_id: CimiResource(
+            copy.deepcopy(self.resources.get(resource_id) or self.deployment(resource_id)))
+        self.api.add.side_effect = lambda _, data: MagicMock(
+            data={'resource-id': f'deployment/{data["parent"]}'})
+        self.api.edit.side_effect = lambda resource_id, data: CimiResource(
+            dict(data, operations=[{'rel': 'update'}]))
+        self.job = MagicMock()
+        self.job.get.return_value = 0
+        self.job.id = 'job/1'
+        self.job.get_api.return_value = self.api
+        self.job.__getitem__.return_value = {'href': 'deployment-set/1'}
+        self.action = BulkDeploymentSetApply(self.job, 'bulk_deployment_set_start')
+        self.action.api_endpoint = 'https://nuvla.io'
+        self.application = {'id': 'module/app', 'version': 1,
+                            'environmental-variables': [{'name': 'B', 'value': '3'}],
+                            'files': [{'file-name': 'f', 'file-content': 'y'}],
+                            'registries-credentials': ['credential/reg']}
+
+    @staticmethod
+    def deployment(deployment_id):
+        return {'id': deployment_id, 'acl': {'owners': ['user/1']},
+                'module': {'href': 'module/app_0',
+                           'content': {'environmental-variables': [{'name': 'A', 'value': '0'},
+                                                                   {'name': 'B', 'value': '5'}],
+                                       'files': [{'file-name': 'f', 'file-content': 'x'}]}}}
+
+    def test_add_deployment(self):
+        self.action._add_deployment({'target': 'credential/a', 'application': self.application,
+                                     'app-set': 'set-1'})
+        self.api.add.assert_called_once_with(
+            'deployment', {'module': {'href': 'module/app_1'}, 'parent': 'credential/a',
+                           'deployment-set': 'deployment-set/1', 'app-set': 'set-1'})
+        expected = self.deployment('deployment/credential/a')
+        expected['module']['content']['environmental-variables'][1]['value'] = '3'
+        expected['module']['content']['files'] = [{'file-name': 'f', 'file-content': 'y'}]
+        expected.update({'api-endpoint': 'https://nuvla.io',
+                         'registries-credentials': ['credential/reg']})
+        self.api.edit.assert_called_once_with('deployment/credential/a', expected)
+        deployment, operation, _ = self.api.operation.call_args.args
+        self.assertEqual(('deployment/credential/a', 'start'), (deployment.id, operation))
+
+    def test_update_deployment(self):
+        for deployment_id in ['deployment/1', 'deployment/2']:
+            self.action._update_deployment(({'id': deployment_id},
+                                            {'target': 'credential/a',
+                                             'application': self.application}))
+        expected = self.deployment('deployment/2')
+        expected['module'] = {'href': 'module/app_1',
+                              'content': {'environmental-variables': [
+                                  {'name': 'A', 'value': '1'}, {'name': 'B', 'value': '3'}],
+                                  'files': [{'file-name': 'f', 'file-content': 'y'}]}}
+        expected.update({'api-endpoint': 'https://nuvla.io',
+                         'registries-credentials': ['credential/reg']})
+        self.api.edit.assert_called_with('deployment/2', expected)
+        self.assertEqual('update', self.api.operation.call_args.args[1])
+        self.assertEqual(['deployment-set/1', 'module/app_1', 'deployment/1', 'deployment/2'],
+                         [c.args[0] for c in self.api.get.call_args_list], 'module fetched once')
+        self.assertEqual('2', self.resources['module/app_1']['content']
+                         ['environmental-variables'][1]['value'], 'cached module unchanged')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock
+
+from nuvla.api.models import CimiCollection
+
+from nuvla.job_engine.job.active_jobs import ActiveJobsIndex
+
+
+def jobs(*docs):
+    return CimiCollection({'count': len(docs), 'resources': [
+        {'id': job_id, 'action': action, 'target-resource': {'href': href},
+         'state': state, 'updated': updated}
+        for job_id, action, href, state, updated in docs]})
+
+
+class ActiveJobsIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = MagicMock()
+        self.index = ActiveJobsIndex(self.api, refresh_interval=0, page_size=2)
+
+    def test_load_by_pages(self):
+        self.index.refresh_interval = 60
+        self.api.search.side_effect = [
+            jobs(('job/1', 'a', 'x/1', 'QUEUED', '2024-01-01T00:00:01.000Z'),
+                 ('job/2', 'a', 'x/2', 'RUNNING', '2024-01-01T00:00:02.000Z')),
+            jobs(('job/3', 'b', 'x/1', 'QUEUED', '2024-01-01T00:00:02.000Z'))]
+        self.assertTrue(self.index.exists('a', 'x/2'))
+        self.assertEqual(2, self.api.search.call_count)
+        self.assertEqual("(state=['QUEUED', 'RUNNING'] and (updated>'2024-01-01T00:00:02.000Z' or "
+                         "(updated='2024-01-01T00:00:02.000Z' and id>'job/2')))",
+                         self.api.search.call_args_list[1].kwargs['filter'])
+        self.assertTrue(self.index.exists('b', 'x/1'))
+        self.assertFalse(self.index.exists('b', 'x/2'))
+
+    def test_delta_refresh(self):
+        self.api.search.side_effect = [
+            jobs(('job/1', 'a', 'x/1', 'QUEUED', '2024-01-01T00:00:01.000Z')),
+            jobs(('job/1', 'a', 'x/1', 'SUCCESS', '2024-01-01T00:00:05.000Z'),
+                 ('job/2', 'a', 'x/2', 'QUEUED', '2024-01-01T00:00:06.000Z')),
+            jobs(('job/2', 'a', 'x/2', 'QUEUED', '2024-01-01T00:00:06.000Z')),
+            jobs()]
+        self.assertTrue(self.index.exists('a', 'x/1'))
+        self.assertFalse(self.index.exists('a', 'x/1'))
+        self.assertEqual("(id!=null and updated>='2024-01-01T00:00:01.000Z')",
+                         self.api.search.call_args_list[1].kwargs['filter'])
+        self.assertTrue(self.index.exists('a', 'x/2'))
+
+    def test_delta_refresh_with_saturated_page(self):
+        updated = '2024-01-01T00:00:05.000Z'
+        self.api.search.side_effect = [
+            jobs(('job/1', 'a', 'x/1', 'QUEUED', '2024-01-01T00:00:01.000Z')),
+            jobs(('job/1', 'a', 'x/1', 'SUCCESS', updated),
+                 ('job/2', 'a', 'x/2', 'QUEUED', updated)),
+            jobs(('job/3', 'a', 'x/3', 'QUEUED', updated),
+                 ('job/4', 'a', 'x/4', 'QUEUED', updated)),
+            jobs(('job/5', 'a', 'x/5', 'QUEUED', updated))]
+        self.assertTrue(self.index.exists('a', 'x/1'))
+        self.assertTrue(self.index.exists('a', 'x/5'))
+        self.assertEqual(4, self.api.search.call_count)
+        self.assertIn(f"(updated='{updated}' and id>'job/4')",
+                      self.api.search.call_args_list[3].kwargs['filter'])
+        self.assertNotIn(('a', 'x/1'), self.index._keys)
+
+    def test_no_refresh_within_interval(self):
+        self.index.refresh_interval = 60
+        self.api.search.return_value = jobs(
+            ('job/1', 'a', 'x/1', 'QUEUED', '2024-01-01T00:00:01.000Z'))
+        self.index.exists('a', 'x/1')
+        self.index.add('a', 'x/3', 'job/3')
+        self.assertTrue(self.index.exists('a', 'x/3'))
+        self.assertEqual(1, self.api.search.call_count)
+
+    def test_fallback_to_search(self):
+        fallback = MagicMock()
+        fallback.count = 1
+        self.api.search.side_effect = [Exception('down'), fallback]
+        with self.assertLogs('active_jobs', level='WARNING'):
+            self.assertTrue(self.index.exists('a', 'x/1'))
+        self.assertEqual(0, self.api.search.call_args.kwargs['last'])
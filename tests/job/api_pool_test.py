@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nuvla.api import Api
+from nuvla.job_engine.job.api_pool import ApiPool, pooled_api, api_pool
+
+
+class ApiPoolTestCase(unittest.TestCase):
+
+    def test_get_reuses_pooled_client(self):
+        pool = ApiPool()
+        create = MagicMock(side_effect=lambda: object())
+        self.assertIs(pool.get('a', create), pool.get('a', create))
+        self.assertEqual(1, create.call_count)
+
+    def test_least_recently_used_client_evicted_over_max_size(self):
+        pool = ApiPool(max_size=2)
+        a = pool.get('a', object)
+        pool.get('b', object)
+        pool.get('a', object)
+        pool.get('c', object)
+        self.assertEqual(2, len(pool))
+        self.assertIs(a, pool.get('a', object))
+
+    @patch('nuvla.job_engine.job.api_pool.time.monotonic')
+    def test_idle_client_evicted(self, mock_monotonic):
+        pool = ApiPool(idle_timeout=10)
+        mock_monotonic.return_value = 0
+        a = pool.get('a', object)
+        mock_monotonic.return_value = 11
+        pool.get('b', object)
+        self.assertIsNot(a, pool.get('a', object))
+
+    def test_pooled_api_shares_parent_http_adapter(self):
+        api_pool.clear()
+        parent_api = Api(endpoint='https://nuvla.test', persist_cookie=False)
+        api = pooled_api(parent_api, authn_header='user/a group/a user/a')
+        self.assertIs(parent_api.session.get_adapter('https://nuvla.test'),
+                      api.session.get_adapter('https://nuvla.test'))
+        self.assertEqual('user/a group/a user/a', api.session.authn_header)
+        self.assertIs(api, pooled_api(parent_api, authn_header='user/a group/a user/a'))
+        self.assertIsNot(api, pooled_api(parent_api, authn_header='user/b group/b user/b'))
+        api_pool.clear()
@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nuvla.api import Api
+from requests import Response
+from requests.adapters import HTTPAdapter
+from nuvla.job_engine.job.base import Base, NuvlaHTTPAdapter
+
+
+class NuvlaHTTPAdapterTestCase(unittest.TestCase):
+
+    @patch.object(HTTPAdapter, 'send')
+    def test_timeout_applied_by_default(self, mock_send):
+        def send(request, **_kwargs):
+            response = Response()
+            response.request = request
+            response.url = request.url
+            response.status_code = 200
+            response._content = b'{"id": "job/1"}'
+            return response
+
+        mock_send.side_effect = send
+        api = Api(endpoint='https://nuvla.test', persist_cookie=False, reauthenticate=False)
+        api.session.mount('https://', NuvlaHTTPAdapter(timeout=3))
+        api.get('job/1')
+        self.assertEqual(3, mock_send.call_args.kwargs['timeout'])
+
+    @patch.object(HTTPAdapter, 'send')
+    def test_request_timeout_kept(self, mock_send):
+        NuvlaHTTPAdapter(timeout=3).send('request', timeout=60)
+        mock_send.assert_called_once_with('request', timeout=60)
+
+    @patch.object(HTTPAdapter, 'send')
+    def test_default_timeout_kept(self, mock_send):
+        NuvlaHTTPAdapter().send('request', timeout=60)
+        mock_send.assert_called_once_with('request', timeout=60)
+
+    def test_pool_stats(self):
+        adapter = NuvlaHTTPAdapter(pool_maxsize=8)
+        pool = adapter.poolmanager.connection_from_url('https://nuvla.test')
+        pool._get_conn()
+        pool.num_requests = 10
+        pool.num_connections = 2
+        self.assertEqual({'pools': 1, 'maxsize': 8, 'in_use': 1,
+                          'connections': 2, 'requests': 10},
+                         adapter.pool_stats())
+
+
+class BaseTestCase(unittest.TestCase):
+
+    @patch.object(Base, '__init__', return_value=None)
+    def test_publish_api_pool_metrics(self, _mock_init):
+        base = Base()
+        base.statsd = MagicMock()
+        base.prometheus = None
+        base.api = MagicMock()
+        adapter = NuvlaHTTPAdapter(pool_maxsize=4)
+        base.api.session.get_adapter.return_value = adapter
+        pool = adapter.poolmanager.connection_from_url('https://nuvla.test')
+        pool._get_conn()
+        pool.num_requests = 4
+        pool.num_connections = 1
+        base.publish_api_pool_metrics()
+        base.statsd.gauge.assert_any_call('base.api_pool.saturation', 0.25)
+        base.statsd.gauge.assert_any_call('base.api_pool.reuse', 0.75)
@@ -0,0 +1,110 @@
+import argparse
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock, patch
+
+from nuvla.job_engine.job.distribution_config import DistributionConfig, distribution_arg
+
+
+def args(**kwargs):
+    values = {'distribution_exclude': [], 'distribution_interval': [],
+              'distribution_schedule': [], 'distribution_jitter': []}
+    values.update(kwargs)
+    return SimpleNamespace(**values)
+
+
+class DistributionConfigTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.config = DistributionConfig(args(
+            distribution_exclude=['b'],
+            distribution_interval=['a:20'],
+            distribution_schedule=['a:fixed-rate:catch-up'],
+            distribution_jitter=['a:0.5']))
+
+    def test_settings_from_args(self):
+        self.assertEqual(20, self.config.get('a', 'interval'))
+        self.assertEqual('fixed-rate', self.config.get('a', 'schedule'))
+        self.assertEqual('catch-up', self.config.get('a', 'overrun'))
+        self.assertEqual(0.5, self.config.get('a', 'jitter'))
+        self.assertTrue(self.config.excluded('b'))
+        self.assertFalse(self.config.excluded('a'))
+        self.assertEqual(10, self.config.get('c', 'interval', 10))
+
+    def test_bad_args(self):
+        with self.assertRaises(ValueError):
+            DistributionConfig(args(distribution_interval=['a:often']))
+
+    def test_distribution_arg(self):
+        self.assertEqual('a:fixed-rate:catch-up',
+                         distribution_arg('schedule', 'overrun')('a:fixed-rate:catch-up'))
+        self.assertEqual('a:20', distribution_arg('interval')('a:20'))
+        for bad in ['a:often', 'a', ':20', 'a:20:30']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                distribution_arg('interval')(bad)
+
+    def test_live_settings_override_args(self):
+        listener = Mock()
+        self.config.add_listener(listener)
+        self.assertTrue(self.config.update(
+            '{"distributions": {"a": {"interval": 5}, "b": {"exclude": false}}}'))
+        self.assertEqual(5, self.config.get('a', 'interval'))
+        self.assertEqual(0.5, self.config.get('a', 'jitter'))
+        self.assertFalse(self.config.excluded('b'))
+        self.assertEqual(1, self.config.version)
+        listener.assert_called_once_with()
+        # unchanged
+        self.assertFalse(self.config.update({'distributions': {'a': {'interval': 5},
+                                                               'b': {'exclude': False}}}))
+        self.assertEqual(1, self.config.version)
+        # removed
+        self.assertTrue(self.config.update(''))
+        self.assertEqual(20, self.config.get('a', 'interval'))
+        self.assertTrue(self.config.excluded('b'))
+
+    def test_invalid_document_is_ignored(self):
+        self.config.update({'distributions': {'a': {'concurrency': 4}}})
+        for document in ['{"distributions": ', '[]',
+                         {'distributions': {'a': {'concurrency': 0}}},
+                         {'distributions': {'a': {'exclude': 'yes'}}},
+                         {'distributions': {'a': {'schedule': 'cron'}}},
+                         {'distributions': {'a': {'jitter': 2}}},
+                         {'distributions': {'a': {'speed': 1}}}]:
+            self.assertFalse(self.config.update(document), document)
+        self.assertEqual(4, self.config.get('a', 'concurrency'))
+        self.assertEqual(1, self.config.version)
+
+    def test_watch_zk(self):
+        kz = MagicMock()
+        self.config.watch_zk(kz, '/distribution-config')
+        path, on_change = kz.DataWatch.call_args.args
+        self.assertEqual('/distribution-config', path)
+        on_change(b'{"distributions": {"a": {"batch_size": 10}}}', None)
+        self.assertEqual(10, self.config.get('a', 'batch_size'))
+        on_change(None, None)
+        self.assertIsNone(self.config.get('a', 'batch_size'))
+
+    @patch('nuvla.job_engine.job.distribution_config.FILE_POLL_INTERVAL', 0.01)
+    def test_watch_file(self):
+        stop_event = threading.Event()
+        changed = threading.Event()
+        self.config.add_listener(changed.set)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'distributions.json')
+            with open(path, 'w') as f:
+                f.write('{"distributions": {"a": {"interval": 1}}}')
+            self.config.watch_file(path, stop_event)
+            self.assertTrue(changed.wait(5))
+            self.assertEqual(1, self.config.get('a', 'interval'))
+            changed.clear()
+            os.remove(path)
+            self.assertTrue(changed.wait(5))
+            self.assertEqual(20, self.config.get('a', 'interval'))
+        stop_event.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, Mock, patch
+
+from nuvla.api import NuvlaError
+
+from nuvla.job_engine.job.distribution import DistributionBase, partition_of
+from nuvla.job_engine.job.distribution_config import DistributionConfig
+
+
+class DistributionBaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.distributor = MagicMock()
+        self.distributor.stop_event = threading.Event()
+        self.distributor.config = DistributionConfig()
+        self.distribution = DistributionBase('foo', self.distributor)
+        self.pool = ThreadPoolExecutor(max_workers=4)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_distribute_jobs(self):
+        jobs = ({'action': 'foo', 'target-resource': {'href': f'foo/{i}'}}
+                for i in range(10))
+        self.assertEqual((10, 0), self.distribution._distribute_jobs(self.pool, jobs))
+        self.assertEqual(10, self.distributor.api.add.call_count)
+        added = self.distributor.api.add.call_args_list[0].args
+        self.assertEqual(('job', {'action': 'foo', 'target-resource': {'href': 'foo/0'},
+                                  'priority': 500}), added)
+
+    @patch('nuvla.job_engine.job.distribution.ADD_RETRY_DELAY', 0)
+    def test_distribute_jobs_retries_failed_job(self):
+        self.distributor.api.add.side_effect = [ConnectionError('down'), None, None]
+        jobs = [{'action': 'foo'}, {'action': 'bar'}]
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            self.assertEqual((2, 0), self.distribution._distribute_jobs(pool, jobs))
+        self.assertEqual(3, self.distributor.api.add.call_count)
+
+    @patch('nuvla.job_engine.job.distribution.ADD_RETRY_DELAY', 0)
+    def test_distribute_jobs_gives_up(self):
+        response = Mock()
+        response.status_code = 400
+        self.distributor.api.add.side_effect = [NuvlaError('bad request', response),
+                                                ConnectionError('down'),
+                                                ConnectionError('down'),
+                                                ConnectionError('down')]
+        jobs = [{'action': 'foo'}, {'action': 'bar'}]
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            self.assertEqual((0, 2), self.distribution._distribute_jobs(pool, jobs))
+        # client errors are not retried
+        self.assertEqual(4, self.distributor.api.add.call_count)
+
+    @patch('nuvla.job_engine.job.distribution.Schedule')
+    def test_job_distribution_publishes_overruns(self, mock_schedule):
+        self.distributor.config.update({'distributions': {'foo': {
+            'interval': 10, 'schedule': 'fixed-rate', 'overrun': 'skip', 'jitter': 0.5}}})
+        schedule = mock_schedule.return_value
+        schedule.wait_time.return_value = 0
+        schedule.cycle_done.return_value = (25, 2)
+        cycles = []
+
+        def job_generator():
+            cycles.append(1)
+            if len(cycles) == 3:
+                self.distributor.stop_event.set()
+            yield {'action': 'foo', 'target-resource': {'href': 'foo/1'}}
+
+        self.distribution.job_generator = job_generator
+        self.distribution._job_distribution()
+        self.assertEqual(3, len(cycles))
+        mock_schedule.assert_called_once_with(10, 'fixed-rate', 'skip', 0.5)
+        self.distributor.publish_metric.assert_any_call('job_distribution.foo.distributed', 1)
+        self.distributor.publish_counter.assert_any_call('job_distribution.foo.overruns')
+        self.distributor.publish_counter.assert_any_call('job_distribution.foo.skipped', 2)
+        self.distributor.publish_timer.assert_any_call('job_distribution.foo.overrun', 25)
+
+    def test_job_distribution_stops_while_waiting(self):
+        self.distributor.config.update({'distributions': {'foo': {'interval': 3600}}})
+        self.distribution.job_generator = Mock(side_effect=lambda: iter([]))
+        thread = threading.Thread(target=self.distribution._job_distribution)
+        thread.start()
+        self.distributor.stop_event.set()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    @patch('nuvla.job_engine.job.distribution.PARTITION_POLL_INTERVAL', 0.01)
+    def test_job_distribution_stops_waiting_when_not_running(self):
+        self.distributor.config.update({'distributions': {'foo': {'interval': 3600}}})
+        self.distribution.job_generator = Mock(side_effect=lambda: iter([]))
+        acquired = threading.Event()
+        acquired.set()
+        thread = threading.Thread(target=self.distribution._job_distribution,
+                                  kwargs={'keep_running': acquired.is_set})
+        thread.start()
+        self.assertTrue(thread.is_alive())
+        acquired.clear()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(self.distributor.stop_event.is_set())
+
+    def test_distribute_jobs_batch_size(self):
+        self.distributor.config.update({'distributions': {'foo': {'batch_size': 3}}})
+        pool = MagicMock()
+        pool.map.side_effect = lambda f, chunk: [True] * len(chunk)
+        self.assertEqual((7, 0), self.distribution._distribute_jobs(pool, range(7)))
+        self.assertEqual([3, 3, 1], [len(c.args[1]) for c in pool.map.call_args_list])
+
+    @patch('nuvla.job_engine.job.distribution.CONFIG_POLL_INTERVAL', 0.01)
+    def test_excluded_distribution_is_paused(self):
+        self.distributor.config.update({'distributions': {'foo': {'interval': 0,
+                                                                  'exclude': True}}})
+        cycles = []
+
+        def job_generator():
+            cycles.append(1)
+            self.distributor.stop_event.set()
+            return iter([])
+
+        self.distribution.job_generator = job_generator
+        thread = threading.Thread(target=self.distribution._job_distribution)
+        thread.start()
+        self.assertFalse(self.distributor.stop_event.wait(0.1))
+        self.assertEqual([], cycles)
+        self.distributor.config.update({'distributions': {'foo': {'interval': 0}}})
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([1], cycles)
+
+    def test_dry_run(self):
+        self.distributor.args.dry_run = True
+        self.distributor.args.profile = False
+        self.distributor.api_traffic.snapshot.side_effect = [(1, 100), (4, 400)]
+        self.distributor.active_jobs.exists.side_effect = lambda action, href: href == 'foo/1'
+
+        def job_generator():
+            for i in range(3):
+                job = {'action': 'foo', 'target-resource': {'href': f'foo/{i}'}}
+                if not self.distribution.job_exists(job):
+                    yield job
+
+        self.distribution.job_generator = job_generator
+        self.distribution._start_distribution()
+        self.distributor.api.add.assert_not_called()
+        self.distributor.kz.Election.assert_not_called()
+        self.distributor.publish_metric.assert_any_call('job_distribution.foo.dry_run.jobs', 2)
+        self.distributor.publish_metric.assert_any_call('job_distribution.foo.dry_run.duplicates', 1)
+        self.distributor.publish_metric.assert_any_call('job_distribution.foo.dry_run.api_calls', 3)
+        self.distributor.publish_metric.assert_any_call('job_distribution.foo.dry_run.api_bytes', 300)
+
+    def test_dry_run_counts_duplicates_filtered_by_generator(self):
+        self.distributor.args.dry_run = True
+        self.distributor.args.profile = False
+        self.distributor.api_traffic.snapshot.return_value = (0, 0)
+
+        def job_generator():
+            self.distribution.count_duplicates(2)
+            yield {'action': 'foo', 'target-resource': {'href': 'foo/1'}}
+
+        self.distribution.job_generator = job_generator
+        self.distribution._start_distribution()
+        self.distributor.publish_metric.assert_any_call('job_distribution.foo.dry_run.jobs', 1)
+        self.distributor.publish_metric.assert_any_call('job_distribution.foo.dry_run.duplicates', 2)
+
+
+class PartitionedDistributionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.distributor = MagicMock()
+        self.distributor.stop_event = threading.Event()
+        self.distributor.args.dry_run = False
+        self.distribution = DistributionBase('foo', self.distributor)
+        self.distribution.partitions = 4
+
+    def test_owns(self):
+        self.assertTrue(self.distribution.owns('deployment/1'))
+        partition = partition_of('deployment/1', 4)
+        self.distribution.owned_partitions = {partition}
+        self.assertTrue(self.distribution.owns('deployment/1'))
+        self.distribution.owned_partitions = {(partition + 1) % 4}
+        self.assertFalse(self.distribution.owns('deployment/1'))
+
+    @patch.object(DistributionBase, '_job_distribution')
+    def test_partitioned_distribution(self, mock_job_distribution):
+        partitioner = self.distributor.kz.SetPartitioner.return_value
+        partitioner.failed = False
+        partitioner.release = False
+        partitioner.allocating = False
+        partitioner.acquired = True
+        partitioner.__iter__.return_value = iter([0, 2])
+
+        def job_distribution(keep_running):
+            self.assertEqual({0, 2}, self.distribution.owned_partitions)
+            self.assertTrue(keep_running())
+            self.distributor.stop_event.set()
+
+        mock_job_distribution.side_effect = job_distribution
+        self.distribution._start_distribution()
+        self.distributor.kz.SetPartitioner.assert_called_once()
+        self.distributor.kz.Election.assert_not_called()
+        mock_job_distribution.assert_called_once()
+        partitioner.finish.assert_called_once()
+        self.assertEqual(set(), self.distribution.owned_partitions)
+
+    def test_partitioner_identifier_unique_for_same_name(self):
+        self.distributor.name = 'distributor'
+        other = DistributionBase('foo', self.distributor)
+        other.partitions = 4
+        for distribution in (self.distribution, other):
+            self.distributor.kz.SetPartitioner.return_value.failed = True
+            with self.assertRaises(Exception):
+                distribution._start_distribution()
+        first, second = [c.kwargs['identifier']
+                         for c in self.distributor.kz.SetPartitioner.call_args_list]
+        self.assertTrue(first.startswith('distributor-'))
+        self.assertTrue(second.startswith('distributor-'))
+        self.assertNotEqual(first, second)
+
+    def test_partitioned_distribution_failure(self):
+        partitioner = self.distributor.kz.SetPartitioner.return_value
+        partitioner.failed = True
+        with self.assertRaises(Exception):
+            self.distribution._start_distribution()
+        partitioner.finish.assert_called_once()
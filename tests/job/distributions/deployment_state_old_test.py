@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nuvla.api.models import CimiCollection
+from nuvla.job_engine.job.distribution import DistributionBase
+from nuvla.job_engine.job.distribution_config import DistributionConfig
+from nuvla.job_engine.job.distributions.deployment_state_old import \
+    DeploymentStateOldJobsDistribution, MAX_PAGE_SIZE
+
+
+def collection(count=0, ids=()):
+    return CimiCollection({'count': count, 'resources': [
+        {'id': i, 'parent': 'credential/1'} for i in ids]})
+
+
+class TestDeploymentStateOldJobsDistribution(unittest.TestCase):
+
+    def setUp(self):
+        self.patcher = patch.object(DistributionBase, '_start_distribution')
+        self.patcher.start()
+        self.distributor = MagicMock()
+        self.distributor.config = DistributionConfig()
+        self.api = self.distributor.api
+        self.jd = DeploymentStateOldJobsDistribution(self.distributor)
+        self.jd.sweep_slots = 2
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_sleep_time_is_slot_interval(self):
+        self.assertEqual(30, self.jd._get_sleep_time())
+
+    def test_sweep_over_slots(self):
+        credentials = collection(ids=['credential/1'])
+        self.api.search.side_effect = [
+            collection(count=3), collection(ids=['deployment/1', 'deployment/2']), credentials,
+            collection(ids=['deployment/3']), credentials,
+            collection(count=1), collection(ids=['deployment/1']), credentials]
+
+        self.assertEqual(['deployment/1', 'deployment/2'],
+                         [d.id for d in self.jd.get_deployments()])
+        page_search = self.api.search.call_args_list[1]
+        self.assertEqual(2, page_search.kwargs['last'])
+        self.assertEqual('id:asc', page_search.kwargs['orderby'])
+
+        self.assertEqual(['deployment/3'], [d.id for d in self.jd.get_deployments()])
+        self.assertIn("id>'deployment/2'", self.api.search.call_args_list[3].kwargs['filter'])
+
+        # short page ended the sweep, a new one starts
+        self.assertEqual(['deployment/1'], [d.id for d in self.jd.get_deployments()])
+        self.assertEqual(0, self.api.search.call_args_list[5].kwargs['last'])
+        self.assertNotIn('id>', self.api.search.call_args_list[6].kwargs['filter'])
+
+    def test_growth_during_sweep_bounded_to_slots(self):
+        credentials = collection(ids=['credential/1'])
+        self.api.search.side_effect = [
+            collection(count=1), collection(ids=['deployment/1']), credentials,
+            collection(ids=['deployment/2', 'deployment/3', 'deployment/4']), credentials,
+            collection(count=4), collection(ids=['deployment/1', 'deployment/2']), credentials]
+
+        self.assertEqual(['deployment/1'], [d.id for d in self.jd.get_deployments()])
+        self.assertEqual(1, self.api.search.call_args_list[1].kwargs['last'])
+
+        # last slot of the sweep takes the remaining deployments
+        self.assertEqual(['deployment/2', 'deployment/3', 'deployment/4'],
+                         [d.id for d in self.jd.get_deployments()])
+        self.assertEqual(MAX_PAGE_SIZE, self.api.search.call_args_list[3].kwargs['last'])
+
+        # a new sweep starts with a page size for the new count
+        self.assertEqual(['deployment/1', 'deployment/2'],
+                         [d.id for d in self.jd.get_deployments()])
+        self.assertEqual(0, self.api.search.call_args_list[5].kwargs['last'])
+        self.assertEqual(2, self.api.search.call_args_list[6].kwargs['last'])
@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 
 import unittest
+from unittest.mock import MagicMock
+
+from nuvla.api.models import CimiCollection, CimiResource
 
 from nuvla.job_engine.job.distributions.deployment_state import DeploymentStateJobsDistribution
 
@@ -11,3 +14,17 @@ class TestDeploymentStateJobsDistributor(unittest.TestCase):
         jd = DeploymentStateJobsDistribution('', None)
 
         self.assertEqual(0, len(list(jd.job_generator())))
+
+    def test_existing_jobs_counted_as_duplicates(self):
+        distributor = MagicMock()
+        distributor.api.search.return_value = CimiCollection({'count': 1, 'resources': [
+            {'id': 'job/1', 'target-resource': {'href': 'deployment/1'}}]})
+        jd = DeploymentStateJobsDistribution('', distributor)
+        jd.get_deployments = lambda: [CimiResource({'id': f'deployment/{i}'}) for i in range(3)]
+        jd._publish_metric = MagicMock()
+
+        jobs = list(jd.job_generator())
+        self.assertEqual(['deployment/0', 'deployment/2'],
+                         [job['target-resource']['href'] for job in jobs])
+        self.assertEqual(1, jd.duplicates)
+        jd._publish_metric.assert_called_once_with('skipped_exist', 1)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import unittest
+from unittest.mock import MagicMock, Mock, patch
+
+from nuvla.api import NuvlaError
+from nuvla.job_engine.job.distribution import DistributionBase
+from nuvla.job_engine.job.distributions.nuvlabox_offline import \
+    NuvlaBoxOfflineDistribution
+
+
+class TestNuvlaBoxOfflineDistribution(unittest.TestCase):
+
+    def setUp(self):
+        self.patcher = patch.object(DistributionBase, '_start_distribution')
+        self.patcher.start()
+        self.distributor = MagicMock()
+        self.api = self.distributor.api
+        self.jd = NuvlaBoxOfflineDistribution(self.distributor)
+        self.jd.collect_offline = Mock(return_value=['nuvlabox/1', 'nuvlabox/2'])
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def run_cycle(self):
+        self.assertEqual([], self.jd.job_generator())
+
+    def unsupported_bulk(self):
+        response = Mock()
+        response.status_code = 405
+        self.api.operation_bulk.side_effect = NuvlaError('not supported', response)
+
+    def test_bulk_set_offline(self):
+        self.run_cycle()
+        self.api.operation_bulk.assert_called_once_with(
+            'nuvlabox', "id=['nuvlabox/1', 'nuvlabox/2']", 'set-offline', {})
+        self.api.operation.assert_not_called()
+
+    def test_set_offline_by_href_without_bulk(self):
+        self.unsupported_bulk()
+        self.run_cycle()
+        self.assertFalse(self.jd.bulk_supported)
+        self.assertEqual({'nuvlabox/1', 'nuvlabox/2'},
+                         {c.args[0].id for c in self.api.operation.call_args_list})
+        self.api.get.assert_not_called()
+        # bulk isn't tried again
+        self.jd.collect_offline.return_value = ['nuvlabox/3']
+        self.run_cycle()
+        self.api.operation_bulk.assert_called_once()
+        self.assertEqual(3, self.api.operation.call_count)
+
+    def test_pending_nuvlaboxes_are_not_set_offline_again(self):
+        self.run_cycle()
+        self.jd.collect_offline.return_value = ['nuvlabox/2', 'nuvlabox/3']
+        self.run_cycle()
+        self.assertEqual("id=['nuvlabox/3']", self.api.operation_bulk.call_args.args[1])
+        self.assertEqual({'nuvlabox/2', 'nuvlabox/3'}, set(self.jd.pending))
+
+    @patch('nuvla.job_engine.job.distributions.nuvlabox_offline.PENDING_TTL', 0)
+    def test_pending_nuvlaboxes_expire(self):
+        self.run_cycle()
+        self.run_cycle()
+        self.assertEqual(2, self.api.operation_bulk.call_count)
+
+    def test_failed_nuvlaboxes_are_retried(self):
+        self.unsupported_bulk()
+        self.api.operation.side_effect = [ConnectionError('down'), None]
+        self.jd.collect_offline.return_value = ['nuvlabox/1']
+        self.run_cycle()
+        self.assertEqual({}, self.jd.pending)
+        self.run_cycle()
+        self.assertEqual(2, self.api.operation.call_count)
+        self.assertIn('nuvlabox/1', self.jd.pending)
+
+    def test_only_owned_nuvlaboxes(self):
+        self.jd.owns = lambda nb_id: nb_id == 'nuvlabox/2'
+        self.run_cycle()
+        self.assertEqual("id=['nuvlabox/2']", self.api.operation_bulk.call_args.args[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
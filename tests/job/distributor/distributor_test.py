@@ -1,5 +1,7 @@
+import argparse
 import sys
 import time
+import threading
 import unittest
 from unittest.mock import MagicMock, patch, Mock
 from nuvla.job_engine.job.base import Base
@@ -17,6 +19,7 @@ class DummyTestActionsDistribution(DistributionBase):
     def __init__(self, distributor):
         super(DummyTestActionsDistribution, self).__init__(self.DISTRIBUTION_NAME, distributor)
         self.collect_interval = 15  # 15s
+        self.jitter = 0
         self._start_distribution()
 
     def _start_distribution(self):
@@ -26,53 +29,143 @@ class DummyTestActionsDistribution(DistributionBase):
     def job_generator(self):
         raise Exception('failed')
 
+class DryRunDistribution(DistributionBase):
+
+    def __init__(self, distributor):
+        super(DryRunDistribution, self).__init__('dummy_action', distributor)
+        self._start_distribution()
+
+    def job_exists(self, job):
+        return job['target-resource']['href'] == 'x/2'
+
+    @override
+    def job_generator(self):
+        self.distributor.publish_metric('job_distribution.dummy_action.found', 3)
+        for i in range(3):
+            job = {'action': 'dummy_action', 'target-resource': {'href': f'x/{i}'}}
+            if not self.job_exists(job):
+                yield job
+
+
 class DistributorTestCase(unittest.TestCase):
 
     @patch.object(Base, '__init__')
     def setUp(self, mock_base):
         self.distributor = Distributor()
         self.distributor.name = 'toto'
+        self.distributor.statsd = None
+        self.distributor.prometheus = None
         self.distributor.args = MagicMock()
+        self.distributor.args.distribution_config_zk = None
+        self.distributor.args.distribution_config_file = None
+        self.distributor.args.dry_run = False
+        self.stop_event = threading.Event()
+
+    def _do_work_until(self, condition, timeout=5):
+        with patch.object(Base, 'stop_event', self.stop_event), \
+                patch.object(sys, 'exit') as mock_sys_exit:
+            thread = threading.Thread(target=self.distributor.do_work)
+            thread.start()
+            deadline = time.monotonic() + timeout
+            while not condition() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.stop_event.set()
+            thread.join(timeout)
+        mock_sys_exit.assert_called_once_with(0)
 
     @patch.object(sys, 'exit')
     @patch.object(Base, 'stop_event')
     def test_distributor_should_shutdown_on_stop_event(self, mock_stop_event, mock_sys_exit):
         mock_stop_event.is_set.return_value = True
+        mock_stop_event.wait.return_value = True
         self.distributor.do_work()
         mock_sys_exit.assert_called_once_with(0)
 
     @patch('nuvla.job_engine.job.distributor.distributor.distributions', {"a": None})
-    @patch.object(sys, 'exit')
-    @patch.object(Base, 'stop_event')
-    def test_distributor_should_loop_until_stop_event_is_set(self, mock_stop_event, mock_sys_exit):
-        self.distributor.check_and_recreate_thread_on_exception = Mock()
-        mock_stop_event.is_set.side_effect = [False, False, False, True]
-        self.distributor.do_work()
-        self.assertEqual(self.distributor.check_and_recreate_thread_on_exception.call_count, 3)
-        mock_sys_exit.assert_called_once_with(0)
+    @patch('nuvla.job_engine.job.distributor.distributor.HEALTH_INTERVAL', 0.01)
+    @patch('nuvla.job_engine.job.distributor.distributor.get_distribution')
+    @patch.object(Distributor, 'publish_health')
+    def test_distributor_should_report_health_until_stop_event_is_set(
+            self, mock_publish_health, _mock_get_distribution):
+        self._do_work_until(lambda: mock_publish_health.call_count >= 3)
+        self.assertGreaterEqual(mock_publish_health.call_count, 3)
 
     @patch('nuvla.job_engine.job.distributor.distributor.distributions', {"a": None})
+    @patch('nuvla.job_engine.job.distributor.distributor.RESTART_BACKOFF_MIN', 0.01)
     @patch('nuvla.job_engine.job.distributor.distributor.get_distribution')
-    @patch.object(sys, 'exit')
-    @patch.object(Base, 'stop_event')
+    @patch.object(Distributor, 'publish_counter')
     def test_distributor_distribution_thread_should_be_recreated_in_case_of_exception(
-            self, mock_stop_event, mock_sys_exit, mock_get_distribution):
-        mock_get_distribution.return_value = Mock(side_effect=[Exception(), 1])
-        mock_stop_event.is_set.side_effect = [False, False, True]
-        self.distributor.do_work()
+            self, mock_publish_counter, mock_get_distribution):
+        mock_get_distribution.return_value = Mock(side_effect=[Exception('boom'), 1])
+        self._do_work_until(lambda: mock_get_distribution.call_count >= 2)
         mock_get_distribution.assert_called_with("a")
         self.assertEqual(mock_get_distribution.call_count, 2)
-        mock_sys_exit.assert_called_once_with(0)
+        mock_publish_counter.assert_called_once_with('distributor.restarts', distribution='a')
+        self.assertEqual({'a': {'state': 'finished', 'restarts': 1,
+                                'last_error': "Exception('boom')"}},
+                         self.distributor.health())
 
     @patch('nuvla.job_engine.job.distributor.distributor.distributions', {"dummy_action": DummyTestActionsDistribution})
+    @patch('nuvla.job_engine.job.distributor.distributor.RESTART_BACKOFF_MIN', 0.01)
     @patch('nuvla.job_engine.job.distributor.distributor.get_distribution')
-    @patch.object(sys, 'exit')
-    @patch.object(Base, 'stop_event')
     def test_distributor_distribution_thread_should_be_recreated_in_case_of_exception_while_generating_job(
-            self, mock_stop_event, mock_sys_exit, mock_get_distribution):
-
+            self, mock_get_distribution):
         mock_get_distribution.return_value = DummyTestActionsDistribution
-        mock_stop_event.is_set.side_effect = [False, False, False, False, True, True]
-        self.distributor.do_work()
-        self.assertEqual(mock_get_distribution.call_count, 3)
+        self._do_work_until(lambda: mock_get_distribution.call_count >= 3)
+        self.assertGreaterEqual(mock_get_distribution.call_count, 3)
+
+    @patch('nuvla.job_engine.job.distributor.distributor.distributions', {"a": None, "b": None})
+    @patch('nuvla.job_engine.job.distributor.distributor.get_distribution')
+    def test_distributor_starts_distribution_included_by_config(self, mock_get_distribution):
+        self.distributor.args.distribution_exclude = ['b']
+
+        def include_b():
+            if 'a' not in self.distributor.futures:
+                return False
+            self.assertNotIn('b', self.distributor.futures)
+            self.distributor.config.update({'distributions': {'b': {'exclude': False}}})
+            return True
+
+        self._do_work_until(lambda: include_b() and 'b' in self.distributor.futures)
+        self.assertEqual([unittest.mock.call('a'), unittest.mock.call('b')],
+                         mock_get_distribution.call_args_list)
+
+    @patch('nuvla.job_engine.job.distributor.distributor.distributions',
+           {"dummy_action": DummyTestActionsDistribution, "b": None})
+    @patch('nuvla.job_engine.job.distributor.distributor.get_distribution')
+    def test_dry_run(self, mock_get_distribution):
+        self.distributor.args.dry_run = True
+        self.distributor.args.dry_run_record = None
+        self.distributor.args.profile = False
+        self.distributor.args.distribution_exclude = ['b']
+        self.distributor.api_traffic = MagicMock()
+        self.distributor.api_traffic.snapshot.return_value = (0, 0)
+        self.distributor._active_jobs = MagicMock()
+        mock_get_distribution.return_value = DryRunDistribution
+        with patch.object(sys, 'exit') as mock_sys_exit:
+            self.distributor.do_work()
         mock_sys_exit.assert_called_once_with(0)
+        mock_get_distribution.assert_called_once_with('dummy_action')
+        self.distributor._active_jobs.refresh.assert_called_once_with(force=True)
+        metrics = self.distributor.dry_run_report.metrics
+        self.assertEqual({'jobs': 2, 'duplicates': 1, 'found': 3},
+                         {k: v for k, v in metrics['dummy_action'].items()
+                          if k in ('jobs', 'duplicates', 'found')})
+        self.assertIn('api_calls', metrics['active_jobs'])
+        self.assertIn('dummy_action', self.distributor.dry_run_report.render())
+
+    def test_live_config_sources_are_exclusive(self):
+        parser = argparse.ArgumentParser()
+        self.distributor._set_command_specific_options(parser)
+        args = parser.parse_args(['--distribution-config-file', 'config.json'])
+        self.assertEqual('config.json', args.distribution_config_file)
+        with patch.object(sys, 'stderr'), self.assertRaises(SystemExit):
+            parser.parse_args(['--distribution-config-zk', '/config',
+                               '--distribution-config-file', 'config.json'])
+        with patch.object(sys, 'stderr'), self.assertRaises(SystemExit):
+            parser.parse_args(['--distribution-interval', 'usage_report:often'])
+
+    def test_restart_delay_backoff(self):
+        self.assertEqual([1, 1, 2, 4, 8],
+                         [Distributor.restart_delay(n) for n in range(5)])
+        self.assertEqual(300, Distributor.restart_delay(20))
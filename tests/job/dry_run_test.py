@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from requests import Session
+
+from nuvla.job_engine.job.dry_run import ApiTraffic, DryRunReport, FixtureAdapter, ReadOnlyApi, \
+    ReadOnlyKazoo
+from nuvla.job_engine.job.job_queue import age_queue_entries
+
+
+class DryRunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.fixture = os.path.join(self.directory.name, 'fixture.json')
+        with open(self.fixture, 'w') as f:
+            json.dump({'responses': {'PUT /api/job filter=x': {
+                'status': 200, 'content': '{"count": 0, "resources": []}'}}}, f)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def session(self, traffic):
+        session = Session()
+        adapter = FixtureAdapter(self.fixture)
+        session.mount('https://', adapter)
+        traffic.watch(session)
+        return session
+
+    def test_fixture_replay_and_record(self):
+        traffic = ApiTraffic(record=True)
+        session = self.session(traffic)
+        response = session.put('https://nuvla.io/api/job', data={'filter': 'x'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'count': 0, 'resources': []}, response.json())
+        self.assertEqual(404, session.get('https://nuvla.io/api/job/1').status_code)
+        calls, size = traffic.snapshot()
+        self.assertEqual(2, calls)
+        self.assertEqual(len('{"count": 0, "resources": []}') + len('filter=x')
+                         + len('{"status": 404, "message": "not recorded"}'), size)
+        recorded = os.path.join(self.directory.name, 'recorded.json')
+        traffic.save(recorded)
+        with open(recorded) as f:
+            responses = json.load(f)['responses']
+        self.assertEqual(['GET /api/job/1', 'PUT /api/job filter=x'], sorted(responses))
+
+    def test_read_only_api(self):
+        api = MagicMock()
+        read_only = ReadOnlyApi(api)
+        read_only.search('job')
+        self.assertIsNone(read_only.operation_bulk('nuvlabox', 'id=[]', 'set-offline', {}))
+        self.assertIsNone(read_only.add('job', {}))
+        api.search.assert_called_once_with('job')
+        api.operation_bulk.assert_not_called()
+        api.add.assert_not_called()
+
+    def test_read_only_kazoo(self):
+        kz = MagicMock()
+        kz.get_children.side_effect = lambda path: \
+            [] if path.endswith('/taken') else ['entry-500-0000000001']
+        kz.get.return_value = (b'job/1', MagicMock(ctime=0))
+        read_only = ReadOnlyKazoo(kz)
+        self.assertEqual(1, age_queue_entries(read_only, '/job', 300, 100, 50))
+        self.assertIsNone(read_only.create('/job-lane-consumers/a/b-', ephemeral=True))
+        kz.get.assert_called_once_with('/job/entries/entry-500-0000000001')
+        kz.transaction.assert_not_called()
+        kz.create.assert_not_called()
+
+    def test_report(self):
+        report = DryRunReport()
+        report.record('job_distribution.foo.dry_run.jobs', 2)
+        report.record('job_distribution.foo.dry_run.api_calls', 5)
+        report.record('job_distribution.foo.skipped_exist', 1)
+        report.record('distributor.api_pool.in_use', 1)
+        report.error('bar', Exception('boom'))
+        self.assertEqual({'foo': {'jobs': 2, 'api_calls': 5, 'skipped_exist': 1}},
+                         report.metrics)
+        lines = report.render().split('\n')
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[0].startswith('distribution'))
+        self.assertIn("error=Exception('boom')", lines[1])
+        self.assertEqual(['foo', '5', '-', '-', '2', '-', 'skipped_exist=1'], lines[2].split())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+"""
+In-process throughput benchmark of the executor.
+
+Executor.process_jobs is run against in-memory stand-ins of the Nuvla REST
+api (FakeNuvla) and of the ZooKeeper LockingQueue(s) (FakeZk), both with a
+configurable latency. The Nuvla stand-in can also fail a given ratio of the
+requests, and jobs are generated from a configurable mix of job kinds.
+
+The report gives the throughput in jobs/s, the p50/p95/p99 latency of jobs
+(from their first retrieval from the queue until they are consumed) and the
+number of api calls per job.
+
+Usage (from the repository root):
+
+    python -m tests.job.executor.benchmark --jobs 500 --workers 8 \\
+        --api-latency 0.005 --mix state:8:0 start:2:0.05:3
+"""
+
+import argparse
+import ast
+import json
+import logging
+import random
+import threading
+import time
+from argparse import Namespace
+from collections import Counter, defaultdict
+from unittest.mock import patch
+
+from nuvla.api import ConnectionError
+from nuvla.api.models import CimiCollection, CimiResource
+
+from nuvla.job_engine.job.actions import Actions, register_action
+from nuvla.job_engine.job.base import Base
+from nuvla.job_engine.job.executor.executor import Executor
+from nuvla.job_engine.job.job import Job, JOB_QUEUED, PRIORITY_NORMAL
+from nuvla.job_engine.job.job_queue import JOB_QUEUE_PATH
+
+BENCHMARK_ACTION = 'benchmark_action'
+
+
+class BenchmarkActionJob(object):
+    """Sleeps, reports progress and fails as told by the job payload."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def do_work(self):
+        payload = self.job.payload
+        steps = payload['progress']
+        for step in range(steps):
+            time.sleep(payload['duration'] / steps)
+            self.job.set_progress(int(100 * (step + 1) / steps))
+        if not steps:
+            time.sleep(payload['duration'])
+        if payload['fail']:
+            raise Exception('Simulated action failure')
+        return 0
+
+
+class JobKind(object):
+
+    def __init__(self, name, weight=1, duration=0.0, progress=0, failure_rate=0.0):
+        self.name = name
+        self.weight = weight
+        self.duration = duration
+        self.progress = progress
+        self.failure_rate = failure_rate
+
+    @classmethod
+    def from_arg(cls, arg):
+        """NAME:WEIGHT[:DURATION[:PROGRESS[:FAILURE_RATE]]]"""
+        name, *values = arg.split(':')
+        types = (int, float, int, float)
+        return cls(name, *[t(v) for t, v in zip(types, values)])
+
+
+DEFAULT_MIX = (JobKind('short', weight=8),
+               JobKind('long', weight=2, duration=0.02, progress=4))
+
+
+class Latency(object):
+
+    def __init__(self, mean=0.0, jitter=0.5, seed=0):
+        self.mean = mean
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.mean > 0:
+            with self._lock:
+                factor = self._random.uniform(1 - self.jitter, 1 + self.jitter)
+            time.sleep(self.mean * factor)
+
+
+class FakeNuvla(object):
+    """
+    Thread safe in-memory stand-in of the subset of nuvla.api.Api used by the
+    executor and the jobs. Calls are counted per method.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = Latency(latency, seed=seed)
+        self.error_rate = error_rate
+        self.documents = {}
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, method):
+        with self._lock:
+            self.calls[method] += 1
+            fail = self._random.random() < self.error_rate
+        self.latency.wait()
+        if fail:
+            raise ConnectionError(f'Simulated {method} failure')
+
+    def _document(self, resource_id, select=None):
+        data = json.loads(json.dumps(self.documents[resource_id]))
+        if select:
+            data = {k: v for k, v in data.items()
+                    if k in select.split(',') or k == 'id'}
+        return data
+
+    def add_job(self, data):
+        with self._lock:
+            job_id = f'job/{len(self.documents) + 1}'
+            self.documents[job_id] = {'id': job_id, 'resource-type': 'job',
+                                      'state': JOB_QUEUED, 'version': 2, **data}
+        return job_id
+
+    def get(self, resource_id, select=None):
+        self._call('get')
+        with self._lock:
+            return CimiResource(self._document(resource_id, select))
+
+    def search(self, resource_type, filter=None, last=None, **_kwargs):
+        self._call('search')
+        ids = ast.literal_eval(filter.partition('=')[2]) if filter else []
+        with self._lock:
+            resources = [self._document(i) for i in ids if i in self.documents][:last]
+        return CimiCollection({'count': len(resources), 'resources': resources})
+
+    def edit(self, resource_id, data):
+        self._call('edit')
+        with self._lock:
+            self.documents[resource_id].update(data)
+            return CimiResource(self._document(resource_id))
+
+    def operation(self, resource, operation, data=None):
+        self._call(f'operation {operation}')
+        return CimiResource({})
+
+
+class FakeQueueStore(object):
+
+    def __init__(self):
+        self.entries = {}
+        self.taken = set()
+        self.sequence = 0
+
+
+class FakeLockingQueue(object):
+    """
+    Stand-in of kazoo LockingQueue: holds at most one locked element at a
+    time, served by lowest priority then insertion order.
+    """
+
+    def __init__(self, zk, path):
+        self.zk = zk
+        self.path = path
+        self.processing_element = None
+        self._entry = None
+
+    def put(self, value, priority=100):
+        self.zk.latency.wait()
+        self.zk.put(self.path, value, priority)
+
+    def get(self, timeout=None):
+        self.zk.latency.wait()
+        self._entry, self.processing_element = self.zk.take(self.path, timeout)
+        return self.processing_element
+
+    def _finish(self, consumed):
+        self.zk.latency.wait()
+        self.zk.finish(self.path, self._entry, self.processing_element, consumed)
+        self._entry = self.processing_element = None
+        return True
+
+    def consume(self):
+        return self._finish(True)
+
+    def release(self):
+        return self._finish(False)
+
+
+class FakeZk(object):
+    """
+    Stand-in of the KazooClient operations used by the executor: it creates
+    FakeLockingQueue(s) and exposes their entries like ZooKeeper nodes for the
+    job prefetcher.
+    """
+
+    def __init__(self, latency=0.0, seed=0):
+        self.latency = Latency(latency, seed=seed)
+        self.stores = defaultdict(FakeQueueStore)
+        self.first_taken = {}
+        self.latencies = {}
+        self.consumed = Counter()
+        self.released = Counter()
+        self.closed = False
+        self._condition = threading.Condition()
+
+    def LockingQueue(self, path):
+        return FakeLockingQueue(self, path)
+
+    def put(self, path, value, priority):
+        with self._condition:
+            store = self.stores[path]
+            store.sequence += 1
+            store.entries[f'entry-{priority:03d}-{store.sequence:010d}'] = value
+            self._condition.notify()
+
+    def _next_entry(self, store):
+        for entry in sorted(store.entries):
+            if entry not in store.taken:
+                return entry
+        return None
+
+    def take(self, path, timeout):
+        deadline = time.monotonic() + (timeout or 0)
+        with self._condition:
+            store = self.stores[path]
+            entry = self._next_entry(store)
+            while entry is None and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, None
+                self._condition.wait(remaining)
+                entry = self._next_entry(store)
+            if entry is None:
+                return None, None
+            store.taken.add(entry)
+            value = store.entries[entry]
+            self.first_taken.setdefault(value, time.perf_counter())
+            return entry, value
+
+    def finish(self, path, entry, value, consumed):
+        with self._condition:
+            store = self.stores[path]
+            store.taken.discard(entry)
+            if consumed:
+                del store.entries[entry]
+                self.consumed[path] += 1
+                self.latencies[value] = time.perf_counter() - self.first_taken[value]
+            else:
+                self.released[path] += 1
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def _split(self, path):
+        queue_path, _, node = path.rpartition('/')
+        return self.stores[queue_path], node
+
+    def get_children(self, path):
+        with self._condition:
+            store, node = self._split(path)
+            return list(store.entries if node == 'entries' else store.taken)
+
+    def get(self, path):
+        with self._condition:
+            store, _ = self._split(path.rpartition('/')[0])
+            return store.entries[path.rpartition('/')[2]], None
+
+    def exists(self, path):
+        return path in self.stores
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)]
+
+
+class BenchmarkReport(object):
+
+    def __init__(self, jobs, duration, latencies, api_calls, consumed, released):
+        self.jobs = jobs
+        self.duration = duration
+        self.latencies = latencies
+        self.api_calls = api_calls
+        self.consumed = consumed
+        self.released = released
+
+    @property
+    def jobs_per_second(self):
+        return self.jobs / self.duration if self.duration else 0.0
+
+    @property
+    def api_calls_per_job(self):
+        return sum(self.api_calls.values()) / self.jobs if self.jobs else 0.0
+
+    def latency(self, p, kind=None):
+        return percentile([latency for job_kind, latency in self.latencies
+                           if kind is None or job_kind == kind], p)
+
+    def __str__(self):
+        kinds = sorted({kind for kind, _ in self.latencies})
+        lines = [f'jobs:           {self.jobs} in {self.duration:.3f}s',
+                 f'throughput:     {self.jobs_per_second:.1f} jobs/s',
+                 f'api calls/job:  {self.api_calls_per_job:.2f} '
+                 f'({", ".join(f"{k}: {v}" for k, v in sorted(self.api_calls.items()))})',
+                 f'queue:          {self.consumed} consumed, {self.released} released']
+        for kind in [None] + kinds:
+            lines.append(f'latency {kind or "all":<7} '
+                         f'p50 {self.latency(50, kind) * 1000:.1f}ms  '
+                         f'p95 {self.latency(95, kind) * 1000:.1f}ms  '
+                         f'p99 {self.latency(99, kind) * 1000:.1f}ms')
+        return '\n'.join(lines)
+
+
+def _executor(api, zk, workers, prefetch_jobs):
+    with patch.object(Base, '__init__', return_value=None):
+        executor = Executor()
+    executor.name = 'benchmark'
+    executor.api = api
+    executor.kz = zk
+    executor.args = Namespace(max_concurrent_jobs=workers, lanes=[],
+                              nuvlaedge_fs=None, job_id=None)
+    executor.queues = executor._build_queues()
+    executor.queue = executor.queues[0]
+    if prefetch_jobs > 1:
+        from nuvla.job_engine.job.executor.prefetch import JobPrefetcher
+        executor.prefetcher = JobPrefetcher(api, zk, max_size=prefetch_jobs, max_age=60,
+                                            context_workers=0)
+    return executor
+
+
+def run_benchmark(jobs=200, workers=4, mix=DEFAULT_MIX, api_latency=0.0,
+                  zk_latency=0.0, error_rate=0.0, prefetch_jobs=0,
+                  job_update_interval=0.0, seed=0, timeout=300):
+    """
+    Queues `jobs` jobs drawn from `mix`, processes them with an executor
+    running `workers` concurrent workers and returns a BenchmarkReport.
+    """
+    rand = random.Random(seed)
+    api = FakeNuvla(latency=api_latency, error_rate=error_rate, seed=seed)
+    zk = FakeZk(latency=zk_latency, seed=seed)
+    kinds = {}
+    for kind in rand.choices(mix, weights=[k.weight for k in mix], k=jobs):
+        payload = {'duration': kind.duration, 'progress': kind.progress,
+                   'fail': rand.random() < kind.failure_rate}
+        job_id = api.add_job({'action': BENCHMARK_ACTION, 'payload': json.dumps(payload)})
+        kinds[job_id] = kind.name
+        zk.put(JOB_QUEUE_PATH, job_id.encode(), PRIORITY_NORMAL)
+    api.calls.clear()
+
+    executor = _executor(api, zk, workers, prefetch_jobs)
+    # registered only while the benchmark runs, not on import
+    registry = [patch.dict(Actions.actions), patch.dict(Actions.lanes),
+                patch.dict(Actions.priorities)]
+    for registry_patch in registry:
+        registry_patch.start()
+    register_action(BENCHMARK_ACTION, BenchmarkActionJob)
+
+    def process_jobs():
+        try:
+            executor.process_jobs()
+        except SystemExit:
+            pass
+
+    update_interval = Job.update_interval
+    Job.update_interval = job_update_interval
+    Base.stop_event.clear()
+    thread = threading.Thread(target=process_jobs, daemon=True)
+    start = time.perf_counter()
+    try:
+        thread.start()
+        deadline = time.monotonic() + timeout
+        while zk.consumed[JOB_QUEUE_PATH] < jobs and thread.is_alive():
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Only {zk.consumed[JOB_QUEUE_PATH]}/{jobs} '
+                                   f'jobs processed in {timeout}s')
+            time.sleep(0.001)
+        duration = time.perf_counter() - start
+    finally:
+        Base.stop_event.set()
+        zk.close()
+        thread.join()
+        Base.stop_event.clear()
+        Job.update_interval = update_interval
+        for registry_patch in registry:
+            registry_patch.stop()
+
+    latencies = [(kinds[job_id.decode()], latency) for job_id, latency in zk.latencies.items()]
+    return BenchmarkReport(zk.consumed[JOB_QUEUE_PATH], duration, latencies, api.calls,
+                           zk.consumed[JOB_QUEUE_PATH], zk.released[JOB_QUEUE_PATH])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Executor throughput benchmark')
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mix', type=JobKind.from_arg, nargs='+', default=DEFAULT_MIX,
+                        metavar='NAME:WEIGHT[:DURATION[:PROGRESS[:FAILURE_RATE]]]')
+    parser.add_argument('--api-latency', type=float, default=0.002, metavar='SECONDS')
+    parser.add_argument('--zk-latency', type=float, default=0.001, metavar='SECONDS')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--prefetch-jobs', type=int, default=0)
+    parser.add_argument('--job-update-interval', type=float, default=0.0, metavar='SECONDS')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    print(run_benchmark(jobs=args.jobs, workers=args.workers, mix=args.mix,
+                        api_latency=args.api_latency, zk_latency=args.zk_latency,
+                        error_rate=args.error_rate, prefetch_jobs=args.prefetch_jobs,
+                        job_update_interval=args.job_update_interval, seed=args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import unittest
+
+from nuvla.job_engine.job.actions import get_action
+from tests.job.executor.benchmark import BENCHMARK_ACTION, JobKind, percentile, run_benchmark
+
+
+class ExecutorBenchmarkTestCase(unittest.TestCase):
+    """
+    Small runs of the executor benchmark, checking the number of api calls
+    per job of the job lifecycle.
+    """
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(51, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertEqual(0.0, percentile([], 99))
+
+    def test_job_kind_from_arg(self):
+        kind = JobKind.from_arg('deploy:2:0.5:4')
+        self.assertEqual(('deploy', 2, 0.5, 4, 0.0),
+                         (kind.name, kind.weight, kind.duration, kind.progress,
+                          kind.failure_rate))
+
+    def test_job_lifecycle_api_calls(self):
+        report = run_benchmark(jobs=40, workers=4, mix=[JobKind('short')])
+        self.assertEqual(40, report.jobs)
+        self.assertEqual(0, report.released)
+        # get, edit to running, edit to final state
+        self.assertEqual({'get': 40, 'edit': 80}, dict(report.api_calls))
+        self.assertEqual(3, report.api_calls_per_job)
+        self.assertGreater(report.jobs_per_second, 0)
+        self.assertLessEqual(report.latency(50), report.latency(99))
+        self.assertIsNone(get_action(BENCHMARK_ACTION), 'action unregistered after the run')
+
+    def test_prefetch_saves_job_retrievals(self):
+        report = run_benchmark(jobs=40, workers=2, mix=[JobKind('short')],
+                               prefetch_jobs=10)
+        self.assertEqual(40, report.jobs)
+        self.assertLess(report.api_calls['get'] + report.api_calls['search'], 40)
+
+    def test_write_behind_saves_progress_edits(self):
+        mix = [JobKind('progress', progress=10)]
+        eager = run_benchmark(jobs=20, workers=2, mix=mix)
+        write_behind = run_benchmark(jobs=20, workers=2, mix=mix, job_update_interval=60)
+        self.assertEqual(12 * 20, eager.api_calls['edit'])
+        self.assertEqual(2 * 20, write_behind.api_calls['edit'])
+
+    def test_failing_api_jobs_are_retried(self):
+        report = run_benchmark(jobs=40, workers=4, mix=[JobKind('short')], error_rate=0.1)
+        self.assertEqual(40, report.jobs)
+        self.assertGreater(report.released, 0)
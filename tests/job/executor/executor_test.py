@@ -1,7 +1,9 @@
 import sys
+import argparse
+import threading
 import unittest
 from unittest.mock import MagicMock, patch, Mock
-from nuvla.job_engine.job.executor.executor import Executor, LocalOneJobQueue
+from nuvla.job_engine.job.executor.executor import Executor, LocalOneJobQueue, lane_arg
 from nuvla.job_engine.job.base import Base
 from nuvla.job_engine.job.job import Job, JobNotFoundError
 from nuvla.job_engine.job.actions import ActionNotImplemented
@@ -27,6 +29,8 @@ class ExecutorTestCase(unittest.TestCase):
         Executor.args = MagicMock()
         Executor.name = 'foo'
         self.executor = Executor()
+        self.executor.statsd = None
+        self.executor.prometheus = None
         self.executor.queue = MagicMock()
         self.executor.queue.get.return_value.decode.return_value = job_id
         self.executor.queue.processing_element = job_id
@@ -54,6 +58,27 @@ class ExecutorTestCase(unittest.TestCase):
         self.assertEqual(mock_process_job.call_count, 2)
         mock_sys.assert_called_once_with(0)
 
+    @patch.object(sys, 'exit')
+    @patch.object(Executor, 'process_job')
+    def test_process_jobs_concurrently(self, mock_process_job, mock_sys):
+        stop_event = threading.Event()
+        all_jobs_in_flight = threading.Barrier(2, timeout=5)
+
+        def process_job(*_args):
+            all_jobs_in_flight.wait()
+            stop_event.set()
+
+        mock_process_job.side_effect = process_job
+        self.executor.queues = [MagicMock(), MagicMock()]
+        for i, queue in enumerate(self.executor.queues):
+            queue.get.return_value = f'job/{i}'.encode()
+        with patch.object(Executor, 'stop_event', stop_event):
+            self.executor.process_jobs()
+        self.assertEqual(mock_process_job.call_count, 2)
+        processed = {call.args[3] for call in mock_process_job.call_args_list}
+        self.assertEqual({'job/0', 'job/1'}, processed)
+        mock_sys.assert_called_once_with(0)
+
     @patch.object(Job, '__init__', side_effect=Exception('Simulate exception'))
     def test_process_job_unexpected_error(self, _mock_job):
         with self.assertLogs(level='DEBUG') as lc:
@@ -117,3 +142,133 @@ class ExecutorTestCase(unittest.TestCase):
         mock_get_action_instance.return_value.do_work.side_effect = UnfinishedBulkActionToMonitor
         self.executor.process_job(Mock(), self.executor.queue, Mock(), job_id)
         mock_job.update_job.assert_not_called()
+
+    @patch('nuvla.job_engine.job.executor.executor.get_action_lane', return_value='fast')
+    def test_dispatch_job_to_action_lane(self, _mock_get_action_lane):
+        self.executor.kz = MagicMock()
+        self.executor.api.get.return_value.data = {'action': 'deployment_state_10',
+                                                   'priority': 50}
+        self.executor.dispatch_job(self.executor.queue, job_id)
+        self.executor.kz.LockingQueue.assert_called_once_with('/job-lane/fast')
+        self.executor.kz.LockingQueue.return_value.put.assert_called_once_with(b'job/1', 50)
+        self.executor.queue.consume.assert_called_once()
+
+    def test_dispatch_job_to_default_lane_when_action_unknown(self):
+        self.executor.kz = MagicMock()
+        self.executor.api.get.side_effect = Exception('Simulate exception')
+        self.executor.dispatch_job(self.executor.queue, job_id)
+        self.executor.kz.LockingQueue.assert_called_once_with('/job-lane/slow')
+        self.executor.queue.consume.assert_called_once()
+
+    @patch('nuvla.job_engine.job.executor.executor.get_action_lane', return_value='fast')
+    def test_dispatch_job_from_prefetched_document(self, _mock_get_action_lane):
+        self.executor.kz = MagicMock()
+        self.executor.prefetcher = MagicMock()
+        self.executor.prefetcher.peek.return_value.cimi_job.data = {'action': 'a',
+                                                                    'priority': 10}
+        self.executor.dispatch_job(self.executor.queue, job_id)
+        self.executor.prefetcher.peek.assert_called_once_with(self.executor.queue, job_id)
+        self.executor.api.get.assert_not_called()
+        self.executor.kz.LockingQueue.return_value.put.assert_called_once_with(b'job/1', 10)
+
+    @patch.object(Executor, 'publish_metric')
+    def test_dispatch_job_to_lane_without_consumer(self, mock_publish_metric):
+        self.executor.kz = MagicMock()
+        self.executor.kz.exists.return_value = True
+        self.executor.kz.get_children.side_effect = lambda path: \
+            [] if path == '/job-lane-consumers/slow' else ['entry-1', 'entry-2']
+        self.executor.api.get.side_effect = Exception('Simulate exception')
+        with self.assertLogs(level='WARNING') as lc:
+            self.executor.dispatch_job(self.executor.queue, job_id)
+            self.executor.dispatch_job(self.executor.queue, job_id)
+        self.assertEqual(1, len([line for line in lc.output if 'No executor subscribed' in line]))
+        mock_publish_metric.assert_called_once_with('executor.lanes.slow.unserved_depth', 2)
+
+    def test_lane_arg(self):
+        self.assertEqual(('fast', 8), lane_arg('fast:8'))
+        self.assertEqual(('slow', None), lane_arg('slow'))
+        for bad in ['fast:x', ':2']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                lane_arg(bad)
+
+    def test_dispatch_job_release_on_put_failure(self):
+        self.executor.kz = MagicMock()
+        self.executor.kz.LockingQueue.return_value.put.side_effect = Exception('zk down')
+        self.executor.dispatch_job(self.executor.queue, job_id)
+        self.executor.queue.release.assert_called_once()
+        self.executor.queue.consume.assert_not_called()
+
+    @patch.object(Executor, 'publish_timer')
+    @patch.object(Executor, 'publish_counter')
+    @patch('nuvla.job_engine.job.executor.executor.Job')
+    @patch.object(Executor, 'get_action_instance')
+    def test_process_job_publish_phase_metrics(self, mock_get_action_instance, mock_job,
+                                               mock_publish_counter, mock_publish_timer):
+        mock_job.return_value.get.side_effect = {'action': 'dummy_test_action'}.get
+        mock_get_action_instance.return_value.do_work.return_value = 0
+        self.executor.process_job(Mock(), self.executor.queue, Mock(), job_id)
+        phases = [call.args[0] for call in mock_publish_timer.call_args_list]
+        self.assertEqual(['executor.job.fetch', 'executor.job.construct',
+                          'executor.job.start', 'executor.job.do_work',
+                          'executor.job.final_update', 'executor.job.consume'], phases)
+        for call in mock_publish_timer.call_args_list:
+            self.assertEqual({'action': 'dummy_test_action', 'exit': 'success'}, call.kwargs)
+        mock_publish_counter.assert_called_once_with(
+            'executor.job', action='dummy_test_action', exit='success')
+
+    @patch.object(Executor, 'publish_timer')
+    @patch.object(Executor, 'publish_counter')
+    @patch.object(Job, 'get_cimi_job', side_effect=Exception('Simulate exception'))
+    def test_process_job_publish_released_metrics(self, _mock_get_cimi_job,
+                                                  mock_publish_counter, mock_publish_timer):
+        self.executor.process_job(Mock(), self.executor.queue, Mock(), job_id)
+        phases = [call.args[0] for call in mock_publish_timer.call_args_list]
+        self.assertEqual(['executor.job.fetch', 'executor.job.release'], phases)
+        mock_publish_counter.assert_called_once_with(
+            'executor.job', action='unknown', exit='released')
+
+    def test_hand_off_in_flight_jobs(self):
+        running_job, final_job = MagicMock(), MagicMock()
+        running_job.is_in_final_state.return_value = False
+        running_job.get.return_value = 40
+        final_job.is_in_final_state.return_value = True
+        queues = [MagicMock(), MagicMock(), MagicMock()]
+        self.executor._track('job/1', queues[0], running_job)
+        self.executor._track('job/2', queues[1], final_job)
+        self.executor._track('job/3', queues[2])
+        self.executor.hand_off_in_flight_jobs()
+        self.executor._in_flight_changed.release()
+        running_job.update_job.assert_called_once_with(
+            state='QUEUED',
+            status_message='Executor foo stopped before the end of the job '
+                           '(progress 40%), job queued again.')
+        queues[0].release.assert_called_once()
+        final_job.update_job.assert_not_called()
+        queues[1].consume.assert_called_once()
+        queues[2].release.assert_called_once()
+
+    @patch('nuvla.job_engine.job.executor.executor.os._exit')
+    @patch.object(Executor, 'hand_off_in_flight_jobs')
+    def test_drain_on_stop_within_timeout(self, mock_hand_off, mock_exit):
+        stop_event = threading.Event()
+        stop_event.set()
+        self.executor._track(job_id, self.executor.queue)
+        threading.Timer(0.05, self.executor._untrack, args=(job_id,)).start()
+        with patch.object(Executor, 'stop_event', stop_event):
+            self.executor.drain_on_stop(5)
+        mock_hand_off.assert_not_called()
+        mock_exit.assert_not_called()
+
+    @patch('nuvla.job_engine.job.executor.executor.os._exit')
+    @patch.object(Executor, 'hand_off_in_flight_jobs')
+    def test_drain_on_stop_timeout(self, mock_hand_off, mock_exit):
+        stop_event = threading.Event()
+        stop_event.set()
+        self.executor.kz = MagicMock()
+        self.executor._track(job_id, self.executor.queue)
+        with patch.object(Executor, 'stop_event', stop_event), \
+                patch('logging.shutdown'):
+            self.executor.drain_on_stop(0.01)
+        mock_hand_off.assert_called_once()
+        self.executor.kz.stop.assert_called_once()
+        mock_exit.assert_called_once_with(0)
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nuvla.api.models import CimiResource
+from nuvla.job_engine.job.executor.prefetch import JobPrefetcher
+
+
+class FakeZk(object):
+    def __init__(self, entries, taken=()):
+        self.entries = entries
+        self.taken = list(taken)
+
+    def get_children(self, path):
+        return list(self.entries) if path.endswith('/entries') else self.taken
+
+    def get(self, path):
+        return self.entries[path.rsplit('/', 1)[-1]].encode(), None
+
+
+class JobPrefetcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = MagicMock()
+        self.queue = MagicMock()
+        self.queue.path = '/job'
+        self.kz = FakeZk({'entry-100-0000000001': 'job/1',
+                          'entry-100-0000000002': 'job/2',
+                          'entry-100-0000000003': 'job/3'},
+                         taken=['entry-100-0000000001'])
+        self.api.search.return_value.resources = [
+            CimiResource({'id': f'job/{i}', 'action': 'dummy_test_action'}) for i in (1, 2, 3)]
+        self.prefetcher = JobPrefetcher(self.api, self.kz, context_workers=0)
+
+    def test_miss_fetches_next_jobs_in_one_search(self):
+        prefetched = self.prefetcher.get(self.queue, 'job/1')
+        self.assertEqual('job/1', prefetched.cimi_job.id)
+        self.api.search.assert_called_once_with(
+            'job', filter="id=['job/1', 'job/2', 'job/3']", last=3)
+        self.assertEqual('job/2', self.prefetcher.get(self.queue, 'job/2').cimi_job.id)
+        self.assertEqual('job/3', self.prefetcher.get(self.queue, 'job/3').cimi_job.id)
+        self.assertEqual(1, self.api.search.call_count)
+
+    def test_no_search_when_nothing_to_batch_with(self):
+        self.kz.taken = list(self.kz.entries)
+        self.assertIsNone(self.prefetcher.get(self.queue, 'job/1'))
+        self.api.search.assert_not_called()
+
+    def test_stale_documents_are_not_served(self):
+        self.prefetcher.get(self.queue, 'job/1')
+        with patch('nuvla.job_engine.job.executor.prefetch.time.monotonic',
+                   return_value=float('inf')):
+            self.assertIsNone(self.prefetcher.get(self.queue, 'job/2'))
+
+    def test_search_failure_falls_back_to_job_retrieval(self):
+        self.api.search.side_effect = Exception('Simulate exception')
+        self.assertIsNone(self.prefetcher.get(self.queue, 'job/1'))
+
+    def test_peek_keeps_document_cached(self):
+        self.assertEqual('job/1', self.prefetcher.peek(self.queue, 'job/1').cimi_job.id)
+        self.assertEqual('job/1', self.prefetcher.get(self.queue, 'job/1').cimi_job.id)
+        self.assertEqual(1, self.api.search.call_count)
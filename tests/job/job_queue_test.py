@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nuvla.job_engine.job.job_queue import aged_priority, age_queue_entries, entry_priority
+
+
+class JobQueueTestCase(unittest.TestCase):
+
+    def test_entry_priority(self):
+        self.assertEqual(50, entry_priority('entry-050-0000000012'))
+
+    def test_aged_priority(self):
+        self.assertEqual(999, aged_priority(999, 299, 300, 100, 50))
+        self.assertEqual(899, aged_priority(999, 300, 300, 100, 50))
+        self.assertEqual(50, aged_priority(999, 3600, 300, 100, 50))
+        self.assertEqual(20, aged_priority(20, 3600, 300, 100, 50))
+
+    @patch('nuvla.job_engine.job.job_queue.time.time', return_value=1000.0)
+    def test_age_queue_entries(self, _mock_time):
+        kz = MagicMock()
+        kz.get_children.side_effect = lambda path: \
+            ['entry-500-0000000002'] if path.endswith('/taken') \
+            else ['entry-500-0000000001', 'entry-500-0000000002', 'entry-050-0000000003']
+        stat = MagicMock(ctime=0)
+        kz.get.return_value = (b'job/1', stat)
+        kz.transaction.return_value.commit.return_value = [None, None, None, None]
+        self.assertEqual(1, age_queue_entries(kz, '/job', 300, 100, 50))
+        transaction = kz.transaction.return_value
+        transaction.create.assert_any_call('/job/taken/entry-500-0000000001', ephemeral=True)
+        transaction.create.assert_any_call('/job/entries/entry-200-', b'job/1', sequence=True)
+        transaction.delete.assert_any_call('/job/entries/entry-500-0000000001')
+
+    @patch('nuvla.job_engine.job.job_queue.time.time', return_value=1000.0)
+    def test_age_queue_entries_to_declared_priority(self, _mock_time):
+        kz = MagicMock()
+        kz.get_children.side_effect = lambda path: \
+            [] if path.endswith('/taken') else ['entry-999-0000000001', 'entry-999-0000000002']
+        kz.get.side_effect = lambda path: (f'job/{path[-1]}'.encode(), MagicMock(ctime=1000000))
+        kz.transaction.return_value.commit.return_value = [None, None, None, None]
+        declared_priorities = MagicMock(return_value={'job/1': 50, 'job/2': 999})
+        self.assertEqual(1, age_queue_entries(kz, '/job', 300, 100, 50, declared_priorities))
+        declared_priorities.assert_called_once_with(['job/1', 'job/2'])
+        kz.transaction.return_value.create.assert_any_call(
+            '/job/entries/entry-050-', b'job/1', sequence=True)
+
+    def test_age_queue_entries_taken_meanwhile(self):
+        kz = MagicMock()
+        kz.get_children.side_effect = lambda path: \
+            [] if path.endswith('/taken') else ['entry-500-0000000001']
+        kz.get.return_value = (b'job/1', MagicMock(ctime=0))
+        kz.transaction.return_value.commit.return_value = [Exception(), None, None, None]
+        self.assertEqual(0, age_queue_entries(kz, '/job', 300, 100, 50))
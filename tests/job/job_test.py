@@ -60,3 +60,53 @@ class JobTestCase(unittest.TestCase):
         mock_api.get.side_effect=[error, CimiResource({})]
         job.Job('foo', mock_api)
         self.assertEqual(mock_api.get.call_count, 2)
+
+
+class JobWriteBehindTestCase(unittest.TestCase):
+
+    @patch.object(version.Version, 'job_version_check')
+    def setUp(self, _mock_job_version_check):
+        self.api = Mock()
+        self.api.get.return_value = CimiResource({'id': 'job/1', 'state': 'QUEUED'})
+        self.api.edit.side_effect = lambda _id, attributes: CimiResource(attributes)
+        self.job = job.Job('job/1', self.api)
+        self.job.update_interval = 60
+
+    def tearDown(self):
+        self.job._cancel_flush_timer()
+
+    def test_progress_edits_are_coalesced(self):
+        self.job.set_progress(10)
+        self.job.set_status_message('step 1')
+        self.job.update_job(progress=20, status_message='step 2')
+        self.api.edit.assert_not_called()
+        self.assertEqual(20, self.job['progress'])
+        self.job.flush()
+        self.api.edit.assert_called_once_with(
+            'job/1', {'progress': 20, 'status-message': 'step 2'})
+
+    def test_state_change_writes_pending_edits(self):
+        self.job.set_progress(10)
+        self.job.update_job(state='SUCCESS', return_code=0)
+        self.api.edit.assert_called_once_with(
+            'job/1', {'progress': 10, 'state': 'SUCCESS', 'return-code': 0})
+        self.job.flush()
+        self.assertEqual(1, self.api.edit.call_count)
+
+    def test_flush_on_max_pending(self):
+        self.job.update_max_pending = 3
+        for progress in range(3):
+            self.job.set_progress(progress)
+        self.api.edit.assert_called_once_with('job/1', {'progress': 2})
+
+    def test_flush_on_interval(self):
+        self.job.update_interval = 0.05
+        self.job.set_progress(10)
+        flush_timer = self.job._flush_timer
+        flush_timer.join(timeout=5)
+        self.api.edit.assert_called_once_with('job/1', {'progress': 10})
+
+    def test_write_through_when_disabled(self):
+        self.job.update_interval = 0
+        self.job.set_progress(10)
+        self.api.edit.assert_called_once_with('job/1', {'progress': 10})
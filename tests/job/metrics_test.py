@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from nuvla.job_engine.job.metrics import PhaseTimer, PrometheusMetrics, \
+    seconds_since, statsd_name
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_statsd_name(self):
+        self.assertEqual('executor.job.do_work.deployment_start.success',
+                         statsd_name('executor.job.do_work',
+                                     {'action': 'deployment_start', 'exit': 'success'}))
+        self.assertEqual('executor.job.a_b', statsd_name('executor.job', {'action': 'a.b'}))
+
+    def test_prometheus_render(self):
+        metrics = PrometheusMetrics()
+        metrics.observe('executor.job.do_work', 0.5, {'action': 'a', 'exit': 'success'})
+        metrics.observe('executor.job.do_work', 1.5, {'action': 'a', 'exit': 'success'})
+        metrics.inc('executor.job', labels={'action': 'a', 'exit': 'success'})
+        metrics.set('job_distribution.foo', 3)
+        self.assertEqual(
+            '# TYPE nuvla_executor_job_do_work_seconds summary\n'
+            'nuvla_executor_job_do_work_seconds_sum{action="a",exit="success"} 2.0\n'
+            'nuvla_executor_job_do_work_seconds_count{action="a",exit="success"} 2\n'
+            '# TYPE nuvla_executor_job_total counter\n'
+            'nuvla_executor_job_total{action="a",exit="success"} 1\n'
+            '# TYPE nuvla_job_distribution_foo gauge\n'
+            'nuvla_job_distribution_foo 3\n',
+            metrics.render())
+
+    def test_seconds_since(self):
+        created = (datetime.now(timezone.utc) - timedelta(seconds=60)) \
+            .isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+        self.assertAlmostEqual(60, seconds_since(created), delta=5)
+        self.assertIsNone(seconds_since(None))
+        self.assertIsNone(seconds_since('not a date'))
+
+    def test_phase_timer(self):
+        timer = PhaseTimer()
+        with self.assertRaises(ValueError):
+            with timer.phase('do_work'):
+                raise ValueError()
+        timer.add('queue_wait', None)
+        self.assertEqual(['do_work'], list(timer.phases))
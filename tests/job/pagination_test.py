@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import MagicMock
+
+from nuvla.api.models import CimiCollection
+
+from nuvla.job_engine.job.pagination import search_all, search_pages
+
+
+def page(*ids):
+    return CimiCollection({'count': len(ids), 'resources': [{'id': i} for i in ids]})
+
+
+class PaginationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = MagicMock()
+        self.api.search.side_effect = [page('x/1', 'x/2'), page('x/3', 'x/4'), page('x/5')]
+
+    def test_search_all(self):
+        for prefetch in (True, False):
+            self.api.search.side_effect = [page('x/1', 'x/2'), page('x/3', 'x/4'), page('x/5')]
+            self.api.search.reset_mock()
+            self.assertEqual(['x/1', 'x/2', 'x/3', 'x/4', 'x/5'],
+                             [r.id for r in search_all(self.api, 'x', filter='a=1',
+                                                       select='name', page_size=2,
+                                                       prefetch=prefetch)])
+            calls = self.api.search.call_args_list
+            self.assertEqual({'filter': 'a=1', 'orderby': 'id:asc', 'last': 2,
+                              'select': ['id', 'name']}, calls[0].kwargs)
+            self.assertEqual("(a=1 and id>'x/2')", calls[1].kwargs['filter'])
+            self.assertEqual("(a=1 and id>'x/4')", calls[2].kwargs['filter'])
+
+    def test_stop_on_empty_page(self):
+        self.api.search.side_effect = [page('x/1', 'x/2'), page()]
+        self.assertEqual([['x/1', 'x/2']],
+                         [[r.id for r in p] for p in search_pages(self.api, 'x', page_size=2)])
+        self.assertEqual("id>'x/2'", self.api.search.call_args.kwargs['filter'])
+
+    def test_next_page_prefetched(self):
+        pages = search_pages(self.api, 'x', page_size=2)
+        next(pages)
+        pages.close()
+        self.assertLessEqual(self.api.search.call_count, 2)
+
+    def test_prefetch_error_raised_to_consumer(self):
+        self.api.search.side_effect = [page('x/1', 'x/2'), Exception('down')]
+        with self.assertRaises(Exception):
+            list(search_all(self.api, 'x', page_size=2))
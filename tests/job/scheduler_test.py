@@ -0,0 +1,89 @@
+import unittest
+
+from nuvla.job_engine.job.scheduler import Schedule, MODE_FIXED_DELAY, OVERRUN_CATCH_UP
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ScheduleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def schedule(self, **kwargs):
+        kwargs.setdefault('jitter', 0)
+        schedule = Schedule(60, clock=self.clock, **kwargs)
+        schedule.start()
+        return schedule
+
+    def run_cycle(self, schedule, duration):
+        self.clock.now += schedule.wait_time()
+        started = self.clock.now
+        self.clock.now += duration
+        return started, schedule.cycle_done(started)
+
+    def test_fixed_rate_does_not_drift(self):
+        schedule = self.schedule()
+        starts = [self.run_cycle(schedule, 7)[0] for _ in range(3)]
+        self.assertEqual([1000, 1060, 1120], starts)
+        self.assertEqual(53, schedule.wait_time())
+
+    def test_fixed_delay(self):
+        schedule = self.schedule(mode=MODE_FIXED_DELAY)
+        starts = [self.run_cycle(schedule, 7)[0] for _ in range(3)]
+        self.assertEqual([1000, 1067, 1134], starts)
+
+    def test_overrun_skips_missed_cycles(self):
+        schedule = self.schedule()
+        _, (overrun, skipped) = self.run_cycle(schedule, 150)
+        self.assertEqual((90, 2), (overrun, skipped))
+        self.assertEqual(30, schedule.wait_time())
+        self.assertEqual(1180, self.run_cycle(schedule, 1)[0])
+
+    def test_overrun_catches_up_missed_cycles(self):
+        schedule = self.schedule(overrun_policy=OVERRUN_CATCH_UP)
+        _, (overrun, skipped) = self.run_cycle(schedule, 150)
+        self.assertEqual((90, 0), (overrun, skipped))
+        self.assertEqual(0, schedule.wait_time())
+        starts = [self.run_cycle(schedule, 1)[0] for _ in range(3)]
+        self.assertEqual([1150, 1151, 1180], starts)
+
+    def test_catch_up_is_bounded(self):
+        schedule = self.schedule(overrun_policy=OVERRUN_CATCH_UP)
+        _, (_, skipped) = self.run_cycle(schedule, 600)
+        self.assertEqual(6, skipped)
+        self.assertEqual(1420, schedule.next_tick)
+
+    def test_jitter(self):
+        schedule = Schedule(60, jitter=0.5, clock=self.clock, rand=lambda: 0.5)
+        schedule.start()
+        self.assertEqual(15, schedule.wait_time())
+        self.run_cycle(schedule, 5)
+        self.assertEqual(1075, schedule.run_at)
+
+    def test_update_moves_pending_cycle(self):
+        schedule = self.schedule()
+        self.run_cycle(schedule, 7)
+        self.clock.now += 10
+        schedule.update(30, MODE_FIXED_DELAY, schedule.overrun_policy, 0)
+        self.assertEqual(1030, schedule.next_tick)
+        self.assertEqual(13, schedule.wait_time())
+        with self.assertRaises(ValueError):
+            schedule.update(30, 'cron', schedule.overrun_policy, 0)
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            Schedule(60, mode='cron')
+        with self.assertRaises(ValueError):
+            Schedule(60, overrun_policy='queue')
+
+
+if __name__ == '__main__':
+    unittest.main()